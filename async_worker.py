@@ -0,0 +1,734 @@
+"""
+Worker assíncrono: várias páginas simultâneas num único navegador
+
+Alternativa ao DocumentWorker (engine "sync") selecionada com
+`--engine async --pages-per-worker K`. Cada processo abre um Chromium com
+playwright.async_api e processa até K arquivos ao mesmo tempo, cada um no
+seu próprio contexto/página; um arquivo só é reservado quando há uma
+página livre. Como o tempo de cada upload é quase todo espera de rede, um
+processo atende K uploads com um único interpretador Python e um único
+navegador.
+
+Cada fluxo é executado pelo seu runner em ASYNC_RUNNERS: o AsyncFlowRunner
+segue os passos dos fluxos de atestados, exames e prontuários (login,
+navegação, upload, confirmação) usando as listas de seletores declaradas
+como atributos de classe, e o AsyncGedRunner reproduz os passos próprios
+de GedFlow. Um fluxo sem runner registrado é recusado, em vez de rodar
+passos que não são os dele. As decisões (scripts da página, escolha de
+seletores, campos obrigatórios, disputa da confirmação) vêm de
+flows.flow_logic, as mesmas do engine sync; os runners só fazem as
+chamadas assíncronas ao Playwright.
+"""
+
+import os
+import asyncio
+import logging
+import time
+from typing import Dict, Any, Optional, Type, Callable, Awaitable, List, Tuple
+
+from playwright.async_api import async_playwright, Browser, BrowserContext, Page
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+from flows import BaseFlow, AtestadosFlow, ProntuariosFlow, ExamesFlow, GedFlow
+from flows.flow_logic import (FILE_READY_JS, CONFIRMATION_JS, PROBE_JS, FILL_JS, ConfirmationRace,
+                              parse_save_response, probe_result, pick_selector, is_login_url,
+                              is_on_path, has_page_keywords, check_required_fields,
+                              confirmation_arg, wants_response_body, file_result)
+from navigation_cache import get_navigation_cache
+from selector_cache import get_selector_cache, SelectorTimer
+from session import SharedSession, BROWSER_LAUNCH_ARGS, CONTEXT_OPTIONS
+from resource_policy import ResourceInterceptor
+from worker import DocumentWorker
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncFlowRunner:
+    """Executa um fluxo de upload com a API assíncrona do Playwright
+
+    Reproduz os passos de navigate_to_upload_page e upload_file dos fluxos
+    em FLOWS usando os seletores do `flow_class` (atributos de BaseFlow e
+    dos fluxos concretos). Um fluxo com passos próprios precisa de um
+    runner que os reproduza (como o AsyncGedRunner).
+    """
+
+    # Fluxos cujos passos este runner reproduz
+    FLOWS: Tuple[Type[BaseFlow], ...] = (AtestadosFlow, ProntuariosFlow, ExamesFlow)
+
+    def __init__(self, flow_class: Type[BaseFlow], page: Page,
+                 refresh_session: Optional[Callable[[], Awaitable[Optional[Page]]]] = None):
+        self.flow = flow_class
+        self.page = page
+        self.refresh_session = refresh_session
+        self.site_user = os.getenv('SITE_USER')
+        self.site_pass = os.getenv('SITE_PASS')
+        self.base_url = os.getenv('SITE_BASE_URL', 'https://example.com')
+        self.submit_responses: List[Any] = []
+        self.response_listener: Optional[Callable] = None
+        self.confirmation_signal: Optional[str] = None
+        self.server_document_id: Optional[str] = None
+
+    async def probe_selectors(self, selectors) -> Dict[str, Dict[str, Any]]:
+        """Como BaseFlow.probe_selectors: todos os candidatos num único evaluate"""
+        selectors = list(selectors)
+        try:
+            results = await self.page.evaluate(PROBE_JS, selectors)
+        except Exception as e:
+            logger.debug(f"Sonda de seletores falhou, usando locators: {e}")
+            results = [None] * len(selectors)
+
+        probed = {}
+        for selector, result in zip(selectors, results):
+            if result is None:
+                try:
+                    locator = self.page.locator(selector)
+                    count = await locator.count()
+                    result = {'count': count, 'visible': count == 1 and await locator.is_visible()}
+                except Exception:
+                    result = {'count': 0, 'visible': False}
+            else:
+                result = probe_result(result)
+            probed[selector] = result
+        return probed
+
+    async def visible_selectors(self, selectors):
+        """Seletores visíveis, na ordem da lista"""
+        probed = await self.probe_selectors(selectors)
+        return [selector for selector in selectors if probed[selector]['visible']]
+
+    async def first_visible(self, selectors) -> Optional[str]:
+        """Primeiro seletor visível da lista (ou None)"""
+        visible = await self.visible_selectors(selectors)
+        return visible[0] if visible else None
+
+    async def resolve_selector(self, role: str, selectors, require_visible: bool = True) -> Optional[str]:
+        """Como BaseFlow.resolve_selector: vencedor em cache primeiro, rebaixado se falhar"""
+        cache = get_selector_cache()
+        flow_name = self.flow.__name__
+        timer = SelectorTimer(cache, self.base_url, flow_name, role)
+
+        candidates = cache.candidates(self.base_url, flow_name, role, selectors)
+        probed = await self.probe_selectors(candidates)
+        timer.checks += 1
+        return timer.done(pick_selector(candidates, probed, require_visible))
+
+    def is_login_page(self) -> bool:
+        return is_login_url(self.page.url)
+
+    async def login(self) -> bool:
+        """Realiza login no site"""
+        try:
+            logger.info("Iniciando processo de login")
+            await self.page.goto(f"{self.base_url}/login", wait_until="networkidle")
+            await self.page.wait_for_selector(', '.join(self.flow.EMAIL_SELECTORS), timeout=10000)
+
+            email_selector = await self.resolve_selector('email', self.flow.EMAIL_SELECTORS)
+            if not email_selector:
+                raise Exception("Campo de email/username não encontrado")
+            await self.page.fill(email_selector, self.site_user)
+
+            password_selector = await self.resolve_selector('password', self.flow.PASSWORD_SELECTORS)
+            if not password_selector:
+                raise Exception("Campo de senha não encontrado")
+            await self.page.fill(password_selector, self.site_pass)
+
+            login_button = await self.resolve_selector('login_button', self.flow.LOGIN_BUTTON_SELECTORS)
+            if not login_button:
+                raise Exception("Botão de login não encontrado")
+            await self.page.click(login_button)
+
+            await self.page.wait_for_load_state("networkidle")
+
+            if self.page.url.endswith('/login') or 'error' in self.page.url.lower():
+                raise Exception("Falha no login - ainda na página de login")
+
+            logger.info("Login realizado com sucesso")
+            return True
+
+        except Exception as e:
+            logger.error(f"Erro durante login: {e}")
+            return False
+
+    async def ensure_authenticated(self) -> bool:
+        """Faz login apenas se a sessão da página ainda não está autenticada"""
+        if self.page.url in ('', 'about:blank'):
+            return await self.login()
+        if self.is_login_page():
+            return await self.reauthenticate()
+        return True
+
+    async def reauthenticate(self) -> bool:
+        """Renova uma sessão expirada (centralmente, se possível, senão com login próprio)"""
+        if self.refresh_session:
+            page = await self.refresh_session()
+            if page is not None:
+                self.page = page
+                if not self.is_login_page():
+                    logger.info("Sessão renovada pelo controller")
+                    return True
+        return await self.login()
+
+    async def navigate_cached(self) -> bool:
+        """Vai direto ao destino de upload aprendido (mesma regra de BaseFlow.navigate_cached)"""
+        cache = get_navigation_cache()
+        flow_name = self.flow.__name__
+        entry = cache.lookup(flow_name, self.base_url)
+        if not entry:
+            return False
+
+        try:
+            if entry.get('path'):
+                await self.page.goto(f"{self.base_url}{entry['path']}", wait_until="networkidle", timeout=10000)
+                if has_page_keywords(await self.page.content(), self.flow.PAGE_KEYWORDS):
+                    return True
+            elif entry.get('menu'):
+                menu_selector, new_selector = entry['menu']
+                await self.page.goto(self.base_url, wait_until="networkidle", timeout=10000)
+                await self.page.click(menu_selector, timeout=5000)
+                await self.page.wait_for_load_state("networkidle")
+                await self.page.click(new_selector, timeout=5000)
+                await self.page.wait_for_load_state("networkidle")
+                return True
+        except Exception as e:
+            logger.debug(f"Destino em cache falhou: {e}")
+
+        cache.invalidate(flow_name, self.base_url)
+        return False
+
+    async def navigate_to_upload_page(self) -> bool:
+        """Navega para a página de upload (destino em cache, URLs diretas, depois menu)"""
+        if await self.navigate_cached():
+            return True
+
+        cache = get_navigation_cache()
+        for path in self.flow.UPLOAD_PATHS:
+            try:
+                await self.page.goto(f"{self.base_url}{path}", wait_until="networkidle", timeout=10000)
+                if has_page_keywords(await self.page.content(), self.flow.PAGE_KEYWORDS):
+                    logger.info(f"Página de upload encontrada: {self.base_url}{path}")
+                    cache.remember(self.flow.__name__, self.base_url, path=path)
+                    return True
+            except Exception:
+                continue
+
+        logger.info("Tentando navegar via menu")
+        visible_menus = await self.visible_selectors(self.flow.MENU_SELECTORS)
+        for selector in self.flow.MENU_SELECTORS:
+            try:
+                if selector not in visible_menus:
+                    continue
+                await self.page.click(selector)
+                await self.page.wait_for_load_state("networkidle")
+
+                new_button = await self.first_visible(self.flow.NEW_BUTTON_SELECTORS)
+                if new_button:
+                    await self.page.click(new_button)
+                    await self.page.wait_for_load_state("networkidle")
+                    cache.remember(self.flow.__name__, self.base_url, menu=[selector, new_button])
+                    return True
+
+                # A página mudou com o clique: sonda o menu de novo
+                visible_menus = await self.visible_selectors(self.flow.MENU_SELECTORS)
+            except Exception:
+                continue
+
+        logger.error("Não foi possível navegar para página de upload")
+        return False
+
+    async def fill_fields(self, fields: Dict[str, str]) -> Dict[str, str]:
+        """Preenche os campos visíveis de uma vez (mesmo FILL_JS de BaseFlow.fill_fields)"""
+        if not fields:
+            return {}
+
+        try:
+            results = await self.page.evaluate(FILL_JS, fields)
+        except Exception as e:
+            logger.debug(f"Preenchimento em lote falhou, usando a API do Playwright: {e}")
+            results = {selector: 'unsupported' for selector in fields}
+
+        for selector, status in results.items():
+            if status != 'unsupported':
+                continue
+            try:
+                if not await self.page.locator(selector).is_visible():
+                    results[selector] = 'hidden'
+                elif selector.startswith('select'):
+                    await self.page.select_option(selector, fields[selector])
+                    results[selector] = 'filled'
+                else:
+                    await self.page.fill(selector, fields[selector])
+                    results[selector] = 'filled'
+            except Exception:
+                results[selector] = 'error'
+
+        return results
+
+    async def wait_for_file_ready(self) -> bool:
+        """Como BaseFlow.wait_for_file_ready (no máximo FILE_SETTLE_MS)"""
+        try:
+            await self.page.wait_for_function(FILE_READY_JS, arg=self.flow.UPLOAD_BUSY_SELECTORS,
+                                              timeout=self.flow.FILE_SETTLE_MS)
+            return True
+        except PlaywrightTimeoutError:
+            logger.debug(f"Arquivo não confirmado em {self.flow.FILE_SETTLE_MS}ms, seguindo com o envio")
+            return False
+
+    async def arm_confirmation(self):
+        """Como BaseFlow.arm_confirmation: registra as respostas de salvamento
+        antes do clique e marca os alertas já visíveis como antigos"""
+        self.disarm_confirmation()
+        self.submit_responses = []
+        try:
+            await self.page.evaluate(CONFIRMATION_JS, confirmation_arg(self.flow, mark=True))
+        except Exception as e:
+            logger.debug(f"Não foi possível marcar alertas antigos: {e}")
+
+        def on_response(response):
+            if self.flow.is_save_request(response.request.method, response.url):
+                self.submit_responses.append(response)
+
+        self.response_listener = on_response
+        self.page.on('response', on_response)
+
+    def disarm_confirmation(self):
+        if self.response_listener:
+            try:
+                self.page.remove_listener('response', self.response_listener)
+            except Exception:
+                pass
+            self.response_listener = None
+
+    async def upload_file(self, file_path: str) -> bool:
+        """Anexa o arquivo, preenche os campos e envia o formulário"""
+        try:
+            await self.page.wait_for_load_state("networkidle")
+            check_required_fields(self.flow, await self.fill_fields(self.flow.fields_for(file_path)))
+
+            file_input_selector = await self.resolve_selector('file_input', self.flow.FILE_INPUT_SELECTORS,
+                                                              require_visible=False)
+            file_input = self.page.locator(file_input_selector).first if file_input_selector else None
+
+            if file_input:
+                await file_input.set_input_files(file_path)
+            else:
+                button = await self.first_visible(self.flow.UPLOAD_BUTTON_SELECTORS)
+                if button:
+                    async with self.page.expect_file_chooser() as fc_info:
+                        await self.page.click(button)
+                    file_chooser = await fc_info.value
+                    await file_chooser.set_files(file_path)
+
+            await self.wait_for_file_ready()
+            await self.fill_fields(self.flow.ADDITIONAL_FIELDS)
+
+            await self.arm_confirmation()
+            try:
+                submit = await self.resolve_selector('submit', self.flow.SUBMIT_SELECTORS)
+                if submit:
+                    await self.page.click(submit)
+                else:
+                    logger.warning("Botão de envio não encontrado, assumindo upload automático")
+
+                return await self.wait_for_upload_completion(self.flow.UPLOAD_TIMEOUT_MS)
+            finally:
+                self.disarm_confirmation()
+
+        except Exception as e:
+            logger.error(f"Erro durante upload: {e}")
+            return False
+
+    async def read_save_response(self, response) -> Dict[str, Any]:
+        """Como BaseFlow.read_save_response (corpo lido só se for JSON)"""
+        body = None
+        if wants_response_body(response.status, response.headers):
+            try:
+                body = await response.text()
+            except Exception as e:
+                logger.debug(f"Corpo da resposta de salvamento indisponível: {e}")
+        return parse_save_response(response.status, response.headers, body)
+
+    async def wait_for_upload_completion(self, timeout: int = 30000) -> bool:
+        """Aguarda confirmação de upload (mesma ConfirmationRace de BaseFlow)"""
+        arg = confirmation_arg(self.flow)
+        race = ConfirmationRace(timeout, self.flow.RESPONSE_GRACE_MS)
+
+        try:
+            while race.running():
+                for response in race.unread(self.submit_responses):
+                    race.add_response(response.status, response.url, await self.read_save_response(response))
+
+                try:
+                    handle = await self.page.wait_for_function(
+                        CONFIRMATION_JS, arg=arg, timeout=self.flow.CONFIRMATION_POLL_MS
+                    )
+                    found = await handle.json_value()
+                except PlaywrightTimeoutError:
+                    found = None
+
+                if race.add_indicator(found) or race.response_confirmed():
+                    return True
+
+            return race.expire()
+
+        except Exception as e:
+            logger.error(f"Erro ao aguardar confirmação de upload: {e}")
+            return False
+        finally:
+            self.confirmation_signal = race.signal
+            self.server_document_id = race.document_id
+
+    async def process_file(self, file_path: str) -> Dict[str, Any]:
+        """Processa um arquivo completo (login se necessário + navegação + upload)"""
+        try:
+            if not await self.ensure_authenticated():
+                return {'success': False, 'error': 'Falha no login'}
+
+            if not await self.navigate_to_upload_page():
+                if not self.is_login_page():
+                    return {'success': False, 'error': 'Falha ao navegar para página de upload'}
+
+                logger.info("Sessão expirada, refazendo login")
+                if not await self.reauthenticate() or not await self.navigate_to_upload_page():
+                    return {'success': False, 'error': 'Falha ao navegar para página de upload após novo login'}
+
+            confirmed = await self.upload_file(file_path)
+            if confirmed:
+                logger.info(f"Arquivo processado com sucesso: {file_path}")
+            return file_result(confirmed, self.confirmation_signal, self.server_document_id)
+
+        except Exception as e:
+            logger.error(f"Erro ao processar arquivo {file_path}: {e}")
+            return {'success': False, 'error': str(e)}
+
+
+class AsyncGedRunner(AsyncFlowRunner):
+    """Passos próprios de GedFlow: formulário em modal na página /ged"""
+
+    FLOWS = (GedFlow,)
+
+    async def navigate_to_upload_page(self) -> bool:
+        """Como GedFlow.navigate_to_upload_page: abre /ged só se a página ainda não está nele"""
+        try:
+            if is_on_path(self.page.url, self.flow.UPLOAD_PATHS[0]):
+                return True
+
+            logger.info("Navegando para o GED")
+            await self.page.goto(f"{self.base_url}{self.flow.UPLOAD_PATHS[0]}",
+                                 wait_until="domcontentloaded", timeout=30000)
+            await self.page.locator(self.flow.FORM_OPEN_SELECTOR).wait_for(state="visible", timeout=10000)
+            return True
+
+        except Exception as e:
+            logger.error(f"Erro ao navegar para o GED: {e}")
+            return False
+
+    async def upload_file(self, file_path: str) -> bool:
+        """Como GedFlow.upload_file: abre o modal, preenche, anexa o arquivo e salva"""
+        try:
+            fields = self.flow.fields_for(file_path)
+            logger.info(f"Iniciando solicitação no GED: {file_path}")
+
+            await self.page.click(self.flow.FORM_OPEN_SELECTOR)
+            await self.page.locator(self.flow.FORM_READY_SELECTOR).first.wait_for(state="visible", timeout=10000)
+
+            check_required_fields(self.flow, await self.fill_fields(fields))
+
+            file_input_selector = await self.resolve_selector('file_input', self.flow.FILE_INPUT_SELECTORS,
+                                                              require_visible=False)
+            if file_input_selector:
+                await self.page.locator(file_input_selector).first.set_input_files(file_path)
+                await self.wait_for_file_ready()
+            else:
+                logger.warning("Modal do GED sem campo de arquivo, enviando só a solicitação")
+
+            await self.arm_confirmation()
+            try:
+                await self.page.click(self.flow.SUBMIT_SELECTORS[0])
+                confirmed = await self.wait_for_upload_completion(self.flow.UPLOAD_TIMEOUT_MS)
+            finally:
+                self.disarm_confirmation()
+
+            if not confirmed:
+                logger.error(f"Falha na confirmação da solicitação: {file_path}")
+                return False
+
+            await self.dismiss_result()
+            logger.info(f"Solicitação no GED concluída: {file_path}")
+            return True
+
+        except Exception as e:
+            logger.error(f"Erro durante solicitação no GED: {e}")
+            return False
+
+    async def dismiss_result(self):
+        """Como GedFlow.dismiss_result: fecha o alerta e aguarda o modal sair"""
+        dismiss = await self.first_visible(self.flow.DISMISS_SELECTORS)
+        if dismiss:
+            await self.page.click(dismiss)
+
+        try:
+            await self.page.locator(self.flow.SUBMIT_SELECTORS[0]).wait_for(state="hidden", timeout=5000)
+        except PlaywrightTimeoutError:
+            logger.debug("Modal do GED ainda visível após salvar")
+
+
+# Runner de cada fluxo (pela classe exata: uma subclasse com passos próprios
+# precisa registrar o seu)
+ASYNC_RUNNERS: Dict[Type[BaseFlow], Type[AsyncFlowRunner]] = {
+    flow_class: runner_class
+    for runner_class in (AsyncFlowRunner, AsyncGedRunner)
+    for flow_class in runner_class.FLOWS
+}
+
+
+class _PageSlot:
+    """Contexto + página de uma das K sessões simultâneas do worker"""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.context: Optional[BrowserContext] = None
+        self.page: Optional[Page] = None
+        self.session_version = 0
+        # Cada slot roda um fluxo por vez, então tem sua própria política ativa
+        self.resource_interceptor = ResourceInterceptor()
+
+
+class AsyncDocumentWorker(DocumentWorker):
+    """Worker com K páginas simultâneas num único navegador (playwright.async_api)
+
+    Reaproveita do DocumentWorker a conexão com o banco, o heartbeat de
+    leases, o buffer de status e o mapeamento tipo -> fluxo; as chamadas
+    ao banco rodam em threads para não bloquear o event loop.
+    """
+
+    def __init__(self, worker_id: int, shared_session: Optional[SharedSession] = None,
+                 pages_per_worker: int = 4, browser_endpoint: Optional[str] = None):
+        super().__init__(worker_id, shared_session, browser_endpoint)
+        self.pages_per_worker = max(1, pages_per_worker)
+        self.async_browser: Optional[Browser] = None
+
+    def db_connections_needed(self) -> int:
+        """Até K chamadas asyncio.to_thread ao banco ao mesmo tempo, além das threads do DocumentWorker"""
+        return super().db_connections_needed() + self.pages_per_worker
+
+    async def new_slot_context(self, slot: _PageSlot):
+        """(Re)cria o contexto e a página do slot, já autenticados se houver sessão publicada"""
+        await self.close_slot(slot)
+
+        storage_state = None
+        if self.shared_session:
+            slot.session_version, storage_state = self.shared_session.current()
+
+        slot.context = await self.async_browser.new_context(storage_state=storage_state, **CONTEXT_OPTIONS)
+        await slot.resource_interceptor.install_async(slot.context)
+        slot.page = await slot.context.new_page()
+
+        if storage_state is not None:
+            await slot.page.goto(self.base_url, wait_until="domcontentloaded")
+
+    async def close_slot(self, slot: _PageSlot):
+        try:
+            if slot.context:
+                await slot.context.close()
+        except Exception:
+            pass
+        slot.context = None
+        slot.page = None
+
+    def slot_refresher(self, slot: _PageSlot) -> Optional[Callable[[], Awaitable[Optional[Page]]]]:
+        """Callback de renovação centralizada da sessão para o slot"""
+        if not self.shared_session:
+            return None
+
+        async def refresh() -> Optional[Page]:
+            logger.info(f"Worker {self.worker_id}: Sessão expirada (página {slot.index}), pedindo renovação ao controller")
+            renewed = await asyncio.to_thread(
+                self.shared_session.request_refresh,
+                self.worker_id, slot.session_version, self.session_refresh_timeout
+            )
+            if renewed is None:
+                return None
+            await self.new_slot_context(slot)
+            return slot.page
+
+        return refresh
+
+    async def process_with_retry_async(self, slot: _PageSlot, file_record: Dict[str, Any]) -> Dict[str, Any]:
+        """Processa um arquivo num slot, com retry e backoff exponencial"""
+        file_id = file_record['id']
+        file_path = file_record['caminho_arquivo']
+        result = {'success': False, 'error': 'Todas as tentativas falharam'}
+
+        for attempt in range(self.retry_count):
+            logger.info(f"Worker {self.worker_id}: Tentativa {attempt + 1}/{self.retry_count} para arquivo {file_id} (página {slot.index})")
+
+            if not os.path.exists(file_path):
+                result = {'success': False, 'error': f"Arquivo não encontrado: {file_path}"}
+                break
+
+            try:
+                if slot.page is None or slot.page.is_closed():
+                    await self.new_slot_context(slot)
+
+                flow_class = self.get_flow_class(file_record['tipo_arquivo'])
+                runner_class = ASYNC_RUNNERS.get(flow_class)
+                if runner_class is None:
+                    result = {'success': False, 'error': f"Fluxo {flow_class.__name__} sem suporte ao engine async"}
+                    break
+
+                slot.resource_interceptor.use(flow_class)
+                runner = runner_class(flow_class, slot.page, self.slot_refresher(slot))
+                result = await runner.process_file(file_path)
+            except Exception as e:
+                result = {'success': False, 'error': f"Erro inesperado ao processar arquivo: {str(e)}"}
+
+            if result['success']:
+                break
+
+            if attempt < self.retry_count - 1:
+                delay = self.retry_delay_base ** (attempt + 1)
+                logger.warning(f"Worker {self.worker_id}: Falha na tentativa {attempt + 1}, tentando novamente em {delay}s")
+                await asyncio.sleep(delay)
+                # Recria o contexto do slot para a próxima tentativa
+                await self.close_slot(slot)
+
+        if result['success']:
+            await asyncio.to_thread(self.db_manager.update_file_status, file_id, 'enviado',
+                                    documento_id=result.get('document_id'), worker_id=self.worker_id)
+        else:
+            await asyncio.to_thread(self.db_manager.update_file_status, file_id, 'erro',
+                                    result.get('error', 'Erro desconhecido'), worker_id=self.worker_id)
+
+        result['file_id'] = file_id
+        return result
+
+    async def launch_async_browser(self, playwright):
+        """Conecta ao Chromium compartilhado (CDP) ou lança um local"""
+        self.async_browser = None
+        if self.browser_endpoint:
+            try:
+                self.async_browser = await playwright.chromium.connect_over_cdp(self.browser_endpoint)
+            except Exception as e:
+                logger.warning(f"Worker {self.worker_id}: Falha ao conectar ao navegador compartilhado "
+                               f"({self.browser_endpoint}), iniciando um local: {e}")
+        if self.async_browser is None:
+            self.async_browser = await playwright.chromium.launch(headless=True, args=BROWSER_LAUNCH_ARGS)
+        self.reset_browser_usage()
+
+    async def close_async_browser(self, slots: List[_PageSlot]):
+        """Fecha os contextos dos slots e o navegador (os slots são recriados sob demanda)"""
+        for slot in slots:
+            await self.close_slot(slot)
+        try:
+            await self.async_browser.close()
+        except Exception:
+            pass
+        self.async_browser = None
+
+    async def run_async(self, stats: Dict[str, Any]):
+        """Distribui os arquivos reservados entre as K páginas
+
+        A fila de páginas livres limita a concorrência: um arquivo só é
+        reservado depois que uma página fica livre para ele. Quando a
+        política de reciclagem (recycle_reason) manda, o worker para de
+        reservar, espera os envios em andamento e troca o navegador.
+        """
+        free_slots: asyncio.Queue = asyncio.Queue()
+        slots = [_PageSlot(index) for index in range(self.pages_per_worker)]
+        for slot in slots:
+            free_slots.put_nowait(slot)
+        recycle_pending: Optional[str] = None
+
+        async def handle(slot: _PageSlot, file_record: Dict[str, Any]):
+            nonlocal recycle_pending
+            try:
+                result = await self.process_with_retry_async(slot, file_record)
+            finally:
+                free_slots.put_nowait(slot)
+                self.heartbeat.release(file_record['id'])
+
+            self.record_result(stats, result['file_id'], result)
+            reason = self.record_browser_usage(stats)
+            recycle_pending = recycle_pending or reason
+
+        async with async_playwright() as playwright:
+            await self.launch_async_browser(playwright)
+            tasks = set()
+
+            try:
+                while True:
+                    # Só reserva um arquivo quando há página livre para ele
+                    slot = await free_slots.get()
+
+                    if recycle_pending:
+                        free_slots.put_nowait(slot)
+                        if tasks:
+                            await asyncio.gather(*tasks)
+                        logger.info(f"Worker {self.worker_id}: Reciclando navegador ({recycle_pending})")
+                        await self.close_async_browser(slots)
+                        await self.launch_async_browser(playwright)
+                        stats['recycles'] += 1
+                        recycle_pending = None
+                        continue
+
+                    claimed_files = await asyncio.to_thread(
+                        self.db_manager.claim_jobs, self.worker_id, 1, self.lease_seconds
+                    )
+
+                    if not claimed_files:
+                        free_slots.put_nowait(slot)
+                        logger.info(f"Worker {self.worker_id}: Nenhum arquivo pendente, finalizando")
+                        break
+
+                    self.heartbeat.track([f['id'] for f in claimed_files])
+                    task = asyncio.create_task(handle(slot, claimed_files[0]))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+
+                if tasks:
+                    await asyncio.gather(*tasks)
+            finally:
+                if self.async_browser:
+                    await self.close_async_browser(slots)
+
+                for slot in slots:
+                    stats['blocked_requests'] = stats.get('blocked_requests', 0) + slot.resource_interceptor.blocked
+                    stats['bytes_saved_estimate'] = (stats.get('bytes_saved_estimate', 0)
+                                                     + slot.resource_interceptor.bytes_saved_estimate)
+
+    def run(self) -> Dict[str, Any]:
+        """Loop principal do worker assíncrono"""
+        stats = {
+            'processed': 0,
+            'success': 0,
+            'errors': 0,
+            'recycles': 0,
+            'rss_mb': 0.0,
+            'peak_rss_mb': 0.0,
+            'worker_id': self.worker_id,
+            'engine': 'async',
+            'pages': self.pages_per_worker,
+            'confirmations': {}
+        }
+        started = time.time()
+
+        try:
+            if not self.setup():
+                return stats
+
+            logger.info(f"Worker {self.worker_id}: Iniciando processamento assíncrono com {self.pages_per_worker} páginas")
+            asyncio.run(self.run_async(stats))
+
+        except KeyboardInterrupt:
+            logger.info(f"Worker {self.worker_id}: Interrompido pelo usuário")
+        except Exception as e:
+            logger.error(f"Worker {self.worker_id}: Erro crítico: {e}")
+        finally:
+            self.cleanup()
+
+        stats.update(get_navigation_cache().stats())
+        stats['selector_latency'] = get_selector_cache().stats()
+        logger.info(f"Worker {self.worker_id}: Finalizado em {time.time() - started:.1f}s - "
+                    f"Processados: {stats['processed']}, Sucessos: {stats['success']}, Erros: {stats['errors']}, "
+                    f"Reciclagens: {stats['recycles']}, Pico RSS: {stats['peak_rss_mb']} MB")
+        return stats
@@ -0,0 +1,133 @@
+"""
+Chromium compartilhado entre os workers
+
+O Playwright para Python não tem `launch_server` (só existe no Node), então
+o controller inicia o Chromium instalado pelo Playwright como um processo
+comum com `--remote-debugging-port=0` e repassa o endpoint CDP aos workers.
+Cada worker se conecta com `chromium.connect_over_cdp(endpoint)` e cria só
+um contexto leve, sem lançar um navegador próprio: o worker sobe em
+milissegundos e toda a memória de navegador fica em N processos
+controlados num único lugar.
+"""
+
+import re
+import shutil
+import logging
+import tempfile
+import threading
+import subprocess
+from typing import List, Optional
+
+from playwright.sync_api import sync_playwright
+
+from session import BROWSER_LAUNCH_ARGS
+
+logger = logging.getLogger(__name__)
+
+DEVTOOLS_PATTERN = re.compile(r'DevTools listening on (ws://\S+)')
+
+
+def chromium_executable() -> str:
+    """Caminho do Chromium instalado pelo Playwright (`playwright install chromium`)"""
+    playwright = sync_playwright().start()
+    try:
+        return playwright.chromium.executable_path
+    finally:
+        playwright.stop()
+
+
+class BrowserServer:
+    """Um processo Chromium headless exposto via CDP na interface local"""
+
+    def __init__(self, executable: str, extra_args: Optional[List[str]] = None):
+        self.executable = executable
+        self.extra_args = extra_args or []
+        self.process: Optional[subprocess.Popen] = None
+        self.user_data_dir: Optional[str] = None
+        self.endpoint: Optional[str] = None
+
+    def start(self, timeout: float = 30.0) -> str:
+        """Inicia o Chromium e retorna o endpoint websocket do CDP"""
+        self.user_data_dir = tempfile.mkdtemp(prefix='bot-ged-chromium-')
+        self.process = subprocess.Popen(
+            [
+                self.executable,
+                '--headless=new',
+                '--remote-debugging-address=127.0.0.1',
+                '--remote-debugging-port=0',
+                f'--user-data-dir={self.user_data_dir}',
+                '--no-first-run',
+                '--no-default-browser-check',
+                *BROWSER_LAUNCH_ARGS,
+                *self.extra_args,
+                'about:blank'
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True
+        )
+
+        ready = threading.Event()
+
+        # Lê o stderr até o fim (o pipe cheio travaria o Chromium)
+        def drain():
+            for line in self.process.stderr:
+                match = DEVTOOLS_PATTERN.search(line)
+                if match and not ready.is_set():
+                    self.endpoint = match.group(1)
+                    ready.set()
+                else:
+                    logger.debug(f"Chromium: {line.rstrip()}")
+            ready.set()
+
+        threading.Thread(target=drain, name='chromium-stderr', daemon=True).start()
+
+        if not ready.wait(timeout) or not self.endpoint:
+            self.stop()
+            raise RuntimeError("Chromium compartilhado não publicou o endpoint CDP")
+
+        logger.info(f"Chromium compartilhado iniciado (pid {self.process.pid}): {self.endpoint}")
+        return self.endpoint
+
+    def stop(self):
+        """Encerra o processo e remove o perfil temporário"""
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+
+        if self.user_data_dir:
+            shutil.rmtree(self.user_data_dir, ignore_errors=True)
+
+        self.process = None
+        self.user_data_dir = None
+
+
+class BrowserServerPool:
+    """N navegadores compartilhados; o worker i usa o endpoint i % N"""
+
+    def __init__(self, size: int = 1, extra_args: Optional[List[str]] = None):
+        self.size = max(1, size)
+        self.extra_args = extra_args or []
+        self.servers: List[BrowserServer] = []
+
+    def start(self) -> List[str]:
+        """Inicia os navegadores e retorna seus endpoints"""
+        executable = chromium_executable()
+        try:
+            for _ in range(self.size):
+                server = BrowserServer(executable, self.extra_args)
+                server.start()
+                self.servers.append(server)
+        except Exception:
+            self.stop()
+            raise
+        return [server.endpoint for server in self.servers]
+
+    def stop(self):
+        for server in self.servers:
+            server.stop()
+        self.servers = []
@@ -3,18 +3,23 @@ Controller para coordenação de processos paralelos
 """
 
 import os
+import csv
+import stat
 import logging
 import time
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterator
 from pathlib import Path
 from multiprocessing import Pool, Manager, Process, Queue
 import multiprocessing as mp
-from concurrent.futures import ProcessPoolExecutor, as_completed
-import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
+from openpyxl import Workbook
 
-from db import DatabaseManager
+from db import get_db_manager
+from utils import FileUtils
 from worker import worker_main
+from session import SharedSession
+from browser_server import BrowserServerPool
 
 logger = logging.getLogger(__name__)
 
@@ -22,10 +27,16 @@ logger = logging.getLogger(__name__)
 class UploadController:
     """Controller principal para coordenar uploads paralelos"""
 
-    def __init__(self, max_workers: int = 5):
+    def __init__(self, max_workers: int = 5, worker_options: Optional[Dict[str, Any]] = None):
         self.max_workers = max_workers
-        self.db_manager = DatabaseManager()
+        self.worker_options = worker_options or {}
+        self.db_manager = get_db_manager()
         self.documents_base_path = os.getenv('DOCUMENTS_BASE_PATH', './documentos')
+        self.scan_batch_size = int(os.getenv('SCAN_BATCH_SIZE', '1000'))
+        self.lease_max_attempts = int(os.getenv('LEASE_MAX_ATTEMPTS', '3'))
+        self.reap_interval = int(os.getenv('LEASE_REAP_INTERVAL', '60'))
+        self.report_chunk_size = int(os.getenv('REPORT_CHUNK_SIZE', '1000'))
+        self.shared_session_enabled = os.getenv('SHARED_SESSION', 'true').lower() in ('1', 'true', 'yes')
 
     def setup(self) -> bool:
         """Inicializa o controller"""
@@ -59,61 +70,81 @@ class UploadController:
             logger.info("Controller: Iniciando scan de documentos")
 
             if force_rescan:
-                # Limpa registros pendentes
-                self.db_manager.clear_pending_files()
-                logger.info("Controller: Registros pendentes limpos")
+                logger.info("Controller: Rescan forçado - fingerprints ignorados, arquivos com erro voltam à fila")
 
-            # Extensões de arquivo aceitas
-            valid_extensions = {'.pdf', '.jpg', '.jpeg', '.png', '.tiff', '.tif', '.dcm'}
-
-            total_files = 0
             base_path = Path(self.documents_base_path)
 
             if not base_path.exists():
                 logger.warning(f"Controller: Diretório base não encontrado: {self.documents_base_path}")
                 return 0
 
-            # Escaneia cada subdiretório (cada um representa um tipo de documento)
-            for tipo_dir in base_path.iterdir():
-                if not tipo_dir.is_dir():
-                    continue
+            # Os arquivos são comparados com os fingerprints do último scan e
+            # enviados ao banco em lotes conforme são encontrados
+            total_files = self.db_manager.sync_file_fingerprints(
+                self.iter_document_files(base_path),
+                batch_size=self.scan_batch_size,
+                force=force_rescan
+            )
+
+            logger.info(f"Controller: Scan concluído - {total_files} arquivos novos ou alterados registrados")
+            return total_files
+
+        except Exception as e:
+            logger.error(f"Controller: Erro no scan de documentos: {e}")
+            return 0
 
-                tipo_arquivo = tipo_dir.name.lower()
-                logger.info(f"Controller: Escaneando tipo '{tipo_arquivo}'")
+    def iter_document_files(self, base_path: Path) -> Iterator[Dict[str, Any]]:
+        """Percorre os diretórios de documentos gerando o fingerprint de cada arquivo"""
+        # Extensões de arquivo aceitas
+        valid_extensions = {'.pdf', '.jpg', '.jpeg', '.png', '.tiff', '.tif', '.dcm', '.doc', '.docx'}
 
-                files_in_type = 0
+        # Escaneia cada subdiretório (cada um representa um tipo de documento)
+        for tipo_dir in base_path.iterdir():
+            if not tipo_dir.is_dir():
+                continue
 
-                # Escaneia todos os arquivos no diretório do tipo
-                for file_path in tipo_dir.rglob('*'):
-                    if not file_path.is_file():
-                        continue
+            tipo_arquivo = tipo_dir.name.lower()
+            logger.info(f"Controller: Escaneando tipo '{tipo_arquivo}'")
 
-                    # Verifica extensão
-                    if file_path.suffix.lower() not in valid_extensions:
+            files_in_type = 0
+
+            # Escaneia todos os arquivos no diretório do tipo
+            for file_path in tipo_dir.rglob('*'):
+                # Verifica extensão antes de qualquer stat
+                if file_path.suffix.lower() not in valid_extensions:
+                    if file_path.is_file():
                         logger.debug(f"Controller: Arquivo ignorado (extensão inválida): {file_path}")
-                        continue
+                    continue
 
-                    # Registra no banco
-                    file_id = self.db_manager.insert_file_record(
-                        str(file_path.absolute()),
-                        tipo_arquivo
-                    )
+                try:
+                    file_stat = file_path.stat()
+                except OSError as e:
+                    logger.warning(f"Controller: Falha ao ler metadados de {file_path}: {e}")
+                    continue
 
-                    if file_id:
-                        files_in_type += 1
-                        total_files += 1
-                        logger.debug(f"Controller: Arquivo registrado: {file_path}")
-                    else:
-                        logger.warning(f"Controller: Falha ao registrar: {file_path}")
+                if not stat.S_ISREG(file_stat.st_mode):
+                    continue
 
-                logger.info(f"Controller: Tipo '{tipo_arquivo}' - {files_in_type} arquivos encontrados")
+                caminho_arquivo = str(file_path.absolute())
+                files_in_type += 1
+                yield {
+                    'caminho_arquivo': caminho_arquivo,
+                    'tipo_arquivo': tipo_arquivo,
+                    'path_hash': FileUtils.get_path_hash(caminho_arquivo),
+                    'size': file_stat.st_size,
+                    'mtime_ns': file_stat.st_mtime_ns,
+                    'inode': file_stat.st_ino
+                }
 
-            logger.info(f"Controller: Scan concluído - {total_files} arquivos registrados")
-            return total_files
+            logger.info(f"Controller: Tipo '{tipo_arquivo}' - {files_in_type} arquivos encontrados")
 
+    def reap_stale_leases(self) -> Dict[str, int]:
+        """Devolve à fila arquivos presos em 'processando' por workers que morreram"""
+        try:
+            return self.db_manager.reap_expired_leases(self.lease_max_attempts)
         except Exception as e:
-            logger.error(f"Controller: Erro no scan de documentos: {e}")
-            return 0
+            logger.error(f"Controller: Erro ao recuperar leases expirados: {e}")
+            return {'requeued': 0, 'failed': 0}
 
     def get_processing_stats(self) -> Dict[str, int]:
         """Obtém estatísticas de processamento"""
@@ -121,7 +152,7 @@ class UploadController:
             return self.db_manager.get_stats()
         except Exception as e:
             logger.error(f"Controller: Erro ao obter estatísticas: {e}")
-            return {'pendente': 0, 'enviado': 0, 'erro': 0}
+            return {'pendente': 0, 'processando': 0, 'enviado': 0, 'erro': 0, 'duplicado': 0}
 
     def start_parallel_processing(self) -> Dict[str, Any]:
         """Inicia processamento paralelo com múltiplos workers"""
@@ -140,37 +171,29 @@ class UploadController:
 
             start_time = time.time()
 
-            # Usa ProcessPoolExecutor para melhor controle
-            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
-                # Submete jobs para os workers
-                futures = []
-                for worker_id in range(self.max_workers):
-                    future = executor.submit(worker_main, worker_id)
-                    futures.append(future)
-
-                # Monitora progresso
-                completed_workers = 0
-                worker_results = []
-
-                for future in as_completed(futures):
-                    try:
-                        result = future.result()
-                        worker_results.append(result)
-                        completed_workers += 1
+            # spawn: o controller usa Playwright (login centralizado) e um
+            # processo com o driver rodando não pode ser copiado por fork
+            mp_context = mp.get_context('spawn')
 
-                        logger.info(f"Controller: Worker {result['worker_id']} finalizado "
-                                  f"({completed_workers}/{self.max_workers}) - "
-                                  f"Processados: {result['processed']}, "
-                                  f"Sucessos: {result['success']}, "
-                                  f"Erros: {result['errors']}")
+            with mp_context.Manager() as manager:
+                # Login único exportado como storage_state para todos os workers
+                shared_session = None
+                if self.shared_session_enabled:
+                    shared_session = SharedSession(manager)
+                    shared_session.refresh()
 
-                    except Exception as e:
-                        logger.error(f"Controller: Erro em worker: {e}")
+                worker_options, browser_pool = self._start_shared_browsers()
+                try:
+                    worker_results = self._run_workers(mp_context, shared_session, worker_options)
+                finally:
+                    if browser_pool:
+                        browser_pool.stop()
 
             # Calcula estatísticas finais
             total_processed = sum(r['processed'] for r in worker_results)
             total_success = sum(r['success'] for r in worker_results)
             total_errors = sum(r['errors'] for r in worker_results)
+            total_recycles = sum(r.get('recycles', 0) for r in worker_results)
 
             end_time = time.time()
             processing_time = end_time - start_time
@@ -182,6 +205,7 @@ class UploadController:
                 'total_processed': total_processed,
                 'total_success': total_success,
                 'total_errors': total_errors,
+                'total_recycles': total_recycles,
                 'processing_time_seconds': round(processing_time, 2),
                 'workers_used': self.max_workers,
                 'final_stats': final_stats,
@@ -204,56 +228,135 @@ class UploadController:
                 'stats': self.get_processing_stats()
             }
 
+    def _start_shared_browsers(self):
+        """Inicia os Chromium compartilhados pedidos em worker_options['shared_browsers']
+
+        Retorna (opções dos workers com os endpoints, pool) ou, se o modo
+        está desligado ou falhou, as opções originais e None (cada worker
+        lança o próprio navegador).
+        """
+        count = int(self.worker_options.get('shared_browsers') or 0)
+        if count <= 0:
+            return self.worker_options, None
+
+        extra_args = []
+        renderer_limit = int(os.getenv('SHARED_BROWSER_RENDERER_LIMIT', '0'))
+        if renderer_limit > 0:
+            extra_args.append(f'--renderer-process-limit={renderer_limit}')
+
+        pool = BrowserServerPool(count, extra_args)
+        try:
+            endpoints = pool.start()
+        except Exception as e:
+            logger.warning(f"Controller: Falha ao iniciar Chromium compartilhado, workers usarão navegador próprio: {e}")
+            return self.worker_options, None
+
+        logger.info(f"Controller: {count} Chromium compartilhado(s) para {self.max_workers} workers")
+        return dict(self.worker_options, browser_endpoints=endpoints), pool
+
+    def _run_workers(self, mp_context, shared_session: Optional[SharedSession],
+                     worker_options: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Executa os workers e atende, enquanto eles rodam, os pedidos de
+        renovação de sessão e a recuperação periódica de leases expirados"""
+        # Com sessão compartilhada o loop acorda a cada segundo para atender
+        # os workers; a recuperação de leases continua a cada reap_interval
+        poll_interval = 1 if shared_session else self.reap_interval
+        last_reap = time.monotonic()
+
+        with ProcessPoolExecutor(max_workers=self.max_workers, mp_context=mp_context) as executor:
+            # Submete jobs para os workers
+            futures = []
+            for worker_id in range(self.max_workers):
+                future = executor.submit(worker_main, worker_id, shared_session, worker_options)
+                futures.append(future)
+
+            completed_workers = 0
+            worker_results = []
+            pending_futures = set(futures)
+
+            while pending_futures:
+                done, pending_futures = wait(
+                    pending_futures,
+                    timeout=poll_interval,
+                    return_when=FIRST_COMPLETED
+                )
+
+                for future in done:
+                    try:
+                        result = future.result()
+                        worker_results.append(result)
+                        completed_workers += 1
+
+                        logger.info(f"Controller: Worker {result['worker_id']} finalizado "
+                                  f"({completed_workers}/{self.max_workers}) - "
+                                  f"Processados: {result['processed']}, "
+                                  f"Sucessos: {result['success']}, "
+                                  f"Erros: {result['errors']}")
+
+                    except Exception as e:
+                        logger.error(f"Controller: Erro em worker: {e}")
+
+                if shared_session:
+                    shared_session.service_requests()
+
+                if pending_futures and time.monotonic() - last_reap >= self.reap_interval:
+                    self.reap_stale_leases()
+                    last_reap = time.monotonic()
+
+        return worker_results
+
+    # Colunas do relatório: (cabeçalho, função que extrai o valor do registro)
+    REPORT_COLUMNS = [
+        ('Nome do Arquivo', lambda r: os.path.basename(r['caminho_arquivo']) if r['caminho_arquivo'] else ''),
+        ('Caminho Completo', lambda r: r['caminho_arquivo']),
+        ('Tipo de Documento', lambda r: r['tipo_arquivo']),
+        ('Status', lambda r: r['status']),
+        ('Data/Hora Envio', lambda r: r['data_envio'].strftime('%Y-%m-%d %H:%M:%S') if r['data_envio'] else ''),
+        ('Mensagem de Erro', lambda r: r['mensagem_erro']),
+        ('ID do Documento', lambda r: r['documento_id'] or ''),
+    ]
+
+    def iter_report_rows(self) -> Iterator[List[Any]]:
+        """Linhas do relatório, lidas do banco em blocos (memória constante)"""
+        for record in self.db_manager.iter_all_records(self.report_chunk_size):
+            yield [extract(record) for _, extract in self.REPORT_COLUMNS]
+
     def generate_report(self, output_file: str = None) -> str:
-        """Gera relatório CSV/Excel dos uploads"""
+        """Gera relatório CSV/Excel dos uploads
+
+        As linhas são escritas conforme chegam do banco (csv.writer ou
+        workbook write-only do openpyxl), sem carregar a tabela em memória.
+        """
         try:
             if not output_file:
                 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
                 output_file = f"relatorio_uploads_{timestamp}.csv"
 
-            logger.info(f"Controller: Gerando relatório: {output_file}")
-
-            # Busca todos os registros
-            records = self.db_manager.get_all_records()
-
-            if not records:
+            stats = self.get_processing_stats()
+            if sum(stats.values()) == 0:
                 logger.warning("Controller: Nenhum registro encontrado para relatório")
                 return None
 
-            # Converte para DataFrame
-            df = pd.DataFrame(records)
+            logger.info(f"Controller: Gerando relatório: {output_file}")
 
-            # Adiciona colunas calculadas
-            df['nome_arquivo'] = df['caminho_arquivo'].apply(lambda x: os.path.basename(x) if x else '')
-            df['data_envio_formatada'] = df['data_envio'].apply(
-                lambda x: x.strftime('%Y-%m-%d %H:%M:%S') if x else ''
-            )
+            headers = [header for header, _ in self.REPORT_COLUMNS]
+            total_records = 0
 
-            # Reordena colunas
-            column_order = [
-                'nome_arquivo',
-                'caminho_arquivo',
-                'tipo_arquivo',
-                'status',
-                'data_envio_formatada',
-                'mensagem_erro'
-            ]
-
-            df_report = df[column_order].copy()
-            df_report.columns = [
-                'Nome do Arquivo',
-                'Caminho Completo',
-                'Tipo de Documento',
-                'Status',
-                'Data/Hora Envio',
-                'Mensagem de Erro'
-            ]
-
-            # Salva relatório
             if output_file.endswith('.xlsx'):
-                df_report.to_excel(output_file, index=False, engine='openpyxl')
+                workbook = Workbook(write_only=True)
+                sheet = workbook.create_sheet()
+                sheet.append(headers)
+                for row in self.iter_report_rows():
+                    sheet.append(row)
+                    total_records += 1
+                workbook.save(output_file)
             else:
-                df_report.to_csv(output_file, index=False, encoding='utf-8-sig')
+                with open(output_file, 'w', newline='', encoding='utf-8-sig') as f:
+                    writer = csv.writer(f)
+                    writer.writerow(headers)
+                    for row in self.iter_report_rows():
+                        writer.writerow(row)
+                        total_records += 1
 
             # Adiciona estatísticas no final (apenas para CSV)
             if output_file.endswith('.csv'):
@@ -264,10 +367,11 @@ class UploadController:
                     f.write(f'Enviados com Sucesso,{stats.get("enviado", 0)}\n')
                     f.write(f'Arquivos com Erro,{stats.get("erro", 0)}\n')
                     f.write(f'Pendentes,{stats.get("pendente", 0)}\n')
+                    f.write(f'Duplicados (conteúdo já enviado por outro arquivo),{stats.get("duplicado", 0)}\n')
                     f.write(f'Relatório Gerado em,{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}\n')
 
             logger.info(f"Controller: Relatório gerado com sucesso: {output_file}")
-            logger.info(f"Controller: Total de registros: {len(records)}")
+            logger.info(f"Controller: Total de registros: {total_records}")
 
             return output_file
 
@@ -289,16 +393,23 @@ class UploadController:
                     break
 
                 pending = stats.get('pendente', 0)
+                in_progress = stats.get('processando', 0)
                 success = stats.get('enviado', 0)
                 errors = stats.get('erro', 0)
+                duplicates = stats.get('duplicado', 0)
+                done = success + errors + duplicates
 
-                progress_pct = ((success + errors) / total * 100) if total > 0 else 0
+                progress_pct = (done / total * 100) if total > 0 else 0
 
                 logger.info(f"Controller: Progresso - {progress_pct:.1f}% "
-                           f"({success + errors}/{total}) - "
-                           f"Sucessos: {success}, Erros: {errors}, Pendentes: {pending}")
+                           f"({done}/{total}) - "
+                           f"Sucessos: {success}, Erros: {errors}, Pendentes: {pending}, "
+                           f"Em processamento: {in_progress}, Duplicados: {duplicates}")
+
+                if in_progress:
+                    self.reap_stale_leases()
 
-                if pending == 0:
+                if pending == 0 and in_progress == 0:
                     logger.info("Controller: Todos os arquivos foram processados")
                     break
 
@@ -319,22 +430,29 @@ class UploadController:
             logger.warning(f"Controller: Erro no cleanup: {e}")
 
 
-def run_controller(max_workers: int = 5, documents_path: str = None, force_rescan: bool = False) -> Dict[str, Any]:
-    """Função principal para executar o controller"""
+def run_controller(max_workers: int = 5, documents_path: str = None, force_rescan: bool = False,
+                   worker_options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Função principal para executar o controller
+
+    `worker_options` é repassado a cada worker (ver worker_main).
+    """
     # Define o caminho dos documentos se fornecido
     if documents_path:
         os.environ['DOCUMENTS_BASE_PATH'] = documents_path
 
-    controller = UploadController(max_workers=max_workers)
+    controller = UploadController(max_workers=max_workers, worker_options=worker_options)
 
     try:
         # Setup inicial
         if not controller.setup():
             return {'success': False, 'error': 'Falha no setup do controller'}
 
+        # Devolve à fila arquivos abandonados por execuções anteriores
+        controller.reap_stale_leases()
+
         # Escaneia documentos
         files_found = controller.scan_documents(force_rescan=force_rescan)
-        if files_found == 0:
+        if files_found == 0 and controller.get_processing_stats()['pendente'] == 0:
             return {
                 'success': True,
                 'message': 'Nenhum documento encontrado para processar',
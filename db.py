@@ -1,94 +1,591 @@
 """
 Módulo para gerenciamento de conexão e operações com MariaDB
+
+O backend SQLite (DB_BACKEND=sqlite) fica em db_sqlite e reaproveita esta
+classe; use get_db_manager() para obter o backend configurado.
 """
 
 import os
+import time
+import queue
+import sqlite3
 import logging
-from typing import List, Optional, Dict, Any
+import threading
+from contextlib import contextmanager
+from typing import List, Optional, Dict, Any, Iterable, Iterator, Tuple
+from itertools import islice
 from datetime import datetime
 import mysql.connector
-from mysql.connector import Error
+from mysql.connector import Error, InterfaceError, OperationalError
+from mysql.connector.errors import PoolError
 from dotenv import load_dotenv
 
+from migrations import MIGRATIONS, SCHEMA_VERSION_TABLE
+from utils import FileUtils
+
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# Erros de banco tratados pelos métodos do DatabaseManager (MariaDB e SQLite)
+DB_ERRORS = (Error, sqlite3.Error)
+
+
+# Insere um arquivo pela chave única path_hash; se o caminho já existe, só
+# volta para a fila quando o registro anterior terminou em erro ou era
+# duplicata (a deduplicação por conteúdo é refeita logo em seguida)
+UPSERT_UPLOAD_QUERY = """
+INSERT INTO uploads (caminho_arquivo, tipo_arquivo, path_hash, content_hash, status)
+VALUES (%s, %s, %s, %s, 'pendente')
+ON DUPLICATE KEY UPDATE
+    id = LAST_INSERT_ID(id),
+    tipo_arquivo = VALUES(tipo_arquivo),
+    content_hash = IF(status = 'enviado', content_hash, COALESCE(VALUES(content_hash), content_hash)),
+    attempts = IF(status IN ('erro', 'duplicado'), 0, attempts),
+    mensagem_erro = IF(status IN ('erro', 'duplicado'), NULL, mensagem_erro),
+    duplicado_de = IF(status IN ('erro', 'duplicado'), NULL, duplicado_de),
+    status = IF(status IN ('erro', 'duplicado'), 'pendente', status)
+"""
+
+# Relatório: arquivos duplicados aparecem com o resultado do job que enviou
+# o mesmo conteúdo
+REPORT_QUERY = """
+SELECT
+    u.caminho_arquivo,
+    u.tipo_arquivo,
+    COALESCE(c.status, u.status) AS status,
+    COALESCE(c.data_envio, u.data_envio) AS data_envio,
+    CASE
+        WHEN c.id IS NULL THEN u.mensagem_erro
+        ELSE CONCAT('Conteúdo idêntico a ', c.caminho_arquivo, COALESCE(CONCAT(' - ', c.mensagem_erro), ''))
+    END AS mensagem_erro,
+    COALESCE(c.documento_id, u.documento_id) AS documento_id
+FROM uploads u
+LEFT JOIN uploads c ON c.id = u.duplicado_de
+ORDER BY u.created_at ASC
+"""
+
+UPSERT_FINGERPRINT_QUERY = """
+INSERT INTO arquivos_fingerprint (path_hash, size, mtime_ns, inode)
+VALUES (%s, %s, %s, %s)
+ON DUPLICATE KEY UPDATE
+    size = VALUES(size),
+    mtime_ns = VALUES(mtime_ns),
+    inode = VALUES(inode)
+"""
+
+
+class ConnectionPool:
+    """Pool de conexões MariaDB com health check e reconexão com backoff
+
+    Conexões ociosas ficam numa pilha (a mais recente é reutilizada primeiro)
+    junto com o instante do último uso. Só recebem ping quando ficaram
+    ociosas por mais de `ping_interval` segundos, então o custo de health
+    check por operação é limitado. Conexões que falharam durante o uso são
+    descartadas e substituídas por uma nova na próxima retirada.
+    """
+
+    def __init__(self, config: Dict[str, Any], size: int = 5, ping_interval: float = 30.0,
+                 connect_retries: int = 5, checkout_timeout: float = 30.0):
+        self.config = config
+        self.size = size
+        self.ping_interval = ping_interval
+        self.connect_retries = connect_retries
+        self.checkout_timeout = checkout_timeout
+        self._idle: "queue.LifoQueue[Tuple[Any, float]]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _connect(self):
+        """Abre uma nova conexão, tentando novamente com backoff exponencial"""
+        delay = 0.5
+        for attempt in range(1, self.connect_retries + 1):
+            try:
+                return mysql.connector.connect(**self.config)
+            except DB_ERRORS as e:
+                if attempt == self.connect_retries:
+                    raise
+                logger.warning(f"Falha ao conectar com MariaDB (tentativa {attempt}/{self.connect_retries}): {e}. "
+                               f"Nova tentativa em {delay:.1f}s")
+                time.sleep(delay)
+                delay = min(delay * 2, 10.0)
+
+    def acquire(self):
+        """Retira uma conexão saudável do pool (ou abre uma nova)"""
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            raise PoolError("Pool de conexões esgotado")
+
+        try:
+            try:
+                connection, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                return self._connect()
+
+            if time.monotonic() - last_used > self.ping_interval:
+                try:
+                    connection.ping(reconnect=False)
+                except DB_ERRORS:
+                    logger.info("Conexão ociosa com MariaDB perdida, reconectando")
+                    self._close_quietly(connection)
+                    return self._connect()
+
+            return connection
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, connection, broken: bool = False):
+        """Devolve a conexão ao pool (ou a descarta se falhou durante o uso)"""
+        try:
+            if broken:
+                self._close_quietly(connection)
+            else:
+                self._idle.put((connection, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    def close_all(self):
+        """Fecha as conexões ociosas do pool"""
+        while True:
+            try:
+                connection, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._close_quietly(connection)
+
+    @staticmethod
+    def _close_quietly(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+
+# Um pool por processo e destino: conexões não sobrevivem a fork, então o
+# controller e cada worker criam o seu na primeira conexão, e todos os
+# DatabaseManager do mesmo processo (controller, monitor, heartbeat) o compartilham
+_pools: Dict[Tuple[Any, ...], ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_connection_pool(config: Dict[str, Any], size: int, ping_interval: float,
+                        connect_retries: int) -> ConnectionPool:
+    """Retorna o pool compartilhado do processo atual para a configuração dada"""
+    key = (os.getpid(), config.get('host'), config.get('port'), config.get('user'), config.get('database'))
+
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(config, size=size, ping_interval=ping_interval,
+                                  connect_retries=connect_retries)
+            _pools[key] = pool
+        return pool
+
+
+class StatusBuffer:
+    """Atualizações de status gravadas em lote (write-behind)
+
+    update_file_status só enfileira a atualização em memória; uma thread
+    grava tudo num único UPDATE a cada `max_rows` atualizações ou
+    `flush_interval` segundos, o que vier primeiro, e uma última vez em
+    close(). A gravação só vale para arquivos ainda em processamento e
+    reservados por este worker: se o lease expirou e o arquivo foi
+    devolvido à fila (ou reservado por outro worker), a atualização
+    atrasada é descartada e o arquivo será processado de novo.
+    """
+
+    def __init__(self, db_manager: 'DatabaseManager', worker_id: int, max_rows: int = 50,
+                 flush_interval: float = 0.5):
+        self.db_manager = db_manager
+        self.worker_id = worker_id
+        self.max_rows = max_rows
+        self.flush_interval = flush_interval
+        self._pending: Dict[int, Tuple[str, Optional[datetime], Optional[str], Optional[str]]] = {}
+        self._in_flight: Dict[int, Tuple[str, Optional[datetime], Optional[str], Optional[str]]] = {}
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=f"status-buffer-{worker_id}", daemon=True)
+        self._thread.start()
+
+    def put(self, file_id: int, status: str, data_envio: Optional[datetime], mensagem_erro: Optional[str],
+            documento_id: Optional[str] = None):
+        """Enfileira a atualização (a mais recente de cada arquivo prevalece)"""
+        with self._condition:
+            self._pending[file_id] = (status, data_envio, mensagem_erro, documento_id)
+            if len(self._pending) >= self.max_rows:
+                self._condition.notify()
+
+    def pending_ids(self) -> List[int]:
+        """Arquivos com atualização ainda não gravada (o lease deles deve ser renovado)"""
+        with self._condition:
+            return list(self._pending) + list(self._in_flight)
+
+    def flush(self) -> int:
+        """Grava as atualizações pendentes; em caso de erro elas voltam para a fila"""
+        with self._flush_lock:
+            with self._condition:
+                self._in_flight, self._pending = self._pending, {}
+                batch = self._in_flight
+
+            if not batch:
+                return 0
+
+            try:
+                written = self.db_manager.write_status_batch(self.worker_id, batch)
+            except DB_ERRORS as e:
+                logger.error(f"Erro ao gravar lote de {len(batch)} status, nova tentativa no próximo flush: {e}")
+                with self._condition:
+                    for file_id, update in batch.items():
+                        self._pending.setdefault(file_id, update)
+                return 0
+            finally:
+                with self._condition:
+                    self._in_flight = {}
+
+            if written < len(batch):
+                logger.warning(f"Worker {self.worker_id}: {len(batch) - written}/{len(batch)} status descartados "
+                               f"(lease perdido antes da gravação)")
+            return written
+
+    def close(self):
+        """Encerra a thread gravando o que ainda estiver pendente"""
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify()
+
+        self._thread.join()
+        if self.pending_ids():
+            self.flush()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._closed and len(self._pending) < self.max_rows:
+                    self._condition.wait(self.flush_interval)
+                closing = self._closed
+
+            self.flush()
+            if closing:
+                return
+
 
 class DatabaseManager:
+    # Trechos de SQL que variam por backend (sobrescritos em db_sqlite)
+    migrations = MIGRATIONS
+    schema_version_table = SCHEMA_VERSION_TABLE
+    upsert_upload_query = UPSERT_UPLOAD_QUERY
+    upsert_fingerprint_query = UPSERT_FINGERPRINT_QUERY
+    report_query = REPORT_QUERY
+
     def __init__(self):
-        self.connection = None
+        self.pool: Optional[ConnectionPool] = None
         self.host = os.getenv('DB_HOST', 'localhost')
         self.user = os.getenv('DB_USER')
         self.password = os.getenv('DB_PASS')
         self.database = os.getenv('DB_NAME')
+        self.pool_size = int(os.getenv('DB_POOL_SIZE', '5'))
+        self.ping_interval = float(os.getenv('DB_PING_INTERVAL', '30'))
+        self.connect_retries = int(os.getenv('DB_CONNECT_RETRIES', '5'))
+        self.status_buffer: Optional[StatusBuffer] = None
 
     def connect(self) -> bool:
-        """Estabelece conexão com o banco de dados"""
+        """Obtém o pool de conexões do processo e valida o acesso ao banco"""
         try:
-            self.connection = mysql.connector.connect(
-                host=self.host,
-                user=self.user,
-                password=self.password,
-                database=self.database,
-                charset='utf8mb4',
-                autocommit=True
+            self.pool = get_connection_pool(
+                {
+                    'host': self.host,
+                    'user': self.user,
+                    'password': self.password,
+                    'database': self.database,
+                    'charset': 'utf8mb4',
+                    'autocommit': True
+                },
+                size=self.pool_size,
+                ping_interval=self.ping_interval,
+                connect_retries=self.connect_retries
             )
+
+            with self.cursor() as cursor:
+                cursor.execute("SELECT 1")
+                cursor.fetchall()
+
             logger.info("Conexão com MariaDB estabelecida com sucesso")
             return True
-        except Error as e:
+        except DB_ERRORS as e:
             logger.error(f"Erro ao conectar com MariaDB: {e}")
             return False
 
     def disconnect(self):
-        """Fecha a conexão com o banco"""
-        if self.connection and self.connection.is_connected():
-            self.connection.close()
+        """Libera o pool (as conexões são compartilhadas pelo processo)"""
+        self.disable_status_buffer()
+        if self.pool:
+            self.pool = None
             logger.info("Conexão com MariaDB fechada")
 
-    def create_table(self) -> bool:
-        """Cria a tabela uploads se não existir"""
-        create_table_query = """
-        CREATE TABLE IF NOT EXISTS uploads (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            caminho_arquivo TEXT NOT NULL,
-            tipo_arquivo VARCHAR(100) NOT NULL,
-            status ENUM('pendente','enviado','erro') DEFAULT 'pendente',
-            data_envio DATETIME NULL,
-            mensagem_erro TEXT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
-        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+    @contextmanager
+    def connection_scope(self):
+        """Retira uma conexão do pool pelo tempo do bloco"""
+        connection = self.pool.acquire()
+        broken = False
+        try:
+            yield connection
+        except (InterfaceError, OperationalError):
+            # Conexão caiu durante o uso: descarta para que a próxima seja nova
+            broken = True
+            raise
+        finally:
+            self.pool.release(connection, broken)
+
+    @contextmanager
+    def cursor(self, dictionary: bool = False):
+        """Cursor em uma conexão do pool (autocommit)"""
+        with self.connection_scope() as connection:
+            cursor = connection.cursor(dictionary=dictionary)
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+
+    @contextmanager
+    def transaction(self, dictionary: bool = False):
+        """Cursor dentro de uma transação explícita (commit ao sair, rollback em erro)"""
+        with self.connection_scope() as connection:
+            connection.start_transaction()
+            cursor = connection.cursor(dictionary=dictionary)
+            try:
+                yield cursor
+                connection.commit()
+            except BaseException:
+                try:
+                    connection.rollback()
+                except DB_ERRORS:
+                    pass
+                raise
+            finally:
+                cursor.close()
+
+    def _execute_with_reconnect(self, query: str, params=None) -> int:
+        """Executa um comando idempotente, repetindo uma vez se a conexão caiu
+
+        Retorna o rowcount.
         """
+        for attempt in range(2):
+            try:
+                with self.cursor() as cursor:
+                    cursor.execute(query, params)
+                    return cursor.rowcount
+            except (InterfaceError, OperationalError) as e:
+                if attempt:
+                    raise
+                logger.warning(f"Conexão com MariaDB perdida durante comando, repetindo: {e}")
+
+    def create_table(self) -> bool:
+        """Cria/atualiza o esquema do banco aplicando as migrações pendentes"""
+        return self.migrate()
 
+    def get_schema_version(self) -> int:
+        """Retorna a última versão de migração aplicada (0 se nenhuma)"""
+        with self.cursor() as cursor:
+            cursor.execute(self.schema_version_table)
+            cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+            (version,) = cursor.fetchone()
+        return int(version)
+
+    def migrate(self) -> bool:
+        """Aplica, em ordem, as migrações de esquema ainda não registradas
+
+        Cada versão roda numa transação própria com o seu registro em
+        schema_version: uma falha não deixa versão aplicada sem registro
+        (no MariaDB o DDL faz commit implícito, por isso os comandos das
+        migrações são idempotentes).
+        """
         try:
-            cursor = self.connection.cursor()
-            cursor.execute(create_table_query)
-            cursor.close()
-            logger.info("Tabela 'uploads' criada/verificada com sucesso")
+            current_version = self.get_schema_version()
+            pending = [m for m in sorted(self.migrations, key=lambda m: m[0]) if m[0] > current_version]
+
+            if not pending:
+                logger.info(f"Esquema do banco atualizado (versão {current_version})")
+                return True
+
+            for version, descricao, statements in pending:
+                logger.info(f"Aplicando migração {version}: {descricao}")
+                with self.transaction() as cursor:
+                    for statement in statements:
+                        if callable(statement):
+                            statement(cursor)
+                        else:
+                            cursor.execute(statement)
+                    cursor.execute(
+                        "INSERT INTO schema_version (version, descricao) VALUES (%s, %s)",
+                        (version, descricao)
+                    )
+
+            logger.info(f"Esquema do banco migrado da versão {current_version} para {pending[-1][0]}")
             return True
-        except Error as e:
-            logger.error(f"Erro ao criar tabela: {e}")
+        except DB_ERRORS as e:
+            logger.error(f"Erro ao aplicar migrações: {e}")
             return False
 
     def insert_file_record(self, caminho_arquivo: str, tipo_arquivo: str) -> Optional[int]:
-        """Insere um novo registro de arquivo no banco"""
-        query = """
-        INSERT INTO uploads (caminho_arquivo, tipo_arquivo, status)
-        VALUES (%s, %s, 'pendente')
-        """
-
+        """Insere (ou reenfileira, se estava com erro) o registro de um arquivo"""
         try:
-            cursor = self.connection.cursor()
-            cursor.execute(query, (caminho_arquivo, tipo_arquivo))
-            record_id = cursor.lastrowid
-            cursor.close()
+            with self.cursor() as cursor:
+                cursor.execute(self.upsert_upload_query, (caminho_arquivo, tipo_arquivo, FileUtils.get_path_hash(caminho_arquivo), None))
+                record_id = cursor.lastrowid
             logger.debug(f"Arquivo inserido no banco: {caminho_arquivo}")
             return record_id
-        except Error as e:
+        except DB_ERRORS as e:
             logger.error(f"Erro ao inserir arquivo no banco: {e}")
             return None
 
+    def sync_file_fingerprints(self, entries: Iterable[Dict[str, Any]], batch_size: int = 1000,
+                               force: bool = False) -> int:
+        """Registra apenas os arquivos novos ou alterados desde o último scan
+
+        Cada entrada traz caminho_arquivo, tipo_arquivo, path_hash, size,
+        mtime_ns e inode. Para cada lote, compara com arquivos_fingerprint em
+        uma única consulta e só grava (uploads + fingerprint, na mesma
+        transação) o que mudou. Com `force=True` todos os arquivos são
+        regravados, o que reenfileira os que estavam com erro. Arquivos já
+        enviados nunca voltam para a fila.
+
+        Os arquivos gravados têm o hash do conteúdo calculado e são
+        deduplicados: só o primeiro arquivo de cada conteúdo vira job de
+        upload, os demais ficam como 'duplicado' apontando para ele.
+
+        Retorna a quantidade de arquivos novos/alterados.
+        """
+        changed_total = 0
+        iterator = iter(entries)
+
+        while True:
+            batch = list(islice(iterator, batch_size))
+            if not batch:
+                break
+
+            try:
+                if force:
+                    changed = batch
+                else:
+                    known = self._get_fingerprints([entry['path_hash'] for entry in batch])
+                    changed = [
+                        entry for entry in batch
+                        if known.get(entry['path_hash']) != (entry['size'], entry['mtime_ns'], entry['inode'])
+                    ]
+
+                if not changed:
+                    continue
+
+                # Hash do conteúdo só para o que mudou (é a parte cara do scan)
+                for entry in changed:
+                    entry['content_hash'] = FileUtils.get_file_hash(entry['caminho_arquivo'])
+
+                path_hashes = [entry['path_hash'] for entry in changed]
+
+                with self.transaction() as cursor:
+                    # Arquivos alterados deixam de representar o conteúdo antigo
+                    released_ids = self._release_changed_contents(cursor, path_hashes)
+
+                    cursor.executemany(self.upsert_upload_query, [
+                        (entry['caminho_arquivo'], entry['tipo_arquivo'], entry['path_hash'], entry['content_hash'])
+                        for entry in changed
+                    ])
+                    cursor.executemany(self.upsert_fingerprint_query, [
+                        (entry['path_hash'], entry['size'], entry['mtime_ns'], entry['inode'])
+                        for entry in changed
+                    ])
+
+                    placeholders = ', '.join(['%s'] * len(path_hashes))
+                    cursor.execute(f"SELECT id FROM uploads WHERE path_hash IN ({placeholders})", path_hashes)
+                    upload_ids = [row[0] for row in cursor.fetchall()] + released_ids
+
+                    self._link_duplicate_contents(cursor, upload_ids)
+
+                changed_total += len(changed)
+                logger.debug(f"Lote de scan: {len(changed)}/{len(batch)} arquivos novos ou alterados")
+            except DB_ERRORS as e:
+                logger.error(f"Erro ao sincronizar lote de {len(batch)} arquivos: {e}")
+
+        return changed_total
+
+    def _release_changed_contents(self, cursor, path_hashes: List[str]) -> List[int]:
+        """Remove o vínculo conteúdo -> job de arquivos que serão regravados
+
+        Arquivos já enviados mantêm o vínculo (aquele conteúdo de fato foi
+        enviado). As duplicatas que apontavam para os jobs liberados voltam a
+        'pendente' e seus ids são retornados para serem deduplicados de novo.
+        """
+        placeholders = ', '.join(['%s'] * len(path_hashes))
+
+        cursor.execute(f"""
+            SELECT id FROM uploads
+            WHERE path_hash IN ({placeholders}) AND status <> 'enviado'
+        """, path_hashes)
+        owner_ids = [row[0] for row in cursor.fetchall()]
+
+        if not owner_ids:
+            return []
+
+        owner_placeholders = ', '.join(['%s'] * len(owner_ids))
+        cursor.execute(f"DELETE FROM conteudos WHERE upload_id IN ({owner_placeholders})", owner_ids)
+
+        cursor.execute(f"""
+            SELECT id FROM uploads
+            WHERE duplicado_de IN ({owner_placeholders}) AND status = 'duplicado'
+        """, owner_ids)
+        released_ids = [row[0] for row in cursor.fetchall()]
+
+        if released_ids:
+            released_placeholders = ', '.join(['%s'] * len(released_ids))
+            cursor.execute(f"""
+                UPDATE uploads SET status = 'pendente', duplicado_de = NULL
+                WHERE id IN ({released_placeholders})
+            """, released_ids)
+
+        return released_ids
+
+    def _link_duplicate_contents(self, cursor, upload_ids: List[int]):
+        """Elege um job por conteúdo e marca os demais arquivos como duplicados"""
+        if not upload_ids:
+            return
+
+        placeholders = ', '.join(['%s'] * len(upload_ids))
+
+        # O primeiro registro de cada conteúdo vira o job canônico
+        cursor.execute(f"""
+            INSERT IGNORE INTO conteudos (content_hash, upload_id)
+            SELECT content_hash, id FROM uploads
+            WHERE id IN ({placeholders}) AND content_hash IS NOT NULL
+            ORDER BY id
+        """, upload_ids)
+
+        # Os demais passam a apontar para ele (sem job próprio)
+        cursor.execute(f"""
+            UPDATE uploads u
+            JOIN conteudos c ON c.content_hash = u.content_hash
+            SET u.status = 'duplicado', u.duplicado_de = c.upload_id
+            WHERE u.id IN ({placeholders})
+              AND c.upload_id <> u.id
+              AND u.status IN ('pendente', 'duplicado')
+        """, upload_ids)
+
+    def _get_fingerprints(self, path_hashes: List[str]) -> Dict[str, Tuple[int, int, int]]:
+        """Busca (size, mtime_ns, inode) registrados para os path_hashes informados"""
+        placeholders = ', '.join(['%s'] * len(path_hashes))
+        query = f"""
+        SELECT path_hash, size, mtime_ns, inode
+        FROM arquivos_fingerprint
+        WHERE path_hash IN ({placeholders})
+        """
+
+        with self.cursor() as cursor:
+            cursor.execute(query, path_hashes)
+            results = cursor.fetchall()
+
+        return {path_hash: (size, mtime_ns, inode) for path_hash, size, mtime_ns, inode in results}
+
     def get_pending_files(self, limit: int = 100) -> List[Dict[str, Any]]:
         """Busca arquivos com status pendente"""
         query = """
@@ -100,53 +597,246 @@ class DatabaseManager:
         """
 
         try:
-            cursor = self.connection.cursor(dictionary=True)
-            cursor.execute(query, (limit,))
-            results = cursor.fetchall()
-            cursor.close()
-            return results
-        except Error as e:
+            with self.cursor(dictionary=True) as cursor:
+                cursor.execute(query, (limit,))
+                return cursor.fetchall()
+        except DB_ERRORS as e:
             logger.error(f"Erro ao buscar arquivos pendentes: {e}")
             return []
 
-    def update_file_status(self, file_id: int, status: str, mensagem_erro: str = None) -> bool:
-        """Atualiza o status de um arquivo"""
+    def claim_jobs(self, worker_id: int, n: int = 1, lease_seconds: int = 300) -> List[Dict[str, Any]]:
+        """Reserva atomicamente até N arquivos pendentes para um worker
+
+        SELECT ... FOR UPDATE SKIP LOCKED (MariaDB 10.6+) faz cada worker pular
+        as linhas já travadas por outro, então workers concorrentes nunca
+        recebem o mesmo arquivo e não disputam a cabeça da fila. Cada arquivo
+        reservado recebe um lease de `lease_seconds` que o worker deve renovar
+        com extend_lease enquanto o processa.
+        """
+        select_query = """
+        SELECT id, caminho_arquivo, tipo_arquivo, status
+        FROM uploads
+        WHERE status = 'pendente'
+        ORDER BY created_at ASC
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+        """
+
+        try:
+            with self.transaction(dictionary=True) as cursor:
+                cursor.execute(select_query, (n,))
+                jobs = cursor.fetchall()
+
+                if jobs:
+                    ids = [job['id'] for job in jobs]
+                    placeholders = ', '.join(['%s'] * len(ids))
+                    cursor.execute(
+                        f"""
+                        UPDATE uploads
+                        SET status = 'processando',
+                            claimed_by = %s,
+                            lease_expires_at = NOW() + INTERVAL %s SECOND,
+                            attempts = attempts + 1
+                        WHERE id IN ({placeholders})
+                        """,
+                        [str(worker_id), lease_seconds] + ids
+                    )
+
+            for job in jobs:
+                job['status'] = 'processando'
+
+            logger.debug(f"Worker {worker_id}: {len(jobs)} arquivo(s) reservado(s)")
+            return jobs
+        except DB_ERRORS as e:
+            logger.error(f"Erro ao reservar arquivos para worker {worker_id}: {e}")
+            return []
+
+    def extend_lease(self, worker_id: int, file_ids: List[int], lease_seconds: int = 300) -> int:
+        """Renova o lease dos arquivos ainda em posse do worker (heartbeat)"""
+        if not file_ids:
+            return 0
+
+        placeholders = ', '.join(['%s'] * len(file_ids))
+        query = f"""
+        UPDATE uploads
+        SET lease_expires_at = NOW() + INTERVAL %s SECOND
+        WHERE id IN ({placeholders})
+          AND status = 'processando'
+          AND claimed_by = %s
+        """
+
+        try:
+            renewed = self._execute_with_reconnect(query, [lease_seconds] + list(file_ids) + [str(worker_id)])
+            if renewed < len(file_ids):
+                logger.warning(f"Worker {worker_id}: lease renovado para apenas {renewed}/{len(file_ids)} arquivos")
+            return renewed
+        except DB_ERRORS as e:
+            logger.error(f"Erro ao renovar lease do worker {worker_id}: {e}")
+            return 0
+
+    def reap_expired_leases(self, max_attempts: int = 3) -> Dict[str, int]:
+        """Devolve à fila os arquivos cujo lease expirou (worker morto ou travado)
+
+        Arquivos que já esgotaram `max_attempts` reservas são marcados como erro
+        para que um documento que derruba o navegador não volte à fila para sempre.
+        """
+        fail_query = """
+        UPDATE uploads
+        SET status = 'erro',
+            data_envio = NOW(),
+            mensagem_erro = CONCAT('Lease expirado após ', attempts, ' tentativas (último worker: ', COALESCE(claimed_by, '?'), ')'),
+            claimed_by = NULL,
+            lease_expires_at = NULL
+        WHERE status = 'processando'
+          AND lease_expires_at < NOW()
+          AND attempts >= %s
+        """
+
+        requeue_query = """
+        UPDATE uploads
+        SET status = 'pendente',
+            claimed_by = NULL,
+            lease_expires_at = NULL
+        WHERE status = 'processando'
+          AND lease_expires_at < NOW()
+        """
+
+        try:
+            with self.cursor() as cursor:
+                cursor.execute(fail_query, (max_attempts,))
+                failed = cursor.rowcount
+                cursor.execute(requeue_query)
+                requeued = cursor.rowcount
+
+            if failed or requeued:
+                logger.info(f"Leases expirados: {requeued} devolvidos à fila, {failed} marcados como erro")
+            return {'requeued': requeued, 'failed': failed}
+        except DB_ERRORS as e:
+            logger.error(f"Erro ao recuperar leases expirados: {e}")
+            return {'requeued': 0, 'failed': 0}
+
+    def update_file_status(self, file_id: int, status: str, mensagem_erro: str = None,
+                           documento_id: str = None, worker_id: Optional[int] = None) -> bool:
+        """Atualiza o status de um arquivo
+
+        `documento_id` é o id que o site informou na resposta do envio; sem
+        ele o valor já gravado é mantido. Com `worker_id`, como em
+        write_status_batch, só altera o arquivo se ele ainda estiver em
+        processamento e reservado por esse worker (retorna False se o lease
+        foi perdido).
+        """
         query = """
         UPDATE uploads
-        SET status = %s, data_envio = %s, mensagem_erro = %s
+        SET status = %s, data_envio = %s, mensagem_erro = %s,
+            documento_id = COALESCE(%s, documento_id),
+            claimed_by = NULL, lease_expires_at = NULL
         WHERE id = %s
         """
 
         data_envio = datetime.now() if status in ['enviado', 'erro'] else None
+        params: List[Any] = [status, data_envio, mensagem_erro, documento_id, file_id]
+        if worker_id is not None:
+            query += """  AND status = 'processando'
+          AND claimed_by = %s
+        """
+            params.append(str(worker_id))
+
+        if self.status_buffer:
+            self.status_buffer.put(file_id, status, data_envio, mensagem_erro, documento_id)
+            logger.debug(f"Status do arquivo ID {file_id} enfileirado: {status}")
+            return True
 
         try:
-            cursor = self.connection.cursor()
-            cursor.execute(query, (status, data_envio, mensagem_erro, file_id))
-            cursor.close()
+            updated = self._execute_with_reconnect(query, params)
+            if worker_id is not None and not updated:
+                logger.warning(f"Worker {worker_id}: status {status} do arquivo ID {file_id} descartado "
+                               f"(lease perdido antes da gravação)")
+                return False
             logger.debug(f"Status do arquivo ID {file_id} atualizado para: {status}")
             return True
-        except Error as e:
+        except DB_ERRORS as e:
             logger.error(f"Erro ao atualizar status do arquivo: {e}")
             return False
 
-    def get_all_records(self) -> List[Dict[str, Any]]:
-        """Busca todos os registros para relatório"""
-        query = """
-        SELECT caminho_arquivo, tipo_arquivo, status, data_envio, mensagem_erro
-        FROM uploads
-        ORDER BY created_at ASC
+    def enable_status_buffer(self, worker_id: int, max_rows: int = 50, flush_interval_ms: int = 500):
+        """Passa update_file_status para o modo write-behind (ver StatusBuffer)"""
+        if self.status_buffer is None:
+            self.status_buffer = StatusBuffer(self, worker_id, max_rows, flush_interval_ms / 1000)
+            logger.info(f"Worker {worker_id}: status gravados em lote "
+                        f"(a cada {max_rows} arquivos ou {flush_interval_ms}ms)")
+        return self.status_buffer
+
+    def disable_status_buffer(self):
+        """Grava as atualizações pendentes e volta à gravação síncrona"""
+        if self.status_buffer:
+            status_buffer, self.status_buffer = self.status_buffer, None
+            status_buffer.close()
+
+    def write_status_batch(self, worker_id: int,
+                           updates: Dict[int, Tuple[str, Optional[datetime], Optional[str], Optional[str]]]) -> int:
+        """Grava várias atualizações de status num único UPDATE (CASE por id)
+
+        Só altera arquivos ainda em processamento e reservados pelo worker.
+        Retorna quantos foram de fato atualizados.
+        """
+        ids = list(updates)
+        whens = ' '.join(['WHEN %s THEN %s'] * len(ids))
+        placeholders = ', '.join(['%s'] * len(ids))
+        query = f"""
+        UPDATE uploads
+        SET status = CASE id {whens} END,
+            data_envio = CASE id {whens} END,
+            mensagem_erro = CASE id {whens} END,
+            documento_id = COALESCE(CASE id {whens} END, documento_id),
+            claimed_by = NULL,
+            lease_expires_at = NULL
+        WHERE id IN ({placeholders})
+          AND status = 'processando'
+          AND claimed_by = %s
         """
 
+        params: List[Any] = []
+        for column in range(4):
+            for file_id in ids:
+                params += [file_id, updates[file_id][column]]
+        params += ids + [str(worker_id)]
+
+        return self._execute_with_reconnect(query, params)
+
+    def get_all_records(self) -> List[Dict[str, Any]]:
+        """Busca todos os registros para relatório (carrega tudo em memória)
+
+        Para relatórios grandes prefira iter_all_records.
+        """
         try:
-            cursor = self.connection.cursor(dictionary=True)
-            cursor.execute(query)
-            results = cursor.fetchall()
-            cursor.close()
-            return results
-        except Error as e:
+            return list(self.iter_all_records())
+        except DB_ERRORS as e:
             logger.error(f"Erro ao buscar registros: {e}")
             return []
 
+    def iter_all_records(self, chunk_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """Percorre os registros do relatório em blocos de `chunk_size`
+
+        O cursor do mysql.connector não usa buffer, então as linhas vêm do
+        servidor conforme fetchmany é chamado e a memória fica constante
+        qualquer que seja o tamanho da tabela. A conexão fica presa ao
+        gerador até ele terminar; erros de banco são propagados.
+        """
+        with self.cursor(dictionary=True) as cursor:
+            cursor.execute(self.report_query)
+            exhausted = False
+            try:
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        exhausted = True
+                        break
+                    yield from rows
+            finally:
+                # Gerador abandonado: descarta o restante para liberar a conexão
+                while not exhausted and cursor.fetchmany(chunk_size):
+                    pass
+
     def get_stats(self) -> Dict[str, int]:
         """Retorna estatísticas dos uploads"""
         query = """
@@ -158,36 +848,41 @@ class DatabaseManager:
         """
 
         try:
-            cursor = self.connection.cursor()
-            cursor.execute(query)
-            results = cursor.fetchall()
-            cursor.close()
+            with self.cursor() as cursor:
+                cursor.execute(query)
+                results = cursor.fetchall()
 
-            stats = {'pendente': 0, 'enviado': 0, 'erro': 0}
+            stats = {'pendente': 0, 'processando': 0, 'enviado': 0, 'erro': 0, 'duplicado': 0}
             for status, count in results:
                 stats[status] = count
 
             return stats
-        except Error as e:
+        except DB_ERRORS as e:
             logger.error(f"Erro ao buscar estatísticas: {e}")
-            return {'pendente': 0, 'enviado': 0, 'erro': 0}
+            return {'pendente': 0, 'processando': 0, 'enviado': 0, 'erro': 0, 'duplicado': 0}
 
     def clear_pending_files(self) -> bool:
         """Remove todos os arquivos com status pendente (útil para restart)"""
         query = "DELETE FROM uploads WHERE status = 'pendente'"
 
         try:
-            cursor = self.connection.cursor()
-            cursor.execute(query)
-            rows_affected = cursor.rowcount
-            cursor.close()
+            with self.cursor() as cursor:
+                cursor.execute(query)
+                rows_affected = cursor.rowcount
             logger.info(f"Removidos {rows_affected} registros pendentes")
             return True
-        except Error as e:
+        except DB_ERRORS as e:
             logger.error(f"Erro ao limpar registros pendentes: {e}")
             return False
 
 
 def get_db_manager() -> DatabaseManager:
-    """Factory function para criar instância do DatabaseManager"""
+    """Factory function para criar instância do DatabaseManager
+
+    DB_BACKEND=sqlite usa o banco embarcado em SQLITE_PATH no lugar do MariaDB.
+    """
+    backend = os.getenv('DB_BACKEND', 'mariadb').lower()
+    if backend == 'sqlite':
+        from db_sqlite import SQLiteDatabaseManager
+        return SQLiteDatabaseManager()
     return DatabaseManager()
\ No newline at end of file
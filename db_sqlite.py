@@ -0,0 +1,350 @@
+"""
+Backend SQLite (WAL) para a fila de uploads
+
+Alternativa embarcada ao MariaDB, selecionada com DB_BACKEND=sqlite. Usa o
+mesmo DatabaseManager, trocando apenas a conexão e os comandos SQL que
+diferem entre os dialetos.
+
+Concorrência entre processos: o modo WAL permite leituras simultâneas à
+escrita, e toda transação de escrita abre com BEGIN IMMEDIATE, que pega o
+lock de escrita do arquivo logo no início. Assim a leitura + atualização de
+claim_jobs é atômica entre os workers (o equivalente ao FOR UPDATE SKIP
+LOCKED do MariaDB); quem chega depois espera até `busy_timeout`.
+"""
+
+import os
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from typing import List, Optional, Dict, Any
+from datetime import datetime
+
+from db import DatabaseManager, DB_ERRORS
+from migrations import SQLITE_MIGRATIONS, SQLITE_SCHEMA_VERSION_TABLE
+from utils import FileUtils
+
+logger = logging.getLogger(__name__)
+
+
+# Datas gravadas como texto no formato do MariaDB, em horário local
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(sep=' ', timespec='seconds'))
+sqlite3.register_converter('TIMESTAMP', lambda value: datetime.fromisoformat(value.decode()))
+
+
+UPSERT_UPLOAD_QUERY = """
+INSERT INTO uploads (caminho_arquivo, tipo_arquivo, path_hash, content_hash, status)
+VALUES (%s, %s, %s, %s, 'pendente')
+ON CONFLICT (path_hash) DO UPDATE SET
+    tipo_arquivo = excluded.tipo_arquivo,
+    content_hash = CASE WHEN status = 'enviado' THEN content_hash
+                        ELSE COALESCE(excluded.content_hash, content_hash) END,
+    attempts = CASE WHEN status IN ('erro', 'duplicado') THEN 0 ELSE attempts END,
+    mensagem_erro = CASE WHEN status IN ('erro', 'duplicado') THEN NULL ELSE mensagem_erro END,
+    duplicado_de = CASE WHEN status IN ('erro', 'duplicado') THEN NULL ELSE duplicado_de END,
+    status = CASE WHEN status IN ('erro', 'duplicado') THEN 'pendente' ELSE status END
+"""
+
+# Alias "data_envio [timestamp]": COALESCE perde o tipo declarado da coluna,
+# então o conversor de datas é indicado pelo nome (PARSE_COLNAMES)
+REPORT_QUERY = """
+SELECT
+    u.caminho_arquivo,
+    u.tipo_arquivo,
+    COALESCE(c.status, u.status) AS status,
+    COALESCE(c.data_envio, u.data_envio) AS "data_envio [timestamp]",
+    CASE
+        WHEN c.id IS NULL THEN u.mensagem_erro
+        ELSE 'Conteúdo idêntico a ' || c.caminho_arquivo || COALESCE(' - ' || c.mensagem_erro, '')
+    END AS mensagem_erro,
+    COALESCE(c.documento_id, u.documento_id) AS documento_id
+FROM uploads u
+LEFT JOIN uploads c ON c.id = u.duplicado_de
+ORDER BY u.created_at ASC
+"""
+
+UPSERT_FINGERPRINT_QUERY = """
+INSERT INTO arquivos_fingerprint (path_hash, size, mtime_ns, inode)
+VALUES (%s, %s, %s, %s)
+ON CONFLICT (path_hash) DO UPDATE SET
+    size = excluded.size,
+    mtime_ns = excluded.mtime_ns,
+    inode = excluded.inode
+"""
+
+
+class _SQLiteCursor:
+    """Cursor com a interface usada pelo DatabaseManager (placeholders %s)"""
+
+    def __init__(self, cursor: sqlite3.Cursor, dictionary: bool = False):
+        self._cursor = cursor
+        if dictionary:
+            cursor.row_factory = lambda c, row: {col[0]: value for col, value in zip(c.description, row)}
+
+    def execute(self, query: str, params=None):
+        self._cursor.execute(query.replace('%s', '?'), tuple(params or ()))
+
+    def executemany(self, query: str, rows):
+        self._cursor.executemany(query.replace('%s', '?'), rows)
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchmany(self, size: int):
+        return self._cursor.fetchmany(size)
+
+    @property
+    def rowcount(self) -> int:
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self) -> Optional[int]:
+        return self._cursor.lastrowid
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteDatabaseManager(DatabaseManager):
+    migrations = SQLITE_MIGRATIONS
+    schema_version_table = SQLITE_SCHEMA_VERSION_TABLE
+    upsert_upload_query = UPSERT_UPLOAD_QUERY
+    upsert_fingerprint_query = UPSERT_FINGERPRINT_QUERY
+    report_query = REPORT_QUERY
+
+    def __init__(self):
+        super().__init__()
+        self.path = os.getenv('SQLITE_PATH', './uploads.sqlite3')
+        self.busy_timeout = float(os.getenv('SQLITE_BUSY_TIMEOUT', '30'))
+        self._local = threading.local()
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """Conexão da thread atual (conexões SQLite não são compartilhadas entre threads nem forks)"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None and self._local.pid == os.getpid():
+            return connection
+
+        # isolation_level=None: autocommit, transações só com BEGIN explícito
+        connection = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout,
+            isolation_level=None,
+            detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES
+        )
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+
+        self._local.connection = connection
+        self._local.pid = os.getpid()
+        return connection
+
+    def connect(self) -> bool:
+        """Abre o arquivo do banco (criando-o se preciso) em modo WAL"""
+        try:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+
+            with self.cursor() as cursor:
+                cursor.execute("SELECT 1")
+                cursor.fetchall()
+
+            logger.info(f"Banco SQLite aberto: {self.path}")
+            return True
+        except (DB_ERRORS + (OSError,)) as e:
+            logger.error(f"Erro ao abrir banco SQLite {self.path}: {e}")
+            return False
+
+    def disconnect(self):
+        """Fecha a conexão da thread atual"""
+        self.disable_status_buffer()
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None and self._local.pid == os.getpid():
+            connection.close()
+            logger.info("Conexão com SQLite fechada")
+        self._local.connection = None
+
+    @contextmanager
+    def connection_scope(self):
+        yield self._get_connection()
+
+    @contextmanager
+    def cursor(self, dictionary: bool = False):
+        """Cursor na conexão da thread (autocommit)"""
+        cursor = _SQLiteCursor(self._get_connection().cursor(), dictionary)
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+
+    @contextmanager
+    def transaction(self, dictionary: bool = False):
+        """Transação com o lock de escrita reservado desde o início (BEGIN IMMEDIATE)"""
+        connection = self._get_connection()
+        cursor = _SQLiteCursor(connection.cursor(), dictionary)
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            yield cursor
+            cursor.execute("COMMIT")
+        except BaseException:
+            try:
+                cursor.execute("ROLLBACK")
+            except DB_ERRORS:
+                pass
+            raise
+        finally:
+            cursor.close()
+
+    def _execute_with_reconnect(self, query: str, params=None) -> int:
+        """Arquivo local não perde conexão: executa uma única vez"""
+        with self.cursor() as cursor:
+            cursor.execute(query, params)
+            return cursor.rowcount
+
+    def insert_file_record(self, caminho_arquivo: str, tipo_arquivo: str) -> Optional[int]:
+        """Insere (ou reenfileira, se estava com erro) o registro de um arquivo"""
+        path_hash = FileUtils.get_path_hash(caminho_arquivo)
+
+        try:
+            # lastrowid não é confiável quando o upsert cai no UPDATE
+            with self.transaction() as cursor:
+                cursor.execute(self.upsert_upload_query, (caminho_arquivo, tipo_arquivo, path_hash, None))
+                cursor.execute("SELECT id FROM uploads WHERE path_hash = %s", (path_hash,))
+                (record_id,) = cursor.fetchone()
+            logger.debug(f"Arquivo inserido no banco: {caminho_arquivo}")
+            return record_id
+        except DB_ERRORS as e:
+            logger.error(f"Erro ao inserir arquivo no banco: {e}")
+            return None
+
+    def _link_duplicate_contents(self, cursor, upload_ids: List[int]):
+        """Elege um job por conteúdo e marca os demais arquivos como duplicados"""
+        if not upload_ids:
+            return
+
+        placeholders = ', '.join(['%s'] * len(upload_ids))
+
+        cursor.execute(f"""
+            INSERT OR IGNORE INTO conteudos (content_hash, upload_id)
+            SELECT content_hash, id FROM uploads
+            WHERE id IN ({placeholders}) AND content_hash IS NOT NULL
+            ORDER BY id
+        """, upload_ids)
+
+        # SQLite não tem UPDATE ... JOIN: o job canônico vem por subconsulta
+        cursor.execute(f"""
+            UPDATE uploads
+            SET status = 'duplicado',
+                duplicado_de = (SELECT c.upload_id FROM conteudos c
+                                WHERE c.content_hash = uploads.content_hash)
+            WHERE id IN ({placeholders})
+              AND status IN ('pendente', 'duplicado')
+              AND EXISTS (SELECT 1 FROM conteudos c
+                          WHERE c.content_hash = uploads.content_hash
+                            AND c.upload_id <> uploads.id)
+        """, upload_ids)
+
+    def claim_jobs(self, worker_id: int, n: int = 1, lease_seconds: int = 300) -> List[Dict[str, Any]]:
+        """Reserva atomicamente até N arquivos pendentes para um worker
+
+        A transação BEGIN IMMEDIATE serializa os claims entre processos, então
+        dois workers nunca recebem o mesmo arquivo.
+        """
+        select_query = """
+        SELECT id, caminho_arquivo, tipo_arquivo, status
+        FROM uploads
+        WHERE status = 'pendente'
+        ORDER BY created_at ASC
+        LIMIT %s
+        """
+
+        try:
+            with self.transaction(dictionary=True) as cursor:
+                cursor.execute(select_query, (n,))
+                jobs = cursor.fetchall()
+
+                if jobs:
+                    ids = [job['id'] for job in jobs]
+                    placeholders = ', '.join(['%s'] * len(ids))
+                    cursor.execute(
+                        f"""
+                        UPDATE uploads
+                        SET status = 'processando',
+                            claimed_by = %s,
+                            lease_expires_at = datetime('now', 'localtime', '+' || %s || ' seconds'),
+                            attempts = attempts + 1
+                        WHERE id IN ({placeholders})
+                        """,
+                        [str(worker_id), int(lease_seconds)] + ids
+                    )
+
+            for job in jobs:
+                job['status'] = 'processando'
+
+            logger.debug(f"Worker {worker_id}: {len(jobs)} arquivo(s) reservado(s)")
+            return jobs
+        except DB_ERRORS as e:
+            logger.error(f"Erro ao reservar arquivos para worker {worker_id}: {e}")
+            return []
+
+    def extend_lease(self, worker_id: int, file_ids: List[int], lease_seconds: int = 300) -> int:
+        """Renova o lease dos arquivos ainda em posse do worker (heartbeat)"""
+        if not file_ids:
+            return 0
+
+        placeholders = ', '.join(['%s'] * len(file_ids))
+        query = f"""
+        UPDATE uploads
+        SET lease_expires_at = datetime('now', 'localtime', '+' || %s || ' seconds')
+        WHERE id IN ({placeholders})
+          AND status = 'processando'
+          AND claimed_by = %s
+        """
+
+        try:
+            renewed = self._execute_with_reconnect(query, [int(lease_seconds)] + list(file_ids) + [str(worker_id)])
+            if renewed < len(file_ids):
+                logger.warning(f"Worker {worker_id}: lease renovado para apenas {renewed}/{len(file_ids)} arquivos")
+            return renewed
+        except DB_ERRORS as e:
+            logger.error(f"Erro ao renovar lease do worker {worker_id}: {e}")
+            return 0
+
+    def reap_expired_leases(self, max_attempts: int = 3) -> Dict[str, int]:
+        """Devolve à fila os arquivos cujo lease expirou (worker morto ou travado)"""
+        fail_query = """
+        UPDATE uploads
+        SET status = 'erro',
+            data_envio = datetime('now', 'localtime'),
+            mensagem_erro = 'Lease expirado após ' || attempts || ' tentativas (último worker: ' || COALESCE(claimed_by, '?') || ')',
+            claimed_by = NULL,
+            lease_expires_at = NULL
+        WHERE status = 'processando'
+          AND lease_expires_at < datetime('now', 'localtime')
+          AND attempts >= %s
+        """
+
+        requeue_query = """
+        UPDATE uploads
+        SET status = 'pendente',
+            claimed_by = NULL,
+            lease_expires_at = NULL
+        WHERE status = 'processando'
+          AND lease_expires_at < datetime('now', 'localtime')
+        """
+
+        try:
+            with self.transaction() as cursor:
+                cursor.execute(fail_query, (max_attempts,))
+                failed = cursor.rowcount
+                cursor.execute(requeue_query)
+                requeued = cursor.rowcount
+
+            if failed or requeued:
+                logger.info(f"Leases expirados: {requeued} devolvidos à fila, {failed} marcados como erro")
+            return {'requeued': requeued, 'failed': failed}
+        except DB_ERRORS as e:
+            logger.error(f"Erro ao recuperar leases expirados: {e}")
+            return {'requeued': 0, 'failed': 0}
@@ -6,5 +6,6 @@ from .base_flow import BaseFlow
 from .atestados import AtestadosFlow
 from .prontuarios import ProntuariosFlow
 from .exames import ExamesFlow
+from .ged import GedFlow, GED_DOCUMENT_TYPES
 
-__all__ = ['BaseFlow', 'AtestadosFlow', 'ProntuariosFlow', 'ExamesFlow']
\ No newline at end of file
+__all__ = ['BaseFlow', 'AtestadosFlow', 'ProntuariosFlow', 'ExamesFlow', 'GedFlow', 'GED_DOCUMENT_TYPES']
\ No newline at end of file
@@ -13,28 +13,90 @@ logger = logging.getLogger(__name__)
 class AtestadosFlow(BaseFlow):
     """Fluxo para upload de atestados médicos"""
 
+    # Caminhos possíveis da página de upload (ajuste conforme seu sistema)
+    UPLOAD_PATHS = [
+        "/atestados/upload",
+        "/documentos/atestados",
+        "/upload/atestados",
+        "/admin/atestados/create"
+    ]
+
+    # Selectors comuns para menus de atestados
+    MENU_SELECTORS = [
+        'a:has-text("Atestados")',
+        'a:has-text("Documentos")',
+        'a[href*="atestado"]',
+        'a[href*="documento"]',
+        '.menu-item:has-text("Atestados")',
+        'nav a:has-text("Atestados")'
+    ]
+
+    # Links de "Novo"/"Upload" na listagem aberta pelo menu
+    NEW_BUTTON_SELECTORS = [
+        'a:has-text("Novo")',
+        'a:has-text("Upload")',
+        'a:has-text("Adicionar")',
+        'button:has-text("Novo")',
+        '.btn-new',
+        '.btn-upload'
+    ]
+
+    # Selectors comuns para input de arquivo
+    FILE_INPUT_SELECTORS = [
+        'input[type="file"]',
+        'input[name="arquivo"]',
+        'input[name="documento"]',
+        'input[name="atestado"]',
+        'input[accept*="pdf"]',
+        'input[accept*="image"]',
+        '#file-upload',
+        '.file-input'
+    ]
+
+    # Botões de upload que abrem o seletor de arquivos
+    UPLOAD_BUTTON_SELECTORS = [
+        'button:has-text("Upload")',
+        'button:has-text("Escolher")',
+        'button:has-text("Selecionar")',
+        '.upload-button',
+        '.btn-upload'
+    ]
+
+    # Botões de envio/salvamento do formulário
+    SUBMIT_SELECTORS = [
+        'button[type="submit"]',
+        'input[type="submit"]',
+        'button:has-text("Enviar")',
+        'button:has-text("Salvar")',
+        'button:has-text("Upload")',
+        '.btn-submit',
+        '.btn-save',
+        '#submit-button'
+    ]
+
+    # Textos que confirmam que a página de upload foi aberta
+    PAGE_KEYWORDS = ['atestado', 'upload', 'documento']
+
     def navigate_to_upload_page(self) -> bool:
         """Navega para a página de upload de atestados"""
         try:
             logger.info("Navegando para página de upload de atestados")
 
-            # URLs possíveis para atestados (ajuste conforme seu sistema)
-            atestados_urls = [
-                f"{self.base_url}/atestados/upload",
-                f"{self.base_url}/documentos/atestados",
-                f"{self.base_url}/upload/atestados",
-                f"{self.base_url}/admin/atestados/create"
-            ]
+            # Destino aprendido em execuções anteriores
+            if self.navigate_cached():
+                return True
 
             # Tenta navegar para página de atestados
             navigation_success = False
-            for url in atestados_urls:
+            for path in self.UPLOAD_PATHS:
+                url = f"{self.base_url}{path}"
                 try:
                     self.page.goto(url, wait_until="networkidle", timeout=10000)
 
                     # Verifica se chegou na página correta
-                    if any(text in self.page.content().lower() for text in ['atestado', 'upload', 'documento']):
+                    if any(text in self.page.content().lower() for text in self.PAGE_KEYWORDS):
                         navigation_success = True
+                        self.remember_navigation(path=path)
                         logger.info(f"Página de atestados encontrada: {url}")
                         break
                 except:
@@ -44,44 +106,31 @@ class AtestadosFlow(BaseFlow):
             if not navigation_success:
                 logger.info("Tentando navegar via menu")
 
-                # Selectors comuns para menus de atestados
-                menu_selectors = [
-                    'a:has-text("Atestados")',
-                    'a:has-text("Documentos")',
-                    'a[href*="atestado"]',
-                    'a[href*="documento"]',
-                    '.menu-item:has-text("Atestados")',
-                    'nav a:has-text("Atestados")'
-                ]
-
-                for selector in menu_selectors:
+                visible_menus = self.visible_selectors(self.MENU_SELECTORS)
+                for selector in self.MENU_SELECTORS:
                     try:
-                        if self.page.locator(selector).is_visible():
+                        if selector in visible_menus:
                             self.page.click(selector)
                             self.page.wait_for_load_state("networkidle")
 
                             # Procura por link de "Novo" ou "Upload"
-                            upload_selectors = [
-                                'a:has-text("Novo")',
-                                'a:has-text("Upload")',
-                                'a:has-text("Adicionar")',
-                                'button:has-text("Novo")',
-                                '.btn-new',
-                                '.btn-upload'
-                            ]
-
-                            for upload_selector in upload_selectors:
+                            visible_new_buttons = self.visible_selectors(self.NEW_BUTTON_SELECTORS)
+                            for upload_selector in self.NEW_BUTTON_SELECTORS:
                                 try:
-                                    if self.page.locator(upload_selector).is_visible():
+                                    if upload_selector in visible_new_buttons:
                                         self.page.click(upload_selector)
                                         self.page.wait_for_load_state("networkidle")
                                         navigation_success = True
+                                        self.remember_navigation(menu=[selector, upload_selector])
                                         break
                                 except:
                                     continue
 
                             if navigation_success:
                                 break
+
+                            # A página mudou com o clique: sonda o menu de novo
+                            visible_menus = self.visible_selectors(self.MENU_SELECTORS)
                     except:
                         continue
 
@@ -106,42 +155,16 @@ class AtestadosFlow(BaseFlow):
             # Aguarda página carregar completamente
             self.page.wait_for_load_state("networkidle")
 
-            # Selectors comuns para input de arquivo
-            file_input_selectors = [
-                'input[type="file"]',
-                'input[name="arquivo"]',
-                'input[name="documento"]',
-                'input[name="atestado"]',
-                'input[accept*="pdf"]',
-                'input[accept*="image"]',
-                '#file-upload',
-                '.file-input'
-            ]
-
             # Procura pelo campo de upload
-            file_input = None
-            for selector in file_input_selectors:
-                try:
-                    locator = self.page.locator(selector)
-                    if locator.count() > 0:
-                        file_input = locator.first
-                        break
-                except:
-                    continue
+            file_input_selector = self.resolve_selector('file_input', self.FILE_INPUT_SELECTORS, require_visible=False)
+            file_input = self.page.locator(file_input_selector).first if file_input_selector else None
 
             if not file_input:
                 # Tenta encontrar botões de upload que abrem dialog
-                upload_buttons = [
-                    'button:has-text("Upload")',
-                    'button:has-text("Escolher")',
-                    'button:has-text("Selecionar")',
-                    '.upload-button',
-                    '.btn-upload'
-                ]
-
-                for button_selector in upload_buttons:
+                visible_buttons = self.visible_selectors(self.UPLOAD_BUTTON_SELECTORS)
+                for button_selector in self.UPLOAD_BUTTON_SELECTORS:
                     try:
-                        if self.page.locator(button_selector).is_visible():
+                        if button_selector in visible_buttons:
                             # Configura listener para file chooser
                             with self.page.expect_file_chooser() as fc_info:
                                 self.page.click(button_selector)
@@ -154,36 +177,24 @@ class AtestadosFlow(BaseFlow):
                 # Upload direto via input file
                 file_input.set_input_files(file_path)
 
-            # Aguarda um pouco para o arquivo ser processado
-            self.page.wait_for_timeout(2000)
+            # Aguarda o arquivo ser anexado/processado (evento, não pausa fixa)
+            self.wait_for_file_ready()
 
-            # Procura e clica no botão de enviar/salvar
-            submit_selectors = [
-                'button[type="submit"]',
-                'input[type="submit"]',
-                'button:has-text("Enviar")',
-                'button:has-text("Salvar")',
-                'button:has-text("Upload")',
-                '.btn-submit',
-                '.btn-save',
-                '#submit-button'
-            ]
+            # Registra as respostas do envio antes do clique
+            self.arm_confirmation()
 
+            # Procura e clica no botão de enviar/salvar
+            submit_selector = self.resolve_selector('submit', self.SUBMIT_SELECTORS)
             submit_clicked = False
-            for selector in submit_selectors:
-                try:
-                    if self.page.locator(selector).is_visible():
-                        self.page.click(selector)
-                        submit_clicked = True
-                        break
-                except:
-                    continue
+            if submit_selector:
+                self.page.click(submit_selector)
+                submit_clicked = True
 
             if not submit_clicked:
                 logger.warning("Botão de envio não encontrado, assumindo upload automático")
 
             # Aguarda confirmação
-            if self.wait_for_upload_completion():
+            if self.wait_for_upload_completion(timeout=self.UPLOAD_TIMEOUT_MS):
                 logger.info(f"Upload do atestado concluído: {file_path}")
                 return True
             else:
@@ -205,15 +216,7 @@ class AtestadosFlow(BaseFlow):
                 'input[name="descricao"]': 'Upload automático via bot'
             }
 
-            for selector, value in fields.items():
-                try:
-                    if self.page.locator(selector).is_visible():
-                        if selector.startswith('select'):
-                            self.page.select_option(selector, value)
-                        else:
-                            self.page.fill(selector, value)
-                except:
-                    continue
+            self.fill_fields(fields)
 
             return True
 
@@ -5,28 +5,147 @@ Classe base para fluxos de upload de documentos
 import os
 import logging
 from abc import ABC, abstractmethod
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Callable, List
+from fnmatch import fnmatch
 from playwright.sync_api import Page, Browser, expect
 from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
-import time
 from datetime import datetime
 
+from resource_policy import ResourceInterceptor
+from navigation_cache import get_navigation_cache
+from selector_cache import get_selector_cache, SelectorTimer
+from .flow_logic import (FILE_READY_JS, CONFIRMATION_JS, PROBE_JS, FILL_JS, ConfirmationRace,
+                         parse_save_response, probe_result, pick_selector, is_login_url,
+                         has_page_keywords, unfilled_fields, confirmation_arg,
+                         wants_response_body, file_result)
+
 logger = logging.getLogger(__name__)
 
 
 class BaseFlow(ABC):
-    """Classe abstrata base para fluxos de upload"""
-
-    def __init__(self, browser: Browser):
+    """Classe abstrata base para fluxos de upload
+
+    Quando recebe `page`, o fluxo roda na sessão já autenticada do worker:
+    só faz login se a página ainda não passou pelo login ou se o site
+    redirecionou para /login (sessão expirada), e não fecha a página ao final.
+
+    `refresh_session`, se informado, é chamado quando a sessão expira e deve
+    devolver uma página com a sessão renovada centralmente (ou None para
+    o fluxo fazer o próprio login).
+    """
+
+    # Campos de login (adaptável a diferentes estruturas)
+    EMAIL_SELECTORS = [
+        '#usuario',
+        'input[name="email"]',
+        'input[name="username"]',
+        '#email',
+        '#username',
+        'input[type="email"]'
+    ]
+
+    PASSWORD_SELECTORS = [
+        'input[name="password"]',
+        '#password',
+        'input[type="password"]'
+    ]
+
+    # Botões de login
+    LOGIN_BUTTON_SELECTORS = [
+        'button[type="submit"]',
+        'input[type="submit"]',
+        'button:has-text("Login")',
+        'button:has-text("Entrar")',
+        '.btn-login',
+        '#login-button'
+    ]
+
+    # Indicadores de upload concluído
+    SUCCESS_INDICATORS = [
+        '.alert-success',
+        '.success-message',
+        '[class*="success"]',
+        'text="Upload realizado com sucesso"',
+        'text="Arquivo enviado"',
+        'text="Documento salvo"'
+    ]
+
+    # Indicadores de erro após o envio
+    ERROR_INDICATORS = [
+        '.alert-danger',
+        '.error-message',
+        '[class*="error"]',
+        'text="Erro"',
+        'text="Falha"'
+    ]
+
+    # Padrões dos fluxos (sobrescritos em cada fluxo concreto)
+    UPLOAD_PATHS: List[str] = []
+    PAGE_KEYWORDS: List[str] = []
+    MENU_SELECTORS: List[str] = []
+    NEW_BUTTON_SELECTORS: List[str] = []
+    FILE_INPUT_SELECTORS: List[str] = ['input[type="file"]']
+    UPLOAD_BUTTON_SELECTORS: List[str] = []
+    SUBMIT_SELECTORS: List[str] = ['button[type="submit"]', 'input[type="submit"]']
+    REQUIRED_FIELDS: Dict[str, str] = {}
+    ADDITIONAL_FIELDS: Dict[str, str] = {}
+    # Falha o envio se algum campo de fields_for não for preenchido
+    # (padrão: campos ausentes ou ocultos são ignorados)
+    REQUIRE_ALL_FIELDS = False
+
+    # Formulário em modal na própria página (GED): botão que abre o modal,
+    # elemento que indica o modal pronto e botões que fecham o alerta final.
+    # Com FORM_OPEN_SELECTOR a página de upload não é recarregada entre arquivos
+    FORM_OPEN_SELECTOR: Optional[str] = None
+    FORM_READY_SELECTOR: Optional[str] = None
+    DISMISS_SELECTORS: List[str] = []
+    # Indicadores (CSS puro) de que o site ainda processa o arquivo anexado
+    UPLOAD_BUSY_SELECTORS: List[str] = ['.uploading', '.upload-progress', '[aria-busy="true"]']
+    FILE_SETTLE_MS = 2000  # limite para o arquivo ficar pronto, não uma pausa fixa
+    UPLOAD_TIMEOUT_MS = 30000
+    CONFIRMATION_POLL_MS = 250  # fatia de cada espera pelos indicadores
+    RESPONSE_GRACE_MS = 1500  # após a resposta de sucesso, espera por um erro na tela que a contradiga
+    # URL da requisição de salvamento do formulário (globs, como em
+    # BLOCKED_URL_PATTERNS). Vazio: nenhuma resposta é tratada como o
+    # salvamento e só os indicadores da tela confirmam o envio
+    SAVE_URL_PATTERNS: List[str] = []
+    # Envio direto por HTTP (--engine http): página de onde vem o token CSRF
+    # (padrão: UPLOAD_PATHS[0]) e prefixo das variáveis de ambiente com o
+    # caminho do POST de salvamento e o nome do campo do arquivo
+    # (<prefixo>_HTTP_SAVE_PATH e <prefixo>_HTTP_FILE_FIELD, lidas pelo
+    # HttpUploadClient). Sem as duas o fluxo usa sempre o navegador
+    HTTP_FORM_PATH: Optional[str] = None
+    HTTP_ENV_PREFIX: Optional[str] = None
+
+    # Regras de bloqueio de recursos somadas à política padrão (resource_policy)
+    BLOCKED_RESOURCE_TYPES: List[str] = []
+    ALLOWED_RESOURCE_TYPES: List[str] = []
+    BLOCKED_URL_PATTERNS: List[str] = []
+    ALLOWED_URL_PATTERNS: List[str] = []
+
+    def __init__(self, browser: Browser, page: Optional[Page] = None,
+                 refresh_session: Optional[Callable[[], Optional[Page]]] = None):
         self.browser = browser
-        self.page: Optional[Page] = None
+        self.page: Optional[Page] = page
+        self.owns_page = page is None
+        self.refresh_session = refresh_session
         self.site_user = os.getenv('SITE_USER')
         self.site_pass = os.getenv('SITE_PASS')
         self.base_url = os.getenv('SITE_BASE_URL', 'https://example.com')
+        self.submit_responses: List[Any] = []
+        self.response_listener: Optional[Callable] = None
+        self.confirmation_signal: Optional[str] = None
+        self.server_document_id: Optional[str] = None
+
+    @classmethod
+    def fields_for(cls, file_path: str) -> Dict[str, str]:
+        """Campos obrigatórios do formulário para o arquivo (padrão: REQUIRED_FIELDS fixos)"""
+        return cls.REQUIRED_FIELDS
 
     def create_page(self) -> Page:
         """Cria uma nova página no navegador"""
         self.page = self.browser.new_page()
+        ResourceInterceptor().use(type(self)).install(self.page)
 
         # Configurações da página
         self.page.set_viewport_size({"width": 1920, "height": 1080})
@@ -48,73 +167,25 @@ class BaseFlow(ABC):
             self.page.goto(f"{self.base_url}/login", wait_until="networkidle")
 
             # Aguarda elementos de login
-            self.page.wait_for_selector('input[name="email"], input[name="username"], #email, #username', timeout=10000)
-
-            # Preenche credenciais (adaptável a diferentes estruturas)
-            email_selectors = [
-                'input[name="email"]',
-                'input[name="username"]',
-                '#email',
-                '#username',
-                'input[type="email"]'
-            ]
-
-            password_selectors = [
-                'input[name="password"]',
-                '#password',
-                'input[type="password"]'
-            ]
+            self.page.wait_for_selector(', '.join(self.EMAIL_SELECTORS), timeout=10000)
 
             # Tenta encontrar e preencher campo de email/username
-            email_filled = False
-            for selector in email_selectors:
-                try:
-                    if self.page.locator(selector).is_visible():
-                        self.page.fill(selector, self.site_user)
-                        email_filled = True
-                        break
-                except:
-                    continue
-
-            if not email_filled:
+            email_selector = self.resolve_selector('email', self.EMAIL_SELECTORS)
+            if not email_selector:
                 raise Exception("Campo de email/username não encontrado")
+            self.page.fill(email_selector, self.site_user)
 
             # Tenta encontrar e preencher campo de senha
-            password_filled = False
-            for selector in password_selectors:
-                try:
-                    if self.page.locator(selector).is_visible():
-                        self.page.fill(selector, self.site_pass)
-                        password_filled = True
-                        break
-                except:
-                    continue
-
-            if not password_filled:
+            password_selector = self.resolve_selector('password', self.PASSWORD_SELECTORS)
+            if not password_selector:
                 raise Exception("Campo de senha não encontrado")
+            self.page.fill(password_selector, self.site_pass)
 
             # Clica no botão de login
-            login_buttons = [
-                'button[type="submit"]',
-                'input[type="submit"]',
-                'button:has-text("Login")',
-                'button:has-text("Entrar")',
-                '.btn-login',
-                '#login-button'
-            ]
-
-            login_clicked = False
-            for selector in login_buttons:
-                try:
-                    if self.page.locator(selector).is_visible():
-                        self.page.click(selector)
-                        login_clicked = True
-                        break
-                except:
-                    continue
-
-            if not login_clicked:
+            login_selector = self.resolve_selector('login_button', self.LOGIN_BUTTON_SELECTORS)
+            if not login_selector:
                 raise Exception("Botão de login não encontrado")
+            self.page.click(login_selector)
 
             # Aguarda redirecionamento ou elemento que confirma login
             self.page.wait_for_load_state("networkidle")
@@ -133,6 +204,119 @@ class BaseFlow(ABC):
             self.take_screenshot("login_error")
             return False
 
+    def probe_selectors(self, selectors: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Quantidade e visibilidade de cada seletor com um único page.evaluate
+
+        Seletores que o PROBE_JS não entende são consultados pelo locator do
+        Playwright. `visible` segue o is_visible() do locator: exige um único
+        elemento correspondente, visível.
+        """
+        selectors = list(selectors)
+        try:
+            results = self.page.evaluate(PROBE_JS, selectors)
+        except Exception as e:
+            logger.debug(f"Sonda de seletores falhou, usando locators: {e}")
+            results = [None] * len(selectors)
+
+        probed = {}
+        for selector, result in zip(selectors, results):
+            if result is None:
+                try:
+                    locator = self.page.locator(selector)
+                    count = locator.count()
+                    result = {'count': count, 'visible': count == 1 and locator.is_visible()}
+                except Exception:
+                    result = {'count': 0, 'visible': False}
+            else:
+                result = probe_result(result)
+            probed[selector] = result
+        return probed
+
+    def visible_selectors(self, selectors: List[str]) -> List[str]:
+        """Seletores visíveis, na ordem da lista (uma sonda só)"""
+        probed = self.probe_selectors(selectors)
+        return [selector for selector in selectors if probed[selector]['visible']]
+
+    def fill_fields(self, fields: Dict[str, str]) -> Dict[str, str]:
+        """Preenche os campos visíveis de uma vez (FILL_JS) e retorna o status de cada um
+
+        Campos ausentes ou ocultos são ignorados, como antes. Seletores que
+        não são CSS são preenchidos pela API do Playwright.
+        """
+        if not fields:
+            return {}
+
+        try:
+            results = self.page.evaluate(FILL_JS, fields)
+        except Exception as e:
+            logger.debug(f"Preenchimento em lote falhou, usando a API do Playwright: {e}")
+            results = {selector: 'unsupported' for selector in fields}
+
+        for selector, status in results.items():
+            if status != 'unsupported':
+                continue
+            try:
+                if not self.page.locator(selector).is_visible():
+                    results[selector] = 'hidden'
+                elif selector.startswith('select'):
+                    self.page.select_option(selector, fields[selector])
+                    results[selector] = 'filled'
+                else:
+                    self.page.fill(selector, fields[selector])
+                    results[selector] = 'filled'
+            except Exception:
+                results[selector] = 'error'
+
+        skipped = unfilled_fields(results)
+        logger.debug(f"Campos preenchidos: {len(results) - len(skipped)}/{len(results)}, ignorados: {skipped}")
+        return results
+
+    def resolve_selector(self, role: str, selectors: List[str], require_visible: bool = True) -> Optional[str]:
+        """Primeiro seletor da lista presente na página, começando pelo vencedor em cache
+
+        `role` identifica o elemento ('email', 'file_input', 'submit'...) no
+        cache por (site, fluxo, papel). Com require_visible=False basta o
+        elemento existir (inputs de arquivo costumam ficar ocultos). Todos os
+        candidatos são verificados numa única sonda (probe_selectors).
+        """
+        cache = get_selector_cache()
+        flow_name = type(self).__name__
+        timer = SelectorTimer(cache, self.base_url, flow_name, role)
+
+        candidates = cache.candidates(self.base_url, flow_name, role, selectors)
+        probed = self.probe_selectors(candidates)
+        timer.checks += 1
+        return timer.done(pick_selector(candidates, probed, require_visible))
+
+    def is_login_page(self) -> bool:
+        """Indica se a página está na tela de login (sessão inexistente ou expirada)"""
+        return is_login_url(self.page.url)
+
+    def ensure_authenticated(self) -> bool:
+        """Faz login apenas se a sessão da página ainda não está autenticada"""
+        if not self.page:
+            self.create_page()
+
+        if self.page.url in ('', 'about:blank'):
+            return self.login()
+        if self.is_login_page():
+            return self.reauthenticate()
+
+        logger.debug("Sessão já autenticada, login dispensado")
+        return True
+
+    def reauthenticate(self) -> bool:
+        """Renova uma sessão expirada (centralmente, se possível, senão com login próprio)"""
+        if self.refresh_session:
+            page = self.refresh_session()
+            if page is not None:
+                self.page = page
+                if not self.is_login_page():
+                    logger.info("Sessão renovada pelo controller")
+                    return True
+
+        return self.login()
+
     def take_screenshot(self, name: str):
         """Captura screenshot para debug"""
         if self.page:
@@ -144,58 +328,151 @@ class BaseFlow(ABC):
             except Exception as e:
                 logger.warning(f"Erro ao capturar screenshot: {e}")
 
-    def wait_for_upload_completion(self, timeout: int = 30000) -> bool:
-        """Aguarda confirmação de upload (implementação genérica)"""
+    def wait_for_file_ready(self) -> bool:
+        """Aguarda o arquivo anexado ficar pronto (no máximo FILE_SETTLE_MS)
+
+        Retorna assim que o input tem o arquivo e nenhum indicador de
+        processamento está visível; no limite segue adiante como antes.
+        """
         try:
-            # Aguarda possíveis indicadores de sucesso
-            success_indicators = [
-                '.alert-success',
-                '.success-message',
-                '[class*="success"]',
-                'text="Upload realizado com sucesso"',
-                'text="Arquivo enviado"',
-                'text="Documento salvo"'
-            ]
-
-            for indicator in success_indicators:
-                try:
-                    self.page.wait_for_selector(indicator, timeout=5000)
-                    logger.info(f"Upload confirmado via: {indicator}")
+            self.page.wait_for_function(FILE_READY_JS, arg=self.UPLOAD_BUSY_SELECTORS,
+                                        timeout=self.FILE_SETTLE_MS)
+            return True
+        except PlaywrightTimeoutError:
+            logger.debug(f"Arquivo não confirmado em {self.FILE_SETTLE_MS}ms, seguindo com o envio")
+            return False
+
+    def navigate_cached(self) -> bool:
+        """Vai direto ao destino de upload aprendido em execuções anteriores
+
+        Retorna False se não há destino guardado ou se ele não funcionou
+        (a entrada é descartada e o fluxo testa as candidatas).
+        """
+        cache = get_navigation_cache()
+        flow_name = type(self).__name__
+        entry = cache.lookup(flow_name, self.base_url)
+        if not entry:
+            return False
+
+        try:
+            if entry.get('path'):
+                url = f"{self.base_url}{entry['path']}"
+                self.page.goto(url, wait_until="networkidle", timeout=10000)
+                if has_page_keywords(self.page.content(), self.PAGE_KEYWORDS):
+                    logger.info(f"Página de upload (cache): {url}")
                     return True
-                except PlaywrightTimeoutError:
-                    continue
+            elif entry.get('menu'):
+                menu_selector, new_selector = entry['menu']
+                self.page.goto(self.base_url, wait_until="networkidle", timeout=10000)
+                self.page.click(menu_selector, timeout=5000)
+                self.page.wait_for_load_state("networkidle")
+                self.page.click(new_selector, timeout=5000)
+                self.page.wait_for_load_state("networkidle")
+                logger.info(f"Página de upload (cache): menu {menu_selector} > {new_selector}")
+                return True
+        except Exception as e:
+            logger.debug(f"Destino em cache falhou: {e}")
 
-            # Se não encontrou indicadores específicos, aguarda stabilização da página
-            self.page.wait_for_load_state("networkidle", timeout=timeout)
+        cache.invalidate(flow_name, self.base_url)
+        return False
 
-            # Verifica se não há mensagens de erro
-            error_indicators = [
-                '.alert-danger',
-                '.error-message',
-                '[class*="error"]',
-                'text="Erro"',
-                'text="Falha"'
-            ]
+    def remember_navigation(self, path: Optional[str] = None, menu: Optional[List[str]] = None):
+        """Guarda no cache de navegação o destino que funcionou"""
+        get_navigation_cache().remember(type(self).__name__, self.base_url, path, menu)
+
+    @classmethod
+    def is_save_request(cls, method: str, url: str) -> bool:
+        """Indica se a requisição é o salvamento do formulário (POST/PUT em SAVE_URL_PATTERNS)"""
+        if method not in ('POST', 'PUT') or not cls.SAVE_URL_PATTERNS:
+            return False
+        return any(fnmatch(url, pattern) for pattern in cls.SAVE_URL_PATTERNS)
+
+    def arm_confirmation(self):
+        """Passa a registrar as respostas de envio (chamar antes de clicar em enviar)
+
+        Só conta as requisições de salvamento (is_save_request), ignorando os
+        GETs de assets e polling. Os alertas já visíveis são marcados como
+        antigos para não confirmarem este envio.
+        """
+        self.disarm_confirmation()
+        self.submit_responses = []
+        self.confirmation_signal = None
+        self.server_document_id = None
+
+        try:
+            self.page.evaluate(CONFIRMATION_JS, confirmation_arg(type(self), mark=True))
+        except Exception as e:
+            logger.debug(f"Não foi possível marcar alertas antigos: {e}")
+
+        def on_response(response):
+            if self.is_save_request(response.request.method, response.url):
+                self.submit_responses.append(response)
+
+        self.response_listener = on_response
+        self.page.on('response', on_response)
+
+    def disarm_confirmation(self):
+        if self.response_listener and self.page:
+            try:
+                self.page.remove_listener('response', self.response_listener)
+            except Exception:
+                pass
+        self.response_listener = None
+
+    def read_save_response(self, response) -> Dict[str, Any]:
+        """parse_save_response() de uma resposta do Playwright (lê o corpo só se for JSON)"""
+        body = None
+        if wants_response_body(response.status, response.headers):
+            try:
+                body = response.text()
+            except Exception as e:
+                logger.debug(f"Corpo da resposta de salvamento indisponível: {e}")
+        return parse_save_response(response.status, response.headers, body)
+
+    def wait_for_upload_completion(self, timeout: int = 30000) -> bool:
+        """Aguarda a confirmação do upload disputando todos os sinais ao mesmo tempo
+
+        Em cada fatia de CONFIRMATION_POLL_MS repassa à ConfirmationRace as
+        respostas de salvamento registradas por arm_confirmation() e a sonda
+        dos indicadores de sucesso e de erro (CONFIRMATION_JS); as regras da
+        disputa estão lá. Sem SAVE_URL_PATTERNS nenhuma resposta é lida. O
+        sinal vencedor fica em self.confirmation_signal e o id do documento
+        (se o servidor informou) em self.server_document_id.
+        """
+        arg = confirmation_arg(type(self))
+        race = ConfirmationRace(timeout, self.RESPONSE_GRACE_MS)
+
+        try:
+            while race.running():
+                for response in race.unread(self.submit_responses):
+                    race.add_response(response.status, response.url, self.read_save_response(response))
 
-            for indicator in error_indicators:
                 try:
-                    if self.page.locator(indicator).is_visible():
-                        error_text = self.page.locator(indicator).text_content()
-                        raise Exception(f"Erro detectado: {error_text}")
+                    found = self.page.wait_for_function(
+                        CONFIRMATION_JS, arg=arg, timeout=self.CONFIRMATION_POLL_MS
+                    ).json_value()
                 except PlaywrightTimeoutError:
-                    continue
+                    found = None
 
-            logger.info("Upload aparentemente concluído")
-            return True
+                if race.add_indicator(found) or race.response_confirmed():
+                    return True
+
+            # Nenhum sinal de sucesso até o prazo: envio não confirmado (sem
+            # uma nova espera por networkidle, que só repetiria o timeout)
+            return race.expire()
 
         except Exception as e:
             logger.error(f"Erro ao aguardar confirmação de upload: {e}")
             self.take_screenshot("upload_error")
             return False
+        finally:
+            self.confirmation_signal = race.signal
+            self.server_document_id = race.document_id
+            self.disarm_confirmation()
 
     def cleanup(self):
-        """Limpa recursos da página"""
-        if self.page:
+        """Limpa recursos da página (a página da sessão do worker é mantida)"""
+        if self.page and self.owns_page:
             try:
                 self.page.close()
             except:
@@ -213,7 +490,7 @@ class BaseFlow(ABC):
         pass
 
     def process_file(self, file_path: str) -> Dict[str, Any]:
-        """Processa um arquivo completo (login + navegação + upload)"""
+        """Processa um arquivo completo (login se necessário + navegação + upload)"""
         try:
             logger.info(f"Iniciando processamento do arquivo: {file_path}")
 
@@ -221,8 +498,8 @@ class BaseFlow(ABC):
             if not self.page:
                 self.create_page()
 
-            # Realiza login
-            if not self.login():
+            # Realiza login (só se a sessão não estiver autenticada)
+            if not self.ensure_authenticated():
                 return {
                     'success': False,
                     'error': 'Falha no login'
@@ -230,23 +507,25 @@ class BaseFlow(ABC):
 
             # Navega para página de upload
             if not self.navigate_to_upload_page():
-                return {
-                    'success': False,
-                    'error': 'Falha ao navegar para página de upload'
-                }
+                # Redirecionado para /login: sessão expirou, refaz login uma vez
+                if not self.is_login_page():
+                    return {
+                        'success': False,
+                        'error': 'Falha ao navegar para página de upload'
+                    }
+
+                logger.info("Sessão expirada, refazendo login")
+                if not self.reauthenticate() or not self.navigate_to_upload_page():
+                    return {
+                        'success': False,
+                        'error': 'Falha ao navegar para página de upload após novo login'
+                    }
 
             # Realiza upload
-            if not self.upload_file(file_path):
-                return {
-                    'success': False,
-                    'error': 'Falha no upload do arquivo'
-                }
-
-            logger.info(f"Arquivo processado com sucesso: {file_path}")
-            return {
-                'success': True,
-                'error': None
-            }
+            confirmed = self.upload_file(file_path)
+            if confirmed:
+                logger.info(f"Arquivo processado com sucesso: {file_path}")
+            return file_result(confirmed, self.confirmation_signal, self.server_document_id)
 
         except Exception as e:
             logger.error(f"Erro ao processar arquivo {file_path}: {e}")
@@ -13,29 +13,126 @@ logger = logging.getLogger(__name__)
 class ExamesFlow(BaseFlow):
     """Fluxo para upload de exames médicos"""
 
+    # Caminhos possíveis da página de upload
+    UPLOAD_PATHS = [
+        "/exames/upload",
+        "/documentos/exames",
+        "/upload/exames",
+        "/admin/exames/create",
+        "/laboratorio/exames"
+    ]
+
+    # Selectors comuns para menus de exames
+    MENU_SELECTORS = [
+        'a:has-text("Exames")',
+        'a:has-text("Laboratório")',
+        'a:has-text("Laboratorio")',
+        'a:has-text("Resultados")',
+        'a[href*="exame"]',
+        'a[href*="laboratorio"]',
+        '.menu-item:has-text("Exames")',
+        'nav a:has-text("Exames")'
+    ]
+
+    # Links de "Novo"/"Upload" na listagem aberta pelo menu
+    NEW_BUTTON_SELECTORS = [
+        'a:has-text("Novo")',
+        'a:has-text("Upload")',
+        'a:has-text("Adicionar")',
+        'a:has-text("Novo Exame")',
+        'a:has-text("Cadastrar")',
+        'button:has-text("Novo")',
+        '.btn-new',
+        '.btn-upload'
+    ]
+
+    # Selectors comuns para input de arquivo
+    FILE_INPUT_SELECTORS = [
+        'input[type="file"]',
+        'input[name="arquivo"]',
+        'input[name="documento"]',
+        'input[name="exame"]',
+        'input[name="resultado"]',
+        'input[name="laudo"]',
+        'input[accept*="pdf"]',
+        'input[accept*="image"]',
+        '#file-upload',
+        '#exame-upload',
+        '#resultado-upload',
+        '.file-input'
+    ]
+
+    # Botões de upload que abrem o seletor de arquivos
+    UPLOAD_BUTTON_SELECTORS = [
+        'button:has-text("Upload")',
+        'button:has-text("Escolher")',
+        'button:has-text("Selecionar")',
+        'button:has-text("Anexar")',
+        'button:has-text("Resultado")',
+        '.upload-button',
+        '.btn-upload',
+        '.btn-anexar',
+        '.btn-resultado'
+    ]
+
+    # Botões de envio/salvamento do formulário
+    SUBMIT_SELECTORS = [
+        'button[type="submit"]',
+        'input[type="submit"]',
+        'button:has-text("Enviar")',
+        'button:has-text("Salvar")',
+        'button:has-text("Gravar")',
+        'button:has-text("Confirmar")',
+        'button:has-text("Processar")',
+        '.btn-submit',
+        '.btn-save',
+        '.btn-confirmar',
+        '.btn-processar',
+        '#submit-button'
+    ]
+
+    # Campos que podem ser obrigatórios para exames
+    REQUIRED_FIELDS = {
+        'input[name="paciente"]': 'Paciente Anônimo',
+        'input[name="medico_solicitante"]': 'Dr. Sistema',
+        'select[name="tipo_exame"]': 'laboratorio',
+        'input[name="data_coleta"]': '2024-01-01',
+        'input[name="codigo_exame"]': 'AUTO001'
+    }
+
+    # Campos específicos para exames
+    ADDITIONAL_FIELDS = {
+        'input[name="tipo_documento"]': 'Resultado de Exame',
+        'select[name="categoria"]': 'exame',
+        'select[name="status"]': 'finalizado',
+        'input[name="descricao"]': 'Upload automático de resultado via bot',
+        'textarea[name="observacoes"]': 'Resultado carregado automaticamente pelo sistema',
+        'input[name="laboratorio"]': 'Laboratório Externo'
+    }
+
+    # Textos que confirmam que a página de upload foi aberta
+    PAGE_KEYWORDS = ['exame', 'laboratorio', 'upload', 'documento']
+
     def navigate_to_upload_page(self) -> bool:
         """Navega para a página de upload de exames"""
         try:
             logger.info("Navegando para página de upload de exames")
 
-            # URLs possíveis para exames
-            exames_urls = [
-                f"{self.base_url}/exames/upload",
-                f"{self.base_url}/documentos/exames",
-                f"{self.base_url}/upload/exames",
-                f"{self.base_url}/admin/exames/create",
-                f"{self.base_url}/laboratorio/exames"
-            ]
+            # Destino aprendido em execuções anteriores
+            if self.navigate_cached():
+                return True
 
             # Tenta navegar para página de exames
             navigation_success = False
-            for url in exames_urls:
+            for path in self.UPLOAD_PATHS:
+                url = f"{self.base_url}{path}"
                 try:
                     self.page.goto(url, wait_until="networkidle", timeout=10000)
 
                     # Verifica se chegou na página correta
-                    if any(text in self.page.content().lower() for text in ['exame', 'laboratorio', 'upload', 'documento']):
+                    if any(text in self.page.content().lower() for text in self.PAGE_KEYWORDS):
                         navigation_success = True
+                        self.remember_navigation(path=path)
                         logger.info(f"Página de exames encontrada: {url}")
                         break
                 except:
@@ -45,48 +142,31 @@ class ExamesFlow(BaseFlow):
             if not navigation_success:
                 logger.info("Tentando navegar via menu")
 
-                # Selectors comuns para menus de exames
-                menu_selectors = [
-                    'a:has-text("Exames")',
-                    'a:has-text("Laboratório")',
-                    'a:has-text("Laboratorio")',
-                    'a:has-text("Resultados")',
-                    'a[href*="exame"]',
-                    'a[href*="laboratorio"]',
-                    '.menu-item:has-text("Exames")',
-                    'nav a:has-text("Exames")'
-                ]
-
-                for selector in menu_selectors:
+                visible_menus = self.visible_selectors(self.MENU_SELECTORS)
+                for selector in self.MENU_SELECTORS:
                     try:
-                        if self.page.locator(selector).is_visible():
+                        if selector in visible_menus:
                             self.page.click(selector)
                             self.page.wait_for_load_state("networkidle")
 
                             # Procura por link de "Novo" ou "Upload"
-                            upload_selectors = [
-                                'a:has-text("Novo")',
-                                'a:has-text("Upload")',
-                                'a:has-text("Adicionar")',
-                                'a:has-text("Novo Exame")',
-                                'a:has-text("Cadastrar")',
-                                'button:has-text("Novo")',
-                                '.btn-new',
-                                '.btn-upload'
-                            ]
-
-                            for upload_selector in upload_selectors:
+                            visible_new_buttons = self.visible_selectors(self.NEW_BUTTON_SELECTORS)
+                            for upload_selector in self.NEW_BUTTON_SELECTORS:
                                 try:
-                                    if self.page.locator(upload_selector).is_visible():
+                                    if upload_selector in visible_new_buttons:
                                         self.page.click(upload_selector)
                                         self.page.wait_for_load_state("networkidle")
                                         navigation_success = True
+                                        self.remember_navigation(menu=[selector, upload_selector])
                                         break
                                 except:
                                     continue
 
                             if navigation_success:
                                 break
+
+                            # A página mudou com o clique: sonda o menu de novo
+                            visible_menus = self.visible_selectors(self.MENU_SELECTORS)
                     except:
                         continue
 
@@ -114,50 +194,16 @@ class ExamesFlow(BaseFlow):
             # Preenche campos obrigatórios antes do upload
             self.fill_required_fields()
 
-            # Selectors comuns para input de arquivo
-            file_input_selectors = [
-                'input[type="file"]',
-                'input[name="arquivo"]',
-                'input[name="documento"]',
-                'input[name="exame"]',
-                'input[name="resultado"]',
-                'input[name="laudo"]',
-                'input[accept*="pdf"]',
-                'input[accept*="image"]',
-                '#file-upload',
-                '#exame-upload',
-                '#resultado-upload',
-                '.file-input'
-            ]
-
             # Procura pelo campo de upload
-            file_input = None
-            for selector in file_input_selectors:
-                try:
-                    locator = self.page.locator(selector)
-                    if locator.count() > 0:
-                        file_input = locator.first
-                        break
-                except:
-                    continue
+            file_input_selector = self.resolve_selector('file_input', self.FILE_INPUT_SELECTORS, require_visible=False)
+            file_input = self.page.locator(file_input_selector).first if file_input_selector else None
 
             if not file_input:
                 # Tenta encontrar botões de upload que abrem dialog
-                upload_buttons = [
-                    'button:has-text("Upload")',
-                    'button:has-text("Escolher")',
-                    'button:has-text("Selecionar")',
-                    'button:has-text("Anexar")',
-                    'button:has-text("Resultado")',
-                    '.upload-button',
-                    '.btn-upload',
-                    '.btn-anexar',
-                    '.btn-resultado'
-                ]
-
-                for button_selector in upload_buttons:
+                visible_buttons = self.visible_selectors(self.UPLOAD_BUTTON_SELECTORS)
+                for button_selector in self.UPLOAD_BUTTON_SELECTORS:
                     try:
-                        if self.page.locator(button_selector).is_visible():
+                        if button_selector in visible_buttons:
                             # Configura listener para file chooser
                             with self.page.expect_file_chooser() as fc_info:
                                 self.page.click(button_selector)
@@ -170,43 +216,27 @@ class ExamesFlow(BaseFlow):
                 # Upload direto via input file
                 file_input.set_input_files(file_path)
 
-            # Aguarda processamento do arquivo
-            self.page.wait_for_timeout(2000)
+            # Aguarda o arquivo ser anexado/processado (evento, não pausa fixa)
+            self.wait_for_file_ready()
 
             # Preenche campos adicionais após upload
             self.fill_additional_fields()
 
-            # Procura e clica no botão de enviar/salvar
-            submit_selectors = [
-                'button[type="submit"]',
-                'input[type="submit"]',
-                'button:has-text("Enviar")',
-                'button:has-text("Salvar")',
-                'button:has-text("Gravar")',
-                'button:has-text("Confirmar")',
-                'button:has-text("Processar")',
-                '.btn-submit',
-                '.btn-save',
-                '.btn-confirmar',
-                '.btn-processar',
-                '#submit-button'
-            ]
+            # Registra as respostas do envio antes do clique
+            self.arm_confirmation()
 
+            # Procura e clica no botão de enviar/salvar
+            submit_selector = self.resolve_selector('submit', self.SUBMIT_SELECTORS)
             submit_clicked = False
-            for selector in submit_selectors:
-                try:
-                    if self.page.locator(selector).is_visible():
-                        self.page.click(selector)
-                        submit_clicked = True
-                        break
-                except:
-                    continue
+            if submit_selector:
+                self.page.click(submit_selector)
+                submit_clicked = True
 
             if not submit_clicked:
                 logger.warning("Botão de envio não encontrado, assumindo upload automático")
 
             # Aguarda confirmação
-            if self.wait_for_upload_completion(timeout=30000):
+            if self.wait_for_upload_completion(timeout=self.UPLOAD_TIMEOUT_MS):
                 logger.info(f"Upload do exame concluído: {file_path}")
                 return True
             else:
@@ -221,25 +251,7 @@ class ExamesFlow(BaseFlow):
     def fill_required_fields(self) -> bool:
         """Preenche campos obrigatórios antes do upload"""
         try:
-            # Campos que podem ser obrigatórios para exames
-            required_fields = {
-                'input[name="paciente"]': 'Paciente Anônimo',
-                'input[name="medico_solicitante"]': 'Dr. Sistema',
-                'select[name="tipo_exame"]': 'laboratorio',
-                'input[name="data_coleta"]': '2024-01-01',
-                'input[name="codigo_exame"]': 'AUTO001'
-            }
-
-            for selector, value in required_fields.items():
-                try:
-                    if self.page.locator(selector).is_visible():
-                        if selector.startswith('select'):
-                            self.page.select_option(selector, value)
-                        else:
-                            self.page.fill(selector, value)
-                        logger.debug(f"Campo obrigatório preenchido: {selector} = {value}")
-                except:
-                    continue
+            self.fill_fields(self.REQUIRED_FIELDS)
 
             return True
 
@@ -250,35 +262,7 @@ class ExamesFlow(BaseFlow):
     def fill_additional_fields(self) -> bool:
         """Preenche campos adicionais específicos para exames"""
         try:
-            # Campos específicos para exames
-            fields = {
-                'input[name="tipo_documento"]': 'Resultado de Exame',
-                'select[name="categoria"]': 'exame',
-                'select[name="status"]': 'finalizado',
-                'input[name="descricao"]': 'Upload automático de resultado via bot',
-                'textarea[name="observacoes"]': 'Resultado carregado automaticamente pelo sistema',
-                'input[name="laboratorio"]': 'Laboratório Externo'
-            }
-
-            for selector, value in fields.items():
-                try:
-                    if self.page.locator(selector).is_visible():
-                        if selector.startswith('select'):
-                            # Tenta várias opções para selects
-                            options_to_try = [value, value.lower(), value.upper()]
-                            for option in options_to_try:
-                                try:
-                                    self.page.select_option(selector, option)
-                                    break
-                                except:
-                                    continue
-                        elif selector.startswith('textarea'):
-                            self.page.fill(selector, value)
-                        else:
-                            self.page.fill(selector, value)
-                        logger.debug(f"Campo adicional preenchido: {selector}")
-                except:
-                    continue
+            self.fill_fields(self.ADDITIONAL_FIELDS)
 
             return True
 
@@ -0,0 +1,395 @@
+"""
+Lógica dos fluxos independente do engine
+
+Tudo o que os engines sync (BaseFlow) e async (AsyncFlowRunner) precisam
+decidir da mesma forma fica aqui, sem chamadas ao Playwright: os scripts
+executados na página, a interpretação das sondas e da resposta de
+salvamento e a disputa dos sinais de confirmação. Cada engine só faz a
+I/O (evaluate, clique, espera) e repassa os resultados a estas funções.
+"""
+
+import re
+import json
+import time
+import logging
+from typing import Optional, Dict, Any, List
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+
+# Arquivo pronto: algum input de arquivo já tem o arquivo (o change já foi
+# disparado) e nenhum indicador de processamento está visível
+FILE_READY_JS = """
+(busySelectors) => {
+    const attached = Array.from(document.querySelectorAll('input[type="file"]'))
+        .some(input => input.files && input.files.length > 0);
+    const busy = busySelectors.some(selector =>
+        Array.from(document.querySelectorAll(selector)).some(el => el.offsetParent !== null));
+    return attached && !busy;
+}
+"""
+
+# Primeiro indicador de sucesso ou erro visível na página (ou null). Cada
+# indicador é {css: seletor} ou {text: texto exato}, convertido de
+# SUCCESS_INDICATORS/ERROR_INDICATORS por indicator_specs(). Com mark=true
+# marca todos os indicadores já visíveis como antigos (data-bot-stale) e
+# retorna null: alertas de um envio anterior não confirmam o envio atual
+CONFIRMATION_JS = """
+({success, error, mark}) => {
+    const visible = el => el && el.offsetParent !== null;
+    const fresh = el => visible(el) && !el.hasAttribute('data-bot-stale');
+    const matchAll = spec => {
+        if (spec.css) {
+            try {
+                return Array.from(document.querySelectorAll(spec.css)).filter(visible);
+            } catch (e) {
+                return [];
+            }
+        }
+        const found = [];
+        const walker = document.createTreeWalker(document.body, NodeFilter.SHOW_TEXT);
+        for (let node = walker.nextNode(); node; node = walker.nextNode()) {
+            if (node.nodeValue.trim() === spec.text && visible(node.parentElement)) {
+                found.push(node.parentElement);
+            }
+        }
+        return found;
+    };
+    if (mark) {
+        for (const spec of [...error, ...success]) {
+            matchAll(spec).forEach(el => el.setAttribute('data-bot-stale', ''));
+        }
+        return null;
+    }
+    for (const [kind, specs] of [['error', error], ['success', success]]) {
+        for (const spec of specs) {
+            const el = matchAll(spec).find(fresh);
+            if (el) {
+                return {kind, indicator: spec.css || `text="${spec.text}"`, text: (el.innerText || '').trim().slice(0, 200)};
+            }
+        }
+    }
+    return null;
+}
+"""
+
+
+# Sonda uma lista de seletores numa única ida ao navegador. Para cada um
+# retorna {count, visible} (visibilidade do primeiro elemento) ou null se a
+# sintaxe não é suportada aqui (o chamador então usa o locator do
+# Playwright). Além de CSS, entende text="..." (exato), text=... (contém)
+# e <css>:has-text("...") (contém), escolhendo os elementos mais internos
+# como o Playwright
+PROBE_JS = """
+(selectors) => {
+    const normalize = text => (text || '').replace(/\\s+/g, ' ').trim();
+    const isVisible = el => window.getComputedStyle(el).visibility !== 'hidden'
+        && Array.from(el.getClientRects()).some(rect => rect.width > 0 && rect.height > 0);
+    const innermost = (candidates, test) => {
+        const matched = candidates.filter(el => test(normalize(el.textContent)));
+        return matched.filter(el => !matched.some(other => other !== el && el.contains(other)));
+    };
+    const find = selector => {
+        let match = selector.match(/^text=(["'])(.*)\\1$/);
+        if (match) {
+            return innermost(Array.from(document.querySelectorAll('body *')), text => text === match[2]);
+        }
+        match = selector.match(/^text=(.*)$/);
+        if (match) {
+            const needle = match[1].toLowerCase();
+            return innermost(Array.from(document.querySelectorAll('body *')), text => text.toLowerCase().includes(needle));
+        }
+        match = selector.match(/^(.*):has-text\\((["'])(.*)\\2\\)$/);
+        if (match) {
+            const needle = match[3].toLowerCase();
+            return Array.from(document.querySelectorAll(match[1] || '*'))
+                .filter(el => normalize(el.textContent).toLowerCase().includes(needle));
+        }
+        return Array.from(document.querySelectorAll(selector));
+    };
+    return selectors.map(selector => {
+        try {
+            const elements = find(selector);
+            return {count: elements.length, visible: elements.length > 0 && isVisible(elements[0])};
+        } catch (e) {
+            return null;
+        }
+    });
+}
+"""
+
+
+# Preenche vários campos numa única ida ao navegador. Recebe {seletor CSS:
+# valor} e devolve {seletor: status}, com status 'filled', 'missing',
+# 'ambiguous' (mais de um elemento), 'hidden', 'no_option' (select sem a
+# opção) ou 'unsupported' (seletor que não é CSS; o chamador usa a API do
+# Playwright). O valor é atribuído pelo setter nativo e os eventos input e
+# change são disparados, como num preenchimento feito pelo usuário
+FILL_JS = """
+(fields) => {
+    const isVisible = el => window.getComputedStyle(el).visibility !== 'hidden'
+        && Array.from(el.getClientRects()).some(rect => rect.width > 0 && rect.height > 0);
+    const setNative = (el, value) => {
+        const proto = el instanceof HTMLTextAreaElement ? HTMLTextAreaElement.prototype
+            : el instanceof HTMLSelectElement ? HTMLSelectElement.prototype : HTMLInputElement.prototype;
+        Object.getOwnPropertyDescriptor(proto, 'value').set.call(el, value);
+    };
+    const pickOption = (select, value) => {
+        const options = Array.from(select.options);
+        const lower = value.toLowerCase();
+        return options.find(o => o.value === value)
+            || options.find(o => o.label.trim() === value)
+            || options.find(o => o.value.toLowerCase() === lower || o.label.trim().toLowerCase() === lower);
+    };
+    const results = {};
+    for (const [selector, value] of Object.entries(fields)) {
+        let elements;
+        try {
+            elements = document.querySelectorAll(selector);
+        } catch (e) {
+            results[selector] = 'unsupported';
+            continue;
+        }
+        if (elements.length === 0) { results[selector] = 'missing'; continue; }
+        if (elements.length > 1) { results[selector] = 'ambiguous'; continue; }
+        const el = elements[0];
+        if (!isVisible(el)) { results[selector] = 'hidden'; continue; }
+
+        el.focus();
+        if (el instanceof HTMLSelectElement) {
+            const option = pickOption(el, value);
+            if (!option) { results[selector] = 'no_option'; continue; }
+            setNative(el, option.value);
+        } else {
+            setNative(el, value);
+        }
+        el.dispatchEvent(new Event('input', {bubbles: true}));
+        el.dispatchEvent(new Event('change', {bubbles: true}));
+        results[selector] = 'filled';
+    }
+    return results;
+}
+"""
+
+
+def indicator_specs(selectors: List[str]) -> List[Dict[str, str]]:
+    """Converte seletores do Playwright (CSS ou text="...") para o formato de CONFIRMATION_JS"""
+    specs = []
+    for selector in selectors:
+        if selector.startswith('text='):
+            specs.append({'text': selector[len('text='):].strip('"\'')})
+        else:
+            specs.append({'css': selector})
+    return specs
+
+
+# Chaves em que a resposta JSON do salvamento costuma trazer o id do documento
+DOCUMENT_ID_KEYS = ['id', 'documento_id', 'document_id', 'solicitacao_id', 'codigo']
+
+
+def _find_document_id(data: Any) -> Optional[str]:
+    """Id do documento no JSON da resposta (raiz ou data/documento/solicitacao)"""
+    if not isinstance(data, dict):
+        return None
+    for key in DOCUMENT_ID_KEYS:
+        if isinstance(data.get(key), (int, str)) and str(data[key]).strip():
+            return str(data[key]).strip()
+    for nested in ('data', 'documento', 'document', 'solicitacao'):
+        found = _find_document_id(data.get(nested))
+        if found:
+            return found
+    return None
+
+
+def parse_save_response(status: int, headers: Dict[str, str], body: Optional[str]) -> Dict[str, Any]:
+    """Interpreta a resposta da requisição de salvamento do formulário
+
+    Retorna {'outcome', 'document_id', 'detail'}, com outcome 'success',
+    'error' ou None quando a resposta sozinha não decide (por exemplo um
+    redirect de volta para a mesma página, em que o resultado vem na
+    mensagem da tela). `headers` com nomes em minúsculas, como no
+    Playwright; `body` só é lido para respostas JSON.
+    """
+    result: Dict[str, Any] = {'outcome': None, 'document_id': None, 'detail': f"HTTP {status}"}
+
+    data = None
+    if body and 'json' in headers.get('content-type', ''):
+        try:
+            data = json.loads(body)
+        except ValueError:
+            data = None
+
+    if isinstance(data, dict):
+        result['document_id'] = _find_document_id(data)
+        message = data.get('message') or data.get('mensagem') or data.get('msg')
+        errors = data.get('errors') or data.get('erros') or data.get('error') or data.get('erro')
+        if message:
+            result['detail'] = str(message)[:200]
+        flag = data.get('success', data.get('sucesso'))
+        state = str(data.get('status', '')).lower()
+
+        if status >= 400 or errors or flag is False or state in ('error', 'erro', 'fail', 'falha'):
+            result['outcome'] = 'error'
+            if errors:
+                result['detail'] = f"{message}: {errors}"[:200] if message else str(errors)[:200]
+        elif flag is True or state in ('success', 'sucesso', 'ok') or result['document_id']:
+            result['outcome'] = 'success'
+        return result
+
+    if status >= 400:
+        result['outcome'] = 'error'
+        return result
+
+    # Redirect ou 201 Created: o id costuma ser o último segmento numérico do Location
+    location_path = urlparse(headers.get('location', '')).path.rstrip('/')
+    match = re.search(r'/(\d+)$', location_path)
+    if match:
+        result['document_id'] = match.group(1)
+
+    if status in (301, 302, 303):
+        if location_path.endswith('/login'):
+            result['outcome'] = 'error'
+            result['detail'] = 'Sessão expirada (redirecionado para o login)'
+        elif result['document_id']:
+            result['outcome'] = 'success'
+    elif status == 201:
+        result['outcome'] = 'success'
+    return result
+
+
+def probe_result(result: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Resultado de PROBE_JS para um seletor: `visible` exige um único elemento, como o is_visible() do locator"""
+    return {'count': result['count'], 'visible': result['count'] == 1 and result['visible']}
+
+
+def pick_selector(candidates: List[str], probed: Dict[str, Dict[str, Any]], require_visible: bool = True) -> Optional[str]:
+    """Primeiro candidato visível (ou só presente, com require_visible=False)"""
+    for selector in candidates:
+        result = probed[selector]
+        if result['visible'] if require_visible else result['count'] > 0:
+            return selector
+    return None
+
+
+def is_login_url(url: str) -> bool:
+    """Indica se a URL é a tela de login (sessão inexistente ou expirada)"""
+    return urlparse(url).path.rstrip('/').endswith('/login')
+
+
+def is_on_path(url: str, path: str) -> bool:
+    """Indica se a URL já está na página `path` (formulário em modal reaproveitado)"""
+    return urlparse(url).path.rstrip('/').endswith(path)
+
+
+def has_page_keywords(content: str, keywords: List[str]) -> bool:
+    """Indica se o HTML da página tem algum dos PAGE_KEYWORDS do fluxo"""
+    content = content.lower()
+    return any(text in content for text in keywords)
+
+
+def unfilled_fields(results: Dict[str, str]) -> Dict[str, str]:
+    """Campos de fill_fields que não ficaram com status 'filled'"""
+    return {selector: status for selector, status in results.items() if status != 'filled'}
+
+
+def check_required_fields(flow_class, results: Dict[str, str]):
+    """Com REQUIRE_ALL_FIELDS no fluxo, falha se algum campo não foi preenchido"""
+    missing = unfilled_fields(results)
+    if missing and flow_class.REQUIRE_ALL_FIELDS:
+        raise Exception(f"Campos do formulário não preenchidos: {missing}")
+
+
+def confirmation_arg(flow_class, mark: bool = False) -> Dict[str, Any]:
+    """Argumento de CONFIRMATION_JS com os indicadores do fluxo"""
+    return {
+        'success': indicator_specs(flow_class.SUCCESS_INDICATORS),
+        'error': indicator_specs(flow_class.ERROR_INDICATORS),
+        'mark': mark
+    }
+
+
+def wants_response_body(status: int, headers: Dict[str, str]) -> bool:
+    """O corpo da resposta de salvamento só é lido se for JSON e não for redirect"""
+    return 'json' in headers.get('content-type', '') and not 300 <= status < 400
+
+
+def file_result(confirmed: bool, signal: Optional[str], document_id: Optional[str]) -> Dict[str, Any]:
+    """Resultado de process_file depois do envio (formato comum aos engines)"""
+    return {
+        'success': confirmed,
+        'error': None if confirmed else 'Falha no upload do arquivo',
+        'confirmation': signal,
+        'document_id': document_id
+    }
+
+
+class ConfirmationRace:
+    """Disputa dos sinais de confirmação de um envio
+
+    O engine, a cada fatia de CONFIRMATION_POLL_MS, repassa as respostas de
+    salvamento ainda não lidas (add_response) e o resultado da sonda de
+    CONFIRMATION_JS (add_indicator); vence o primeiro sinal decisivo:
+    - resposta de salvamento com erro (parse_save_response): falha
+    - indicador de erro novo na tela: falha
+    - indicador de sucesso novo na tela: sucesso
+    - resposta de salvamento classificada como sucesso por
+      parse_save_response, sem erro na tela em RESPONSE_GRACE_MS: sucesso
+    Respostas inconclusivas não confirmam o envio. Sem nenhum sinal de
+    sucesso até o prazo o envio conta como falha (sinal 'timeout'). As
+    recusas são exceções; o prazo esgotado não (expire devolve False). O
+    sinal vencedor fica em `signal` e o id do documento (se o servidor
+    informou) em `document_id`.
+    """
+
+    def __init__(self, timeout_ms: int, grace_ms: int):
+        self.timeout_ms = timeout_ms
+        self.deadline = time.monotonic() + timeout_ms / 1000
+        self.grace = grace_ms / 1000
+        self.signal: Optional[str] = None
+        self.document_id: Optional[str] = None
+        self.read = 0
+        self.success_status: Optional[int] = None
+        self.success_seen_at = 0.0
+
+    def running(self) -> bool:
+        return time.monotonic() < self.deadline
+
+    def unread(self, responses: List[Any]) -> List[Any]:
+        """Respostas de salvamento registradas desde a última fatia"""
+        pending = responses[self.read:]
+        self.read += len(pending)
+        return pending
+
+    def add_response(self, status: int, url: str, outcome: Dict[str, Any]):
+        self.document_id = outcome['document_id'] or self.document_id
+        if outcome['outcome'] == 'error':
+            self.signal = f"response:{status}"
+            raise Exception(f"Envio recusado pelo servidor: {outcome['detail']} em {url}")
+        if outcome['outcome'] == 'success' and self.success_status is None:
+            self.success_status, self.success_seen_at = status, time.monotonic()
+
+    def add_indicator(self, found: Optional[Dict[str, str]]) -> bool:
+        """Resultado de CONFIRMATION_JS: True se confirmou o envio"""
+        if not found:
+            return False
+        self.signal = f"{found['kind']}:{found['indicator']}"
+        if found['kind'] == 'error':
+            raise Exception(f"Erro detectado: {found['text']}")
+        logger.info(f"Upload confirmado via: {found['indicator']}")
+        return True
+
+    def response_confirmed(self) -> bool:
+        """Resposta de sucesso sem erro na tela por RESPONSE_GRACE_MS"""
+        if self.success_status is None or time.monotonic() - self.success_seen_at < self.grace:
+            return False
+        self.signal = f"response:{self.success_status}"
+        logger.info(f"Upload confirmado pela resposta do servidor (HTTP {self.success_status}, "
+                    f"documento {self.document_id or 'sem id'})")
+        return True
+
+    def expire(self) -> bool:
+        """Prazo esgotado sem sinal de sucesso: envio não confirmado"""
+        self.signal = 'timeout'
+        logger.warning(f"Nenhuma confirmação do envio em {self.timeout_ms}ms")
+        return False
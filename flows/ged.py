@@ -0,0 +1,183 @@
+"""
+Fluxo do GED (EMSERH): solicitação de documento pelo modal "Nova Solicitação"
+
+Diferente dos demais fluxos, o GED não tem uma página de upload por
+documento: a página /ged fica aberta e cada arquivo é um ciclo do modal
+(abrir, preencher, salvar, fechar o alerta). A página só é carregada na
+primeira vez; os documentos seguintes reaproveitam a mesma página sem
+nenhuma navegação.
+
+O tipo do documento vem da pasta (MAPEAMENTO_TIPOS.md): a pasta do arquivo
+(ou uma de suas pastas acima) deve ser uma das chaves de GED_DOCUMENT_TYPES.
+"""
+
+import logging
+from pathlib import Path
+from typing import Dict, Optional
+from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+from .base_flow import BaseFlow
+from .flow_logic import check_required_fields, is_on_path
+
+logger = logging.getLogger(__name__)
+
+
+# Pasta -> (valor no select tipo_documento, nome exibido)
+GED_DOCUMENT_TYPES = {
+    'POLITICAS': ('7', 'POLÍTICAS'),
+    'DIRETRIZ': ('6', 'DIRETRIZ'),
+    'FLUXOGRAMA': ('5', 'FLUXOGRAMA'),
+    'INSTRUMENTAL': ('13', 'INSTRUMENTAL'),
+    'MANUAL': ('3', 'MANUAL'),
+    'MAPEAMENTO_DE_PROCESSO': ('10', 'MAPEAMENTO DE PROCESSO'),
+    'NORMA_E_ROTINA': ('2', 'NORMA E ROTINA'),
+    'NORMA_ZERO': ('9', 'NORMA ZERO'),
+    'PLANO_DE_CONTINGENCIA': ('11', 'PLANO DE CONTINGÊNCIA'),
+    'PROCEDIMENTO_OPERACIONAL_PADRAO': ('1', 'PROCEDIMENTO OPERACIONAL PADRÃO'),
+    'PROTOCOLO': ('4', 'PROTOCOLO'),
+    'REGIMENTO': ('8', 'REGIMENTO'),
+    'REGULAMENTO': ('12', 'REGULAMENTO')
+}
+
+# Valores fixos do formulário
+GED_PUBLICO_ALVO = '2'  # PERFIL (UNIDADE)
+GED_PERFIL = '1'  # ASSISTENCIAL
+
+
+def ged_document_type(file_path: str) -> Optional[str]:
+    """Chave de GED_DOCUMENT_TYPES da pasta do arquivo (ou de uma pasta acima)"""
+    for parent in Path(file_path).parents:
+        if parent.name.upper() in GED_DOCUMENT_TYPES:
+            return parent.name.upper()
+    return None
+
+
+class GedFlow(BaseFlow):
+    """Fluxo de solicitação de documentos no GED"""
+
+    UPLOAD_PATHS = ["/ged"]
+    PAGE_KEYWORDS = ['ged', 'solicitação', 'solicitacao']
+
+    # Modal de nova solicitação
+    FORM_OPEN_SELECTOR = '#btnNovaSolicitacao'
+    FORM_READY_SELECTOR = 'input[name="titulo"], #titulo'
+    SUBMIT_SELECTORS = ['#btnModalDocumento']
+    # Solicitação incompleta não é enviada (nos dois engines)
+    REQUIRE_ALL_FIELDS = True
+    # POST do salvamento da solicitação (rota store: POST /ged); o resultado
+    # e o id vêm da resposta. Listagens e filtros em /ged/... não contam
+    SAVE_URL_PATTERNS = ['*/ged', '*/ged[?]*']
+    # Mesmo POST feito direto pelo engine http (campos de fields_for + arquivo),
+    # configurado por GED_HTTP_SAVE_PATH e GED_HTTP_FILE_FIELD
+    HTTP_ENV_PREFIX = 'GED'
+
+    # Botão OK do alerta exibido após salvar
+    DISMISS_SELECTORS = [
+        'button.confirm.btn.btn-lg.btn-primary',
+        'button:has-text("OK")',
+        'button:has-text("Ok")',
+        '.confirm'
+    ]
+
+    FILE_INPUT_SELECTORS = [
+        '#modalDocumento input[type="file"]',
+        'input[type="file"]'
+    ]
+
+    SUCCESS_INDICATORS = [
+        '.alert-success',
+        '.success',
+        'text="Sucesso"',
+        'text="Salvo"',
+        'text="Criado"'
+    ]
+
+    ERROR_INDICATORS = [
+        '.alert-danger',
+        '.error',
+        'text="Erro"',
+        'text="Falha"'
+    ]
+
+    @classmethod
+    def fields_for(cls, file_path: str) -> Dict[str, str]:
+        """Campos do modal para o arquivo (título e justificativa = nome do arquivo)"""
+        document_type = ged_document_type(file_path)
+        if not document_type:
+            raise Exception(f"Pasta sem tipo de documento do GED mapeado: {file_path}")
+
+        tipo_value, _ = GED_DOCUMENT_TYPES[document_type]
+        title = Path(file_path).stem
+        return {
+            'input[name="titulo"]': title,
+            'select[name="tipo_documento"]': tipo_value,
+            'select[name="publico_alvo"]': GED_PUBLICO_ALVO,
+            'select[name="perfil"]': GED_PERFIL,
+            'textarea[name="justificativa"]': title
+        }
+
+    def is_on_ged_page(self) -> bool:
+        return is_on_path(self.page.url, self.UPLOAD_PATHS[0])
+
+    def navigate_to_upload_page(self) -> bool:
+        """Abre /ged apenas se a página ainda não está nele (sem recarregar entre documentos)"""
+        try:
+            if self.is_on_ged_page():
+                return True
+
+            logger.info("Navegando para o GED")
+            self.page.goto(f"{self.base_url}{self.UPLOAD_PATHS[0]}", wait_until="domcontentloaded", timeout=30000)
+            self.page.locator(self.FORM_OPEN_SELECTOR).wait_for(state="visible", timeout=10000)
+            return True
+
+        except Exception as e:
+            logger.error(f"Erro ao navegar para o GED: {e}")
+            self.take_screenshot("navigation_error_ged")
+            return False
+
+    def upload_file(self, file_path: str) -> bool:
+        """Abre o modal, preenche a solicitação, anexa o arquivo e salva"""
+        try:
+            fields = self.fields_for(file_path)
+            logger.info(f"Iniciando solicitação no GED: {file_path}")
+
+            # Abre o modal e aguarda o formulário
+            self.page.click(self.FORM_OPEN_SELECTOR)
+            self.page.locator(self.FORM_READY_SELECTOR).first.wait_for(state="visible", timeout=10000)
+
+            check_required_fields(type(self), self.fill_fields(fields))
+
+            # Anexo (se o modal tiver campo de arquivo)
+            file_input_selector = self.resolve_selector('file_input', self.FILE_INPUT_SELECTORS, require_visible=False)
+            if file_input_selector:
+                self.page.locator(file_input_selector).first.set_input_files(file_path)
+                self.wait_for_file_ready()
+            else:
+                logger.warning("Modal do GED sem campo de arquivo, enviando só a solicitação")
+
+            # Salva e aguarda a confirmação
+            self.arm_confirmation()
+            self.page.click(self.SUBMIT_SELECTORS[0])
+
+            if not self.wait_for_upload_completion(timeout=self.UPLOAD_TIMEOUT_MS):
+                logger.error(f"Falha na confirmação da solicitação: {file_path}")
+                return False
+
+            self.dismiss_result()
+            logger.info(f"Solicitação no GED concluída: {file_path}")
+            return True
+
+        except Exception as e:
+            logger.error(f"Erro durante solicitação no GED: {e}")
+            self.take_screenshot("upload_error_ged")
+            return False
+
+    def dismiss_result(self):
+        """Fecha o alerta de resultado e aguarda o modal sair, mantendo a página /ged"""
+        dismiss = self.visible_selectors(self.DISMISS_SELECTORS)
+        if dismiss:
+            self.page.click(dismiss[0])
+
+        try:
+            self.page.locator(self.SUBMIT_SELECTORS[0]).wait_for(state="hidden", timeout=5000)
+        except PlaywrightTimeoutError:
+            logger.debug("Modal do GED ainda visível após salvar")
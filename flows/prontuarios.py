@@ -13,29 +13,118 @@ logger = logging.getLogger(__name__)
 class ProntuariosFlow(BaseFlow):
     """Fluxo para upload de prontuários médicos"""
 
+    # Caminhos possíveis da página de upload
+    UPLOAD_PATHS = [
+        "/prontuarios/upload",
+        "/documentos/prontuarios",
+        "/upload/prontuarios",
+        "/admin/prontuarios/create",
+        "/pacientes/prontuarios"
+    ]
+
+    # Selectors comuns para menus de prontuários
+    MENU_SELECTORS = [
+        'a:has-text("Prontuários")',
+        'a:has-text("Prontuarios")',
+        'a:has-text("Pacientes")',
+        'a[href*="prontuario"]',
+        'a[href*="paciente"]',
+        '.menu-item:has-text("Prontuários")',
+        'nav a:has-text("Prontuários")'
+    ]
+
+    # Links de "Novo"/"Upload" na listagem aberta pelo menu
+    NEW_BUTTON_SELECTORS = [
+        'a:has-text("Novo")',
+        'a:has-text("Upload")',
+        'a:has-text("Adicionar")',
+        'a:has-text("Novo Prontuário")',
+        'button:has-text("Novo")',
+        '.btn-new',
+        '.btn-upload'
+    ]
+
+    # Selectors comuns para input de arquivo
+    FILE_INPUT_SELECTORS = [
+        'input[type="file"]',
+        'input[name="arquivo"]',
+        'input[name="documento"]',
+        'input[name="prontuario"]',
+        'input[name="anexo"]',
+        'input[accept*="pdf"]',
+        'input[accept*="image"]',
+        '#file-upload',
+        '#prontuario-upload',
+        '.file-input'
+    ]
+
+    # Botões de upload que abrem o seletor de arquivos
+    UPLOAD_BUTTON_SELECTORS = [
+        'button:has-text("Upload")',
+        'button:has-text("Escolher")',
+        'button:has-text("Selecionar")',
+        'button:has-text("Anexar")',
+        '.upload-button',
+        '.btn-upload',
+        '.btn-anexar'
+    ]
+
+    # Botões de envio/salvamento do formulário
+    SUBMIT_SELECTORS = [
+        'button[type="submit"]',
+        'input[type="submit"]',
+        'button:has-text("Enviar")',
+        'button:has-text("Salvar")',
+        'button:has-text("Gravar")',
+        'button:has-text("Confirmar")',
+        '.btn-submit',
+        '.btn-save',
+        '.btn-confirmar',
+        '#submit-button'
+    ]
+
+    # Campos que podem ser obrigatórios para prontuários
+    REQUIRED_FIELDS = {
+        'input[name="paciente_nome"]': 'Paciente Anônimo',
+        'input[name="numero_prontuario"]': '000000',
+        'select[name="especialidade"]': 'geral',
+        'input[name="data_consulta"]': '2024-01-01'
+    }
+
+    # Campos específicos para prontuários
+    ADDITIONAL_FIELDS = {
+        'input[name="tipo_documento"]': 'Prontuário',
+        'select[name="categoria"]': 'prontuario',
+        'input[name="descricao"]': 'Upload automático de prontuário via bot',
+        'textarea[name="observacoes"]': 'Documento carregado automaticamente'
+    }
+
+    # Textos que confirmam que a página de upload foi aberta
+    PAGE_KEYWORDS = ['prontuário', 'prontuario', 'upload', 'documento']
+
+    FILE_SETTLE_MS = 3000
+    UPLOAD_TIMEOUT_MS = 45000  # Timeout maior para prontuários
+
     def navigate_to_upload_page(self) -> bool:
         """Navega para a página de upload de prontuários"""
         try:
             logger.info("Navegando para página de upload de prontuários")
 
-            # URLs possíveis para prontuários
-            prontuarios_urls = [
-                f"{self.base_url}/prontuarios/upload",
-                f"{self.base_url}/documentos/prontuarios",
-                f"{self.base_url}/upload/prontuarios",
-                f"{self.base_url}/admin/prontuarios/create",
-                f"{self.base_url}/pacientes/prontuarios"
-            ]
+            # Destino aprendido em execuções anteriores
+            if self.navigate_cached():
+                return True
 
             # Tenta navegar para página de prontuários
             navigation_success = False
-            for url in prontuarios_urls:
+            for path in self.UPLOAD_PATHS:
+                url = f"{self.base_url}{path}"
                 try:
                     self.page.goto(url, wait_until="networkidle", timeout=10000)
 
                     # Verifica se chegou na página correta
-                    if any(text in self.page.content().lower() for text in ['prontuário', 'prontuario', 'upload', 'documento']):
+                    if any(text in self.page.content().lower() for text in self.PAGE_KEYWORDS):
                         navigation_success = True
+                        self.remember_navigation(path=path)
                         logger.info(f"Página de prontuários encontrada: {url}")
                         break
                 except:
@@ -45,46 +134,31 @@ class ProntuariosFlow(BaseFlow):
             if not navigation_success:
                 logger.info("Tentando navegar via menu")
 
-                # Selectors comuns para menus de prontuários
-                menu_selectors = [
-                    'a:has-text("Prontuários")',
-                    'a:has-text("Prontuarios")',
-                    'a:has-text("Pacientes")',
-                    'a[href*="prontuario"]',
-                    'a[href*="paciente"]',
-                    '.menu-item:has-text("Prontuários")',
-                    'nav a:has-text("Prontuários")'
-                ]
-
-                for selector in menu_selectors:
+                visible_menus = self.visible_selectors(self.MENU_SELECTORS)
+                for selector in self.MENU_SELECTORS:
                     try:
-                        if self.page.locator(selector).is_visible():
+                        if selector in visible_menus:
                             self.page.click(selector)
                             self.page.wait_for_load_state("networkidle")
 
                             # Procura por link de "Novo" ou "Upload"
-                            upload_selectors = [
-                                'a:has-text("Novo")',
-                                'a:has-text("Upload")',
-                                'a:has-text("Adicionar")',
-                                'a:has-text("Novo Prontuário")',
-                                'button:has-text("Novo")',
-                                '.btn-new',
-                                '.btn-upload'
-                            ]
-
-                            for upload_selector in upload_selectors:
+                            visible_new_buttons = self.visible_selectors(self.NEW_BUTTON_SELECTORS)
+                            for upload_selector in self.NEW_BUTTON_SELECTORS:
                                 try:
-                                    if self.page.locator(upload_selector).is_visible():
+                                    if upload_selector in visible_new_buttons:
                                         self.page.click(upload_selector)
                                         self.page.wait_for_load_state("networkidle")
                                         navigation_success = True
+                                        self.remember_navigation(menu=[selector, upload_selector])
                                         break
                                 except:
                                     continue
 
                             if navigation_success:
                                 break
+
+                            # A página mudou com o clique: sonda o menu de novo
+                            visible_menus = self.visible_selectors(self.MENU_SELECTORS)
                     except:
                         continue
 
@@ -112,46 +186,16 @@ class ProntuariosFlow(BaseFlow):
             # Preenche campos obrigatórios antes do upload (se existirem)
             self.fill_required_fields()
 
-            # Selectors comuns para input de arquivo
-            file_input_selectors = [
-                'input[type="file"]',
-                'input[name="arquivo"]',
-                'input[name="documento"]',
-                'input[name="prontuario"]',
-                'input[name="anexo"]',
-                'input[accept*="pdf"]',
-                'input[accept*="image"]',
-                '#file-upload',
-                '#prontuario-upload',
-                '.file-input'
-            ]
-
             # Procura pelo campo de upload
-            file_input = None
-            for selector in file_input_selectors:
-                try:
-                    locator = self.page.locator(selector)
-                    if locator.count() > 0:
-                        file_input = locator.first
-                        break
-                except:
-                    continue
+            file_input_selector = self.resolve_selector('file_input', self.FILE_INPUT_SELECTORS, require_visible=False)
+            file_input = self.page.locator(file_input_selector).first if file_input_selector else None
 
             if not file_input:
                 # Tenta encontrar botões de upload que abrem dialog
-                upload_buttons = [
-                    'button:has-text("Upload")',
-                    'button:has-text("Escolher")',
-                    'button:has-text("Selecionar")',
-                    'button:has-text("Anexar")',
-                    '.upload-button',
-                    '.btn-upload',
-                    '.btn-anexar'
-                ]
-
-                for button_selector in upload_buttons:
+                visible_buttons = self.visible_selectors(self.UPLOAD_BUTTON_SELECTORS)
+                for button_selector in self.UPLOAD_BUTTON_SELECTORS:
                     try:
-                        if self.page.locator(button_selector).is_visible():
+                        if button_selector in visible_buttons:
                             # Configura listener para file chooser
                             with self.page.expect_file_chooser() as fc_info:
                                 self.page.click(button_selector)
@@ -164,41 +208,27 @@ class ProntuariosFlow(BaseFlow):
                 # Upload direto via input file
                 file_input.set_input_files(file_path)
 
-            # Aguarda processamento do arquivo
-            self.page.wait_for_timeout(3000)
+            # Aguarda o arquivo ser anexado/processado (evento, não pausa fixa)
+            self.wait_for_file_ready()
 
             # Preenche campos adicionais após upload
             self.fill_additional_fields()
 
-            # Procura e clica no botão de enviar/salvar
-            submit_selectors = [
-                'button[type="submit"]',
-                'input[type="submit"]',
-                'button:has-text("Enviar")',
-                'button:has-text("Salvar")',
-                'button:has-text("Gravar")',
-                'button:has-text("Confirmar")',
-                '.btn-submit',
-                '.btn-save',
-                '.btn-confirmar',
-                '#submit-button'
-            ]
+            # Registra as respostas do envio antes do clique
+            self.arm_confirmation()
 
+            # Procura e clica no botão de enviar/salvar
+            submit_selector = self.resolve_selector('submit', self.SUBMIT_SELECTORS)
             submit_clicked = False
-            for selector in submit_selectors:
-                try:
-                    if self.page.locator(selector).is_visible():
-                        self.page.click(selector)
-                        submit_clicked = True
-                        break
-                except:
-                    continue
+            if submit_selector:
+                self.page.click(submit_selector)
+                submit_clicked = True
 
             if not submit_clicked:
                 logger.warning("Botão de envio não encontrado, assumindo upload automático")
 
             # Aguarda confirmação
-            if self.wait_for_upload_completion(timeout=45000):  # Timeout maior para prontuários
+            if self.wait_for_upload_completion(timeout=self.UPLOAD_TIMEOUT_MS):
                 logger.info(f"Upload do prontuário concluído: {file_path}")
                 return True
             else:
@@ -213,24 +243,7 @@ class ProntuariosFlow(BaseFlow):
     def fill_required_fields(self) -> bool:
         """Preenche campos obrigatórios antes do upload"""
         try:
-            # Campos que podem ser obrigatórios para prontuários
-            required_fields = {
-                'input[name="paciente_nome"]': 'Paciente Anônimo',
-                'input[name="numero_prontuario"]': '000000',
-                'select[name="especialidade"]': 'geral',
-                'input[name="data_consulta"]': '2024-01-01'
-            }
-
-            for selector, value in required_fields.items():
-                try:
-                    if self.page.locator(selector).is_visible():
-                        if selector.startswith('select'):
-                            self.page.select_option(selector, value)
-                        else:
-                            self.page.fill(selector, value)
-                        logger.debug(f"Campo preenchido: {selector} = {value}")
-                except:
-                    continue
+            self.fill_fields(self.REQUIRED_FIELDS)
 
             return True
 
@@ -241,26 +254,7 @@ class ProntuariosFlow(BaseFlow):
     def fill_additional_fields(self) -> bool:
         """Preenche campos adicionais específicos para prontuários"""
         try:
-            # Campos específicos para prontuários
-            fields = {
-                'input[name="tipo_documento"]': 'Prontuário',
-                'select[name="categoria"]': 'prontuario',
-                'input[name="descricao"]': 'Upload automático de prontuário via bot',
-                'textarea[name="observacoes"]': 'Documento carregado automaticamente'
-            }
-
-            for selector, value in fields.items():
-                try:
-                    if self.page.locator(selector).is_visible():
-                        if selector.startswith('select'):
-                            self.page.select_option(selector, value)
-                        elif selector.startswith('textarea'):
-                            self.page.fill(selector, value)
-                        else:
-                            self.page.fill(selector, value)
-                        logger.debug(f"Campo adicional preenchido: {selector}")
-                except:
-                    continue
+            self.fill_fields(self.ADDITIONAL_FIELDS)
 
             return True
 
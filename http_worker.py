@@ -0,0 +1,522 @@
+"""
+Worker HTTP: envio direto do formulário, sem navegador no caminho comum
+
+Alternativa aos engines "sync" e "async" selecionada com `--engine http`.
+Depois do login, salvar um documento é só um POST multipart do Laravel
+com o token CSRF e o cookie de sessão; o HttpUploadClient faz esse POST
+com uma requests.Session (conexões keep-alive reaproveitadas) e envia o
+arquivo direto do disco, em blocos, sem carregá-lo em memória.
+
+A sessão vem dos cookies do login centralizado do controller
+(SharedSession) ou, sem ele, de um login direto pelo formulário do site:
+nenhum navegador é aberto. Uma resposta 419 (token CSRF expirado) busca um
+token novo e repete o envio uma vez; sessão expirada refaz o login uma vez.
+
+Só os fluxos com HTTP_ENV_PREFIX cujas variáveis <prefixo>_HTTP_SAVE_PATH e
+<prefixo>_HTTP_FILE_FIELD estão definidas são enviados por HTTP. Os demais
+seguem pelo fluxo do Playwright do DocumentWorker (o navegador só é criado
+nesse caso), assim como os envios que com certeza não salvaram nada: falha
+de conexão antes de o corpo sair, 401/419 depois das renovações ou
+formulário recusado com 4xx. Um POST que pode ter sido
+salvo nunca é repetido: resposta 2xx/3xx sem resultado claro, 5xx ou
+queda depois do envio viram erro sem nova tentativa, para conferência no
+site. Depois de HTTP_MAX_FALLBACKS envios HTTP seguidos sem confirmação
+(desvios para o navegador ou erros a conferir) o worker deixa de tentar o
+HTTP.
+"""
+
+import os
+import re
+import uuid
+import logging
+import mimetypes
+from html.parser import HTMLParser
+from typing import Dict, Any, List, Optional, Tuple, Type
+from urllib.parse import urljoin, unquote
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from flows import BaseFlow, AtestadosFlow, ProntuariosFlow, ExamesFlow, GedFlow
+from flows.flow_logic import parse_save_response, is_login_url
+from session import SharedSession, CONTEXT_OPTIONS
+from worker import DocumentWorker
+
+logger = logging.getLogger(__name__)
+
+
+# Nome do campo no seletor do fluxo (input[name="titulo"] -> titulo)
+FIELD_NAME_RE = re.compile(r'\[name=["\']?([^"\'\]]+)["\']?\]')
+
+# Campos de usuário reconhecidos no formulário de login
+LOGIN_USER_FIELDS = ['usuario', 'email', 'username', 'login']
+
+# Fluxos que podem ser enviados por HTTP (os que declaram HTTP_ENV_PREFIX)
+HTTP_FLOWS = [AtestadosFlow, ProntuariosFlow, ExamesFlow, GedFlow]
+
+
+class FormParser(HTMLParser):
+    """Extrai o token CSRF e os inputs dos formulários de uma página"""
+
+    def __init__(self):
+        super().__init__()
+        self.csrf_token: Optional[str] = None
+        self.forms: List[Dict[str, Any]] = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'meta' and attrs.get('name') == 'csrf-token':
+            self.csrf_token = attrs.get('content')
+        elif tag == 'form':
+            self.forms.append({'action': attrs.get('action') or '', 'inputs': []})
+        elif tag == 'input' and self.forms and attrs.get('name'):
+            self.forms[-1]['inputs'].append({
+                'name': attrs['name'],
+                'type': (attrs.get('type') or 'text').lower(),
+                'value': attrs.get('value') or ''
+            })
+            if attrs['name'] == '_token' and not self.csrf_token:
+                self.csrf_token = attrs.get('value')
+
+    def login_form(self) -> Optional[Dict[str, Any]]:
+        """Primeiro formulário com campo de senha"""
+        for form in self.forms:
+            if any(field['type'] == 'password' for field in form['inputs']):
+                return form
+        return None
+
+
+def parse_form_page(html: str) -> FormParser:
+    parser = FormParser()
+    try:
+        parser.feed(html)
+    except Exception as e:
+        logger.debug(f"HTML não interpretado por completo: {e}")
+    return parser
+
+
+class MultipartStream:
+    """Corpo multipart/form-data lido sob demanda, com tamanho conhecido
+
+    Os campos de texto ficam em memória; o arquivo é lido do disco em
+    blocos conforme o requests/http.client pede. `__len__` permite ao
+    requests enviar Content-Length em vez de chunked encoding.
+    """
+
+    def __init__(self, fields: Dict[str, str], file_field: Optional[str], file_path: Optional[str]):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+
+        head = b''.join(self._part(name, value) for name, value in fields.items())
+        self.file = None
+        file_size = 0
+        if file_field and file_path:
+            filename = os.path.basename(file_path).replace('"', '%22')
+            mime = mimetypes.guess_type(file_path)[0] or 'application/octet-stream'
+            head += (
+                f'--{self.boundary}\r\n'
+                f'Content-Disposition: form-data; name="{file_field}"; filename="{filename}"\r\n'
+                f'Content-Type: {mime}\r\n\r\n'
+            ).encode('utf-8')
+            self.file = open(file_path, 'rb')
+            file_size = os.fstat(self.file.fileno()).st_size
+            tail = f'\r\n--{self.boundary}--\r\n'.encode('utf-8')
+        else:
+            tail = f'--{self.boundary}--\r\n'.encode('utf-8')
+
+        self.head = head
+        self.tail = tail
+        self.length = len(head) + file_size + len(tail)
+        self.position = 0
+        self.stage = 'head'
+
+    def _part(self, name: str, value: str) -> bytes:
+        return (
+            f'--{self.boundary}\r\n'
+            f'Content-Disposition: form-data; name="{name}"\r\n\r\n'
+            f'{value}\r\n'
+        ).encode('utf-8')
+
+    def __len__(self) -> int:
+        return self.length
+
+    def read(self, size: int = -1) -> bytes:
+        """Próximo bloco do corpo (cabeçalho, arquivo, fechamento)"""
+        if size is None or size < 0:
+            size = self.length
+        chunks = []
+
+        while size > 0 and self.stage != 'done':
+            if self.stage == 'head':
+                chunk = self.head[self.position:self.position + size]
+                self.position += len(chunk)
+                if self.position >= len(self.head):
+                    self.stage, self.position = ('file' if self.file else 'tail'), 0
+            elif self.stage == 'file':
+                chunk = self.file.read(size)
+                if not chunk:
+                    self.stage = 'tail'
+                    continue
+            else:
+                chunk = self.tail[self.position:self.position + size]
+                self.position += len(chunk)
+                if self.position >= len(self.tail):
+                    self.stage = 'done'
+            chunks.append(chunk)
+            size -= len(chunk)
+
+        return b''.join(chunks)
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+class UploadInterrupted(Exception):
+    """Erro de conexão no POST do formulário; `body_sent` indica se o corpo saiu inteiro"""
+
+    def __init__(self, error: Exception, body_sent: bool):
+        super().__init__(str(error))
+        self.body_sent = body_sent
+
+
+class HttpUploadClient:
+    """Sessão HTTP autenticada que envia os formulários de salvamento dos fluxos"""
+
+    def __init__(self, worker_id: int, shared_session: Optional[SharedSession] = None):
+        self.worker_id = worker_id
+        self.shared_session = shared_session
+        self.session_version = 0
+        self.session_refresh_timeout = float(os.getenv('SESSION_REFRESH_TIMEOUT', '60'))
+        self.base_url = os.getenv('SITE_BASE_URL', 'https://example.com').rstrip('/')
+        self.site_user = os.getenv('SITE_USER')
+        self.site_pass = os.getenv('SITE_PASS')
+        self.timeout = float(os.getenv('HTTP_TIMEOUT', '60'))
+        pool_size = int(os.getenv('HTTP_POOL_SIZE', '4'))
+
+        # Caminho do POST de salvamento e campo do arquivo de cada fluxo
+        self.endpoints: Dict[Type[BaseFlow], Tuple[str, str]] = {}
+        for flow_class in HTTP_FLOWS:
+            prefix = flow_class.HTTP_ENV_PREFIX
+            if not prefix:
+                continue
+            save_path = os.getenv(f'{prefix}_HTTP_SAVE_PATH')
+            file_field = os.getenv(f'{prefix}_HTTP_FILE_FIELD')
+            if save_path and file_field:
+                self.endpoints[flow_class] = (save_path, file_field)
+
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = CONTEXT_OPTIONS['user_agent']
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.authenticated = False
+        self.csrf_tokens: Dict[str, str] = {}
+        self.uploads = 0
+        self.unconfirmed_uploads = 0
+        self.csrf_refreshes = 0
+        self.relogins = 0
+
+    def url(self, path: str) -> str:
+        return urljoin(self.base_url + '/', path.lstrip('/'))
+
+    def import_storage_state(self, storage_state: Dict[str, Any]):
+        """Copia os cookies do storage_state do Playwright para a sessão HTTP"""
+        self.session.cookies.clear()
+        for cookie in storage_state.get('cookies', []):
+            self.session.cookies.set(
+                cookie['name'], cookie['value'],
+                domain=cookie.get('domain', ''), path=cookie.get('path', '/'),
+                secure=cookie.get('secure', False)
+            )
+
+    def login_direct(self) -> bool:
+        """Login pelo formulário /login do site, sem navegador"""
+        try:
+            response = self.session.get(self.url('/login'), timeout=self.timeout)
+            page = parse_form_page(response.text)
+            form = page.login_form()
+            if not form:
+                logger.error("HTTP: formulário de login não encontrado")
+                return False
+
+            data = {field['name']: field['value'] for field in form['inputs'] if field['type'] == 'hidden'}
+            password_field = next(field['name'] for field in form['inputs'] if field['type'] == 'password')
+            user_field = next(
+                (field['name'] for field in form['inputs']
+                 if field['type'] in ('text', 'email') and field['name'].lower() in LOGIN_USER_FIELDS),
+                next((field['name'] for field in form['inputs'] if field['type'] in ('text', 'email')), None)
+            )
+            if not user_field:
+                logger.error("HTTP: campo de usuário do login não encontrado")
+                return False
+
+            data[user_field] = self.site_user
+            data[password_field] = self.site_pass
+            action = urljoin(response.url, form['action']) if form['action'] else response.url
+
+            response = self.session.post(action, data=data, timeout=self.timeout)
+            if is_login_url(response.url):
+                logger.error("HTTP: login recusado pelo site")
+                return False
+
+            logger.info(f"HTTP: worker {self.worker_id} autenticado por login direto")
+            return True
+
+        except requests.RequestException as e:
+            logger.error(f"HTTP: erro no login direto: {e}")
+            return False
+
+    def ensure_session(self, renew: bool = False) -> bool:
+        """Sessão autenticada: cookies do controller (SharedSession) ou login direto
+
+        Com `renew`, a sessão atual expirou: pede uma nova ao controller ou
+        refaz o login direto.
+        """
+        if self.authenticated and not renew:
+            return True
+
+        self.csrf_tokens.clear()
+        if renew:
+            self.relogins += 1
+
+        if self.shared_session:
+            if renew:
+                renewed = self.shared_session.request_refresh(
+                    self.worker_id, self.session_version, self.session_refresh_timeout
+                )
+                version, storage_state = renewed if renewed else (self.session_version, None)
+            else:
+                version, storage_state = self.shared_session.current()
+
+            if storage_state:
+                self.session_version = version
+                self.import_storage_state(storage_state)
+                self.authenticated = True
+                return True
+
+        self.authenticated = self.login_direct()
+        return self.authenticated
+
+    def csrf_token(self, form_path: str, refresh: bool = False) -> Optional[str]:
+        """Token CSRF da página do formulário (meta csrf-token ou input _token)
+
+        Retorna None se a página redirecionou para o login (sessão expirada).
+        """
+        if form_path in self.csrf_tokens and not refresh:
+            return self.csrf_tokens[form_path]
+
+        response = self.session.get(self.url(form_path), timeout=self.timeout)
+        if is_login_url(response.url):
+            return None
+
+        token = parse_form_page(response.text).csrf_token
+        if not token:
+            # Sem token no HTML: o Laravel também aceita o cookie XSRF-TOKEN
+            token = unquote(self.session.cookies.get('XSRF-TOKEN', ''))
+        self.csrf_tokens[form_path] = token
+        return token
+
+    def form_fields(self, flow_class: Type[BaseFlow], file_path: str) -> Optional[Dict[str, str]]:
+        """Campos do fluxo pelo atributo name (None se algum seletor não tiver name)"""
+        fields = {}
+        for selector, value in flow_class.fields_for(file_path).items():
+            match = FIELD_NAME_RE.search(selector)
+            if not match:
+                logger.warning(f"HTTP: seletor sem name, enviando pelo navegador: {selector}")
+                return None
+            fields[match.group(1)] = value
+        return fields
+
+    def post_form(self, flow_class: Type[BaseFlow], fields: Dict[str, str], token: str,
+                  file_path: str) -> requests.Response:
+        """POST multipart do formulário, com o arquivo lido do disco em blocos
+
+        Erros de conexão viram UploadInterrupted, que diz se o corpo chegou
+        a ser enviado inteiro (o servidor pode ter salvo o documento).
+        """
+        save_path, file_field = self.endpoints[flow_class]
+        body = MultipartStream(dict(fields, _token=token), file_field, file_path)
+        try:
+            return self.session.post(
+                self.url(save_path),
+                data=body,
+                headers={
+                    'Content-Type': body.content_type,
+                    'X-CSRF-TOKEN': token,
+                    'X-Requested-With': 'XMLHttpRequest',
+                    'Accept': 'application/json'
+                },
+                allow_redirects=False,
+                timeout=self.timeout
+            )
+        except requests.RequestException as e:
+            raise UploadInterrupted(e, body_sent=body.stage == 'done') from e
+        finally:
+            body.close()
+
+    def upload(self, flow_class: Type[BaseFlow], file_path: str) -> Tuple[Optional[Dict[str, Any]], str]:
+        """Envia o arquivo pelo formulário de salvamento do fluxo
+
+        Retorna (resultado, motivo): o resultado no formato de
+        BaseFlow.process_file quando o POST pode ter salvo o documento, ou
+        None com o motivo quando com certeza nada foi salvo e o arquivo
+        deve seguir pelo navegador. Só uma resposta que parse_save_response
+        classifica como sucesso conta como enviado; as demais falhas levam
+        `retry` False: reenviar poderia duplicar a solicitação.
+        """
+        try:
+            fields = self.form_fields(flow_class, file_path)
+        except Exception as e:
+            return None, str(e)
+        if fields is None:
+            return None, 'campos sem name'
+
+        form_path = flow_class.HTTP_FORM_PATH or flow_class.UPLOAD_PATHS[0]
+        retried_csrf = retried_login = False
+
+        try:
+            while True:
+                if not self.ensure_session():
+                    return None, 'falha no login'
+
+                token = self.csrf_token(form_path, refresh=retried_csrf)
+                response = None
+                if token is not None:
+                    response = self.post_form(flow_class, fields, token, file_path)
+
+                    # Token CSRF expirado: busca outro e repete uma vez
+                    if response.status_code == 419 and not retried_csrf:
+                        retried_csrf = True
+                        self.csrf_refreshes += 1
+                        logger.info("HTTP: token CSRF expirado (419), renovando")
+                        continue
+
+                # Sessão expirada (página do formulário ou POST mandou para o login)
+                expired = response is None or response.status_code == 401 or (
+                    response.is_redirect and is_login_url(response.headers.get('location', ''))
+                )
+                if expired:
+                    if retried_login:
+                        return None, 'sessão expirada após novo login'
+                    retried_login = True
+                    logger.info("HTTP: sessão expirada, renovando")
+                    if not self.ensure_session(renew=True):
+                        return None, 'falha ao renovar a sessão'
+                    continue
+
+                status = response.status_code
+                outcome = parse_save_response(status, response.headers, response.text)
+                if outcome['outcome'] == 'success':
+                    self.uploads += 1
+                    logger.info(f"HTTP: upload confirmado ({outcome['detail']}, "
+                                f"documento {outcome['document_id'] or 'sem id'}): {file_path}")
+                    return {
+                        'success': True,
+                        'error': None,
+                        'confirmation': f"http:{status}",
+                        'document_id': outcome['document_id']
+                    }, ''
+
+                if status >= 500:
+                    # O servidor pode ter salvo antes de falhar: não reenvia
+                    return self.unconfirmed(
+                        f"Resposta {status} do servidor após o envio", outcome['detail'], f"http:{status}"
+                    ), ''
+
+                if outcome['outcome'] == 'error':
+                    # 4xx (validação, 419 repetido) ou JSON de erro: nada foi salvo
+                    return None, f"envio recusado: {outcome['detail']}"
+
+                # 2xx/3xx sem resultado claro (página de validação com 200,
+                # volta para o formulário): pode ou não ter salvo, não reenvia
+                return self.unconfirmed(
+                    f"Resposta {status} inconclusiva", outcome['detail'], f"http:{status}:inconclusivo"
+                ), ''
+
+        except UploadInterrupted as e:
+            if not e.body_sent:
+                return None, f"erro de conexão antes do envio: {e}"
+            return self.unconfirmed("Conexão perdida após o envio", str(e), 'http:sem-resposta'), ''
+        except (requests.RequestException, OSError) as e:
+            # Login, token CSRF ou leitura do arquivo: o POST não foi feito
+            return None, f"erro de conexão: {e}"
+
+    def unconfirmed(self, reason: str, detail: str, confirmation: str) -> Dict[str, Any]:
+        """Erro de um POST que pode ter sido salvo: registrado sem nova tentativa, para conferência"""
+        self.unconfirmed_uploads += 1
+        error = f"{reason}, conferir no site antes de reenviar: {detail}"
+        logger.warning(f"HTTP: {error}")
+        return {'success': False, 'error': error, 'confirmation': confirmation, 'retry': False}
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'http_uploads': self.uploads,
+            'http_unconfirmed': self.unconfirmed_uploads,
+            'http_csrf_refreshes': self.csrf_refreshes,
+            'http_relogins': self.relogins
+        }
+
+    def close(self):
+        self.session.close()
+
+
+class HttpDocumentWorker(DocumentWorker):
+    """DocumentWorker que envia por HTTP e usa o navegador só como alternativa
+
+    Fila, leases, retry e status são os do DocumentWorker; só o
+    processamento de cada arquivo muda.
+    """
+
+    def __init__(self, worker_id: int, shared_session: Optional[SharedSession] = None,
+                 browser_endpoint: Optional[str] = None):
+        super().__init__(worker_id, shared_session, browser_endpoint)
+        self.http = HttpUploadClient(worker_id, shared_session)
+        self.max_fallbacks = int(os.getenv('HTTP_MAX_FALLBACKS', '3'))
+        self.consecutive_fallbacks = 0
+        self.fallbacks = 0
+
+    def http_enabled(self) -> bool:
+        return self.max_fallbacks <= 0 or self.consecutive_fallbacks < self.max_fallbacks
+
+    def process_file(self, file_record: Dict[str, Any]) -> Dict[str, Any]:
+        """Tenta o envio HTTP; se nada foi salvo, processa pelo navegador"""
+        file_path = file_record['caminho_arquivo']
+        flow_class = self.get_flow_class(file_record['tipo_arquivo'])
+
+        if flow_class in self.http.endpoints and self.http_enabled() and os.path.exists(file_path):
+            result, reason = self.http.upload(flow_class, file_path)
+            if result and result['success']:
+                self.consecutive_fallbacks = 0
+            else:
+                # Desvio para o navegador ou envio sem confirmação: conta para desligar o HTTP
+                self.consecutive_fallbacks += 1
+                if not self.http_enabled():
+                    logger.warning(f"Worker {self.worker_id}: {self.consecutive_fallbacks} envios HTTP seguidos "
+                                   f"sem confirmação, envio HTTP desligado neste worker")
+
+            if result:
+                result['file_id'] = file_record['id']
+                return result
+
+            self.fallbacks += 1
+            logger.warning(f"Worker {self.worker_id}: HTTP não salvou ({reason}), "
+                           f"enviando pelo navegador: {file_path}")
+
+        return super().process_file(file_record)
+
+    def cleanup(self):
+        super().cleanup()
+        self.http.close()
+
+    def run(self) -> Dict[str, Any]:
+        stats = super().run()
+        stats.update(self.http.stats())
+        stats['http_fallbacks'] = self.fallbacks
+        stats['engine'] = 'http'
+        logger.info(f"Worker {self.worker_id}: HTTP - Uploads: {stats['http_uploads']}, "
+                    f"A conferir: {stats['http_unconfirmed']}, "
+                    f"Desvios para o navegador: {stats['http_fallbacks']}")
+        return stats
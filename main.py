@@ -55,14 +55,14 @@ def validate_environment() -> Dict[str, Any]:
 
     # Variáveis obrigatórias
     required_vars = [
-        'DB_HOST',
-        'DB_USER',
-        'DB_PASS',
-        'DB_NAME',
         'SITE_USER',
         'SITE_PASS'
     ]
 
+    # O backend SQLite é um arquivo local e dispensa credenciais de banco
+    if os.getenv('DB_BACKEND', 'mariadb').lower() != 'sqlite':
+        required_vars = ['DB_HOST', 'DB_USER', 'DB_PASS', 'DB_NAME'] + required_vars
+
     for var in required_vars:
         if not os.getenv(var):
             errors.append(f"Variável de ambiente obrigatória não encontrada: {var}")
@@ -113,6 +113,30 @@ def test_database_connection() -> bool:
         return False
 
 
+def run_migrations() -> bool:
+    """Aplica as migrações de esquema pendentes e informa a versão final"""
+    try:
+        db_manager = get_db_manager()
+        if not db_manager.connect():
+            logging.error("Falha ao conectar com banco de dados")
+            return False
+
+        version_before = db_manager.get_schema_version()
+        if not db_manager.migrate():
+            logging.error("Falha ao aplicar migrações")
+            return False
+
+        version_after = db_manager.get_schema_version()
+        logging.info(f"Esquema do banco na versão {version_after} (antes: {version_before})")
+
+        db_manager.disconnect()
+        return True
+
+    except Exception as e:
+        logging.error(f"Erro ao aplicar migrações: {e}")
+        return False
+
+
 def check_documents_directory(documents_path: str) -> Dict[str, Any]:
     """Verifica diretório de documentos"""
     try:
@@ -141,7 +165,7 @@ def check_documents_directory(documents_path: str) -> Dict[str, Any]:
 
         # Conta arquivos por tipo
         file_counts = {}
-        valid_extensions = {'.pdf', '.jpg', '.jpeg', '.png', '.tiff', '.tif', '.dcm'}
+        valid_extensions = {'.pdf', '.jpg', '.jpeg', '.png', '.tiff', '.tif', '.dcm', '.doc', '.docx'}
 
         for subdir in subdirs:
             files = [f for f in subdir.rglob('*') if f.is_file() and f.suffix.lower() in valid_extensions]
@@ -194,7 +218,10 @@ def main():
 Exemplos de uso:
   python main.py --documents ./meus_documentos --workers 3
   python main.py --test-only
+  python main.py --migrate
   python main.py --force-rescan --workers 5 --log-level DEBUG
+  python main.py --engine async --workers 2 --pages-per-worker 8
+  python main.py --engine http --workers 4
         """
     )
 
@@ -212,10 +239,33 @@ Exemplos de uso:
         help='Número de workers paralelos (padrão: 5)'
     )
 
+    parser.add_argument(
+        '--engine',
+        choices=['sync', 'async', 'http'],
+        default='sync',
+        help='Engine dos workers: sync (uma página por processo), async (várias páginas por processo) '
+             'ou http (envio direto por HTTP, navegador só como alternativa)'
+    )
+
+    parser.add_argument(
+        '--pages-per-worker',
+        type=int,
+        default=4,
+        help='Páginas simultâneas por worker no engine async (padrão: 4)'
+    )
+
+    parser.add_argument(
+        '--shared-browser',
+        type=int,
+        default=0,
+        metavar='N',
+        help='Inicia N Chromium compartilhados no controller aos quais os workers se conectam (padrão: 0, desligado)'
+    )
+
     parser.add_argument(
         '--force-rescan',
         action='store_true',
-        help='Força nova varredura de documentos (limpa registros pendentes)'
+        help='Força nova varredura ignorando fingerprints (reenfileira arquivos com erro)'
     )
 
     parser.add_argument(
@@ -224,6 +274,12 @@ Exemplos de uso:
         help='Apenas testa configurações e conexões (não processa documentos)'
     )
 
+    parser.add_argument(
+        '--migrate',
+        action='store_true',
+        help='Apenas aplica as migrações pendentes do banco de dados e sai'
+    )
+
     parser.add_argument(
         '--log-level',
         choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
@@ -263,6 +319,15 @@ Exemplos de uso:
 
         logger.info("✅ Configurações de ambiente OK")
 
+        # Modo migração: atualiza o esquema e encerra
+        if args.migrate:
+            logger.info("Aplicando migrações do banco de dados...")
+            if not run_migrations():
+                logger.error("❌ Falha ao aplicar migrações")
+                return 1
+            logger.info("✅ Migrações aplicadas")
+            return 0
+
         # 2. Teste de conexão com banco
         logger.info("2. Testando conexão com banco de dados...")
         if not test_database_connection():
@@ -304,12 +369,21 @@ Exemplos de uso:
             return 0
 
         # 4. Processamento principal
-        logger.info(f"4. Iniciando processamento com {args.workers} workers...")
+        if args.engine == 'async':
+            logger.info(f"4. Iniciando processamento com {args.workers} workers "
+                        f"({args.pages_per_worker} páginas simultâneas cada)...")
+        else:
+            logger.info(f"4. Iniciando processamento com {args.workers} workers...")
 
         result = run_controller(
             max_workers=args.workers,
             documents_path=documents_path,
-            force_rescan=args.force_rescan
+            force_rescan=args.force_rescan,
+            worker_options={
+                'engine': args.engine,
+                'pages_per_worker': args.pages_per_worker,
+                'shared_browsers': args.shared_browser
+            }
         )
 
         if not result['success']:
@@ -0,0 +1,221 @@
+"""
+Migrações versionadas do esquema do banco de dados
+
+Cada migração é (versão, descrição, lista de comandos SQL) e é aplicada em
+ordem crescente de versão. A versão aplicada fica registrada na tabela
+schema_version, então cada passo roda uma única vez por banco. Cada versão
+é aplicada numa transação junto com seu registro em schema_version. No
+SQLite isso basta; no MariaDB o DDL faz commit implícito, então os comandos
+usam IF NOT EXISTS (ou são naturalmente repetíveis) para que uma migração
+interrompida possa ser reaplicada com segurança.
+
+Um comando é SQL ou uma função que recebe o cursor, para passos que
+precisam consultar o esquema antes (ver sqlite_add_column).
+
+O backend SQLite (DB_BACKEND=sqlite) tem sua própria sequência em
+SQLITE_MIGRATIONS: começa direto no esquema atual, já que não há bancos
+SQLite antigos a converter.
+"""
+
+from typing import Any, Callable, List, Tuple, Union
+
+Migration = Tuple[int, str, List[Union[str, Callable[[Any], None]]]]
+
+
+def sqlite_add_column(table: str, column: str, definition: str) -> Callable[[Any], None]:
+    """ADD COLUMN só se a coluna ainda não existe (o SQLite não tem IF NOT EXISTS aqui)"""
+    def apply(cursor):
+        cursor.execute(f"PRAGMA table_info({table})")
+        if column not in [row[1] for row in cursor.fetchall()]:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return apply
+
+
+SCHEMA_VERSION_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INT NOT NULL PRIMARY KEY,
+    descricao VARCHAR(255) NOT NULL,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+"""
+
+
+MIGRATIONS: List[Migration] = [
+    (1, "Cria tabela uploads", [
+        """
+        CREATE TABLE IF NOT EXISTS uploads (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            caminho_arquivo TEXT NOT NULL,
+            tipo_arquivo VARCHAR(100) NOT NULL,
+            status ENUM('pendente','enviado','erro') DEFAULT 'pendente',
+            data_envio DATETIME NULL,
+            mensagem_erro TEXT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """,
+    ]),
+    (2, "Adiciona estado 'processando'", [
+        """
+        ALTER TABLE uploads
+        MODIFY status ENUM('pendente','processando','enviado','erro') DEFAULT 'pendente'
+        """,
+    ]),
+    (3, "Adiciona colunas de lease (claimed_by, lease_expires_at, attempts)", [
+        """
+        ALTER TABLE uploads
+        ADD COLUMN IF NOT EXISTS claimed_by VARCHAR(64) NULL,
+        ADD COLUMN IF NOT EXISTS lease_expires_at DATETIME NULL,
+        ADD COLUMN IF NOT EXISTS attempts INT NOT NULL DEFAULT 0
+        """,
+    ]),
+    (4, "Adiciona índices da fila (status, created_at) e (status, lease_expires_at)", [
+        # Atende claim_jobs (WHERE status = 'pendente' ORDER BY created_at)
+        # e get_stats (GROUP BY status) sem varrer a tabela
+        """
+        CREATE INDEX IF NOT EXISTS idx_uploads_status_created
+        ON uploads (status, created_at)
+        """,
+        # Atende reap_expired_leases (WHERE status = 'processando' AND lease_expires_at < NOW())
+        """
+        CREATE INDEX IF NOT EXISTS idx_uploads_status_lease
+        ON uploads (status, lease_expires_at)
+        """,
+    ]),
+    (5, "Adiciona path_hash único em uploads e tabela arquivos_fingerprint", [
+        """
+        ALTER TABLE uploads
+        ADD COLUMN IF NOT EXISTS path_hash CHAR(64) NULL AFTER caminho_arquivo
+        """,
+        """
+        UPDATE uploads
+        SET path_hash = SHA2(caminho_arquivo, 256)
+        WHERE path_hash IS NULL
+        """,
+        # Rescans antigos inseriam o mesmo caminho várias vezes: mantém uma
+        # linha por caminho, preferindo enviado > processando > erro > pendente
+        """
+        DELETE u1 FROM uploads u1
+        JOIN uploads u2 ON u2.path_hash = u1.path_hash AND u2.id <> u1.id
+        WHERE FIELD(u2.status, 'pendente', 'erro', 'processando', 'enviado')
+                > FIELD(u1.status, 'pendente', 'erro', 'processando', 'enviado')
+           OR (u2.status = u1.status AND u2.id < u1.id)
+        """,
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS uq_uploads_path_hash
+        ON uploads (path_hash)
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS arquivos_fingerprint (
+            path_hash CHAR(64) NOT NULL PRIMARY KEY,
+            size BIGINT NOT NULL,
+            mtime_ns BIGINT NOT NULL,
+            inode BIGINT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """,
+    ]),
+    (6, "Adiciona deduplicação por conteúdo (content_hash, duplicado_de, tabela conteudos)", [
+        """
+        ALTER TABLE uploads
+        MODIFY status ENUM('pendente','processando','enviado','erro','duplicado') DEFAULT 'pendente'
+        """,
+        """
+        ALTER TABLE uploads
+        ADD COLUMN IF NOT EXISTS content_hash CHAR(32) NULL AFTER path_hash,
+        ADD COLUMN IF NOT EXISTS duplicado_de INT NULL AFTER content_hash
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_uploads_content_hash
+        ON uploads (content_hash)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_uploads_duplicado_de
+        ON uploads (duplicado_de)
+        """,
+        # Um único job de upload por conteúdo: a chave primária em content_hash
+        # garante que só o primeiro arquivo registrado com aquele hash é enviado
+        """
+        CREATE TABLE IF NOT EXISTS conteudos (
+            content_hash CHAR(32) NOT NULL PRIMARY KEY,
+            upload_id INT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            KEY idx_conteudos_upload (upload_id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """,
+    ]),
+    (7, "Adiciona documento_id (id atribuído pelo site ao documento enviado)", [
+        """
+        ALTER TABLE uploads
+        ADD COLUMN IF NOT EXISTS documento_id VARCHAR(64) NULL AFTER mensagem_erro
+        """,
+    ]),
+]
+
+
+SQLITE_SCHEMA_VERSION_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER NOT NULL PRIMARY KEY,
+    descricao TEXT NOT NULL,
+    applied_at TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+)
+"""
+
+
+SQLITE_MIGRATIONS: List[Migration] = [
+    (1, "Cria esquema completo (uploads, arquivos_fingerprint, conteudos)", [
+        # Datas em horário local, como o NOW() do MariaDB
+        """
+        CREATE TABLE IF NOT EXISTS uploads (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            caminho_arquivo TEXT NOT NULL,
+            path_hash TEXT NULL,
+            content_hash TEXT NULL,
+            duplicado_de INTEGER NULL,
+            tipo_arquivo TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pendente'
+                CHECK (status IN ('pendente','processando','enviado','erro','duplicado')),
+            data_envio TIMESTAMP NULL,
+            mensagem_erro TEXT NULL,
+            claimed_by TEXT NULL,
+            lease_expires_at TIMESTAMP NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+            updated_at TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_uploads_updated_at
+        AFTER UPDATE ON uploads
+        FOR EACH ROW WHEN NEW.updated_at IS OLD.updated_at
+        BEGIN
+            UPDATE uploads SET updated_at = datetime('now', 'localtime') WHERE id = NEW.id;
+        END
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_uploads_status_created ON uploads (status, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_uploads_status_lease ON uploads (status, lease_expires_at)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_uploads_path_hash ON uploads (path_hash)",
+        "CREATE INDEX IF NOT EXISTS idx_uploads_content_hash ON uploads (content_hash)",
+        "CREATE INDEX IF NOT EXISTS idx_uploads_duplicado_de ON uploads (duplicado_de)",
+        """
+        CREATE TABLE IF NOT EXISTS arquivos_fingerprint (
+            path_hash TEXT NOT NULL PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            inode INTEGER NOT NULL,
+            updated_at TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS conteudos (
+            content_hash TEXT NOT NULL PRIMARY KEY,
+            upload_id INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_conteudos_upload ON conteudos (upload_id)",
+    ]),
+    (2, "Adiciona documento_id (id atribuído pelo site ao documento enviado)", [
+        sqlite_add_column('uploads', 'documento_id', 'TEXT NULL'),
+    ]),
+]
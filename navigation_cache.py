@@ -0,0 +1,137 @@
+"""
+Cache persistente do caminho até a página de upload de cada fluxo
+
+Os fluxos testam várias URLs candidatas (10s de timeout cada) e depois o
+menu para chegar à página de upload, e faziam isso a cada arquivo. O cache
+guarda, por fluxo e SITE_BASE_URL, o que funcionou: o caminho da URL
+direta ou o par de seletores (menu, botão "Novo"). As próximas navegações
+vão direto ao destino e só voltam a testar as candidatas quando o destino
+guardado deixa de funcionar (a entrada é então descartada).
+
+O arquivo JSON é compartilhado entre os workers: cada gravação relê o
+arquivo, aplica só a entrada alterada e substitui o arquivo de forma
+atômica (arquivo temporário + os.replace).
+"""
+
+import os
+import json
+import logging
+import tempfile
+import threading
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def load_json(path: str) -> Dict[str, Any]:
+    """Lê um cache JSON (arquivo ausente ou ilegível vira cache vazio)"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning(f"Cache ilegível ({path}), ignorando: {e}")
+        return {}
+
+
+def save_json_atomic(path: str, data: Dict[str, Any]) -> bool:
+    """Grava o JSON num temporário do mesmo diretório e substitui o arquivo"""
+    directory = os.path.dirname(os.path.abspath(path))
+    try:
+        fd, tmp_path = tempfile.mkstemp(prefix='.cache-', suffix='.json', dir=directory)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+        return True
+    except OSError as e:
+        logger.warning(f"Erro ao gravar cache {path}: {e}")
+        return False
+
+
+class NavigationCache:
+    """Destinos de navegação aprendidos, com métricas de acerto"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.getenv('NAV_CACHE_PATH', './navigation_cache.json')
+        self.enabled = os.getenv('NAV_CACHE', 'true').lower() == 'true'
+        self.entries: Dict[str, Dict[str, Any]] = load_json(self.path) if self.enabled else {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key(flow_name: str, base_url: str) -> str:
+        return f"{flow_name}|{base_url.rstrip('/')}"
+
+    def _write(self, key: str, entry: Optional[Dict[str, Any]]):
+        """Relê o arquivo, aplica a entrada (None remove) e grava atomicamente"""
+        entries = load_json(self.path)
+        if entry is None:
+            entries.pop(key, None)
+        else:
+            entries[key] = entry
+
+        if save_json_atomic(self.path, entries):
+            self.entries = entries
+
+    def lookup(self, flow_name: str, base_url: str) -> Optional[Dict[str, Any]]:
+        """Destino guardado para o fluxo (conta acerto/falta)"""
+        if not self.enabled:
+            return None
+
+        with self.lock:
+            entry = self.entries.get(self.key(flow_name, base_url))
+            if entry:
+                self.hits += 1
+            else:
+                self.misses += 1
+            return entry
+
+    def remember(self, flow_name: str, base_url: str, path: Optional[str] = None,
+                 menu: Optional[List[str]] = None):
+        """Guarda o destino que funcionou: `path` da URL direta ou `menu` [menu, botão novo]"""
+        if not self.enabled:
+            return
+
+        entry = {'path': path} if path else {'menu': list(menu or [])}
+        key = self.key(flow_name, base_url)
+        with self.lock:
+            if self.entries.get(key) == entry:
+                return
+            self._write(key, entry)
+        logger.info(f"Cache de navegação: {flow_name} -> {path or ' > '.join(menu or [])}")
+
+    def invalidate(self, flow_name: str, base_url: str):
+        """Descarta um destino que deixou de funcionar (o acerto vira falta)"""
+        if not self.enabled:
+            return
+
+        key = self.key(flow_name, base_url)
+        with self.lock:
+            self.hits -= 1
+            self.misses += 1
+            self.invalidations += 1
+            if key in self.entries:
+                self._write(key, None)
+        logger.info(f"Cache de navegação: destino de {flow_name} não funcionou mais, testando candidatas")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'nav_cache_hits': self.hits,
+            'nav_cache_misses': self.misses,
+            'nav_cache_invalidations': self.invalidations
+        }
+
+
+_navigation_cache: Optional[NavigationCache] = None
+
+
+def get_navigation_cache() -> NavigationCache:
+    """Cache de navegação do processo (carregado do disco na primeira chamada)"""
+    global _navigation_cache
+    if _navigation_cache is None:
+        _navigation_cache = NavigationCache()
+    return _navigation_cache
@@ -0,0 +1,164 @@
+"""
+Bloqueio de recursos não essenciais durante os fluxos
+
+O bot só lê o DOM: imagens, fontes, mídia e scripts de analytics não
+influenciam nenhum seletor, mas atrasam o `networkidle` de cada navegação.
+O ResourceInterceptor registra um `route("**/*")` no contexto (ou página)
+e aborta as requisições que a ResourcePolicy nega, por tipo de recurso
+(`request.resource_type`) e por padrão de URL (glob, como no Playwright).
+
+A política padrão vem do ambiente e cada fluxo pode acrescentar regras com
+os atributos BLOCKED_RESOURCE_TYPES, ALLOWED_RESOURCE_TYPES,
+BLOCKED_URL_PATTERNS e ALLOWED_URL_PATTERNS. Regras de permissão vencem as
+de bloqueio. Folhas de estilo não são bloqueadas por padrão, já que o
+`is_visible` dos seletores depende delas.
+"""
+
+import os
+import logging
+from fnmatch import fnmatch
+from typing import Dict, Any, List, Optional, Iterable
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_BLOCKED_TYPES = ['image', 'font', 'media']
+
+DEFAULT_BLOCKED_PATTERNS = [
+    '*google-analytics.com/*',
+    '*googletagmanager.com/*',
+    '*doubleclick.net/*',
+    '*connect.facebook.net/*',
+    '*hotjar.com/*',
+    '*clarity.ms/*'
+]
+
+# Tamanho médio estimado por tipo de recurso: requisições abortadas não
+# têm resposta, então a economia de bytes é sempre uma estimativa
+ESTIMATED_BYTES = {
+    'image': 40 * 1024,
+    'font': 30 * 1024,
+    'media': 500 * 1024,
+    'script': 50 * 1024,
+    'stylesheet': 30 * 1024
+}
+DEFAULT_ESTIMATED_BYTES = 10 * 1024
+
+
+def _env_list(name: str, default: List[str]) -> List[str]:
+    """Lista separada por vírgulas de uma variável de ambiente"""
+    value = os.getenv(name)
+    if value is None:
+        return list(default)
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+class ResourcePolicy:
+    """Regras de bloqueio por tipo de recurso e padrão de URL"""
+
+    def __init__(self, blocked_types: Iterable[str] = (), allowed_types: Iterable[str] = (),
+                 blocked_patterns: Iterable[str] = (), allowed_patterns: Iterable[str] = ()):
+        self.blocked_types = set(blocked_types)
+        self.allowed_types = set(allowed_types)
+        self.blocked_patterns = list(blocked_patterns)
+        self.allowed_patterns = list(allowed_patterns)
+
+    @classmethod
+    def from_env(cls) -> 'ResourcePolicy':
+        """Política padrão (BLOCK_RESOURCE_TYPES e BLOCK_URL_PATTERNS substituem os padrões)"""
+        return cls(
+            blocked_types=_env_list('BLOCK_RESOURCE_TYPES', DEFAULT_BLOCKED_TYPES),
+            blocked_patterns=_env_list('BLOCK_URL_PATTERNS', DEFAULT_BLOCKED_PATTERNS)
+        )
+
+    def for_flow(self, flow_class) -> 'ResourcePolicy':
+        """Política padrão acrescida das regras declaradas no fluxo"""
+        allowed_types = self.allowed_types | set(getattr(flow_class, 'ALLOWED_RESOURCE_TYPES', []))
+        return ResourcePolicy(
+            blocked_types=(self.blocked_types | set(getattr(flow_class, 'BLOCKED_RESOURCE_TYPES', []))) - allowed_types,
+            allowed_types=allowed_types,
+            blocked_patterns=self.blocked_patterns + list(getattr(flow_class, 'BLOCKED_URL_PATTERNS', [])),
+            allowed_patterns=self.allowed_patterns + list(getattr(flow_class, 'ALLOWED_URL_PATTERNS', []))
+        )
+
+    def should_block(self, resource_type: str, url: str) -> bool:
+        """Indica se a requisição deve ser abortada"""
+        # Documentos e XHR/fetch nunca são bloqueados: são o próprio fluxo
+        if resource_type in ('document', 'xhr', 'fetch'):
+            return False
+        if resource_type in self.allowed_types:
+            return False
+        if any(fnmatch(url, pattern) for pattern in self.allowed_patterns):
+            return False
+        if resource_type in self.blocked_types:
+            return True
+        return any(fnmatch(url, pattern) for pattern in self.blocked_patterns)
+
+
+class ResourceInterceptor:
+    """Handler de `route` que aplica a política ativa e conta os bloqueios
+
+    Um interceptor por contexto: o worker troca a política com `use()` a
+    cada fluxo, sem registrar o route de novo. Funciona com a API síncrona
+    (`install`) e com a assíncrona (`install_async`).
+    """
+
+    def __init__(self, policy: Optional[ResourcePolicy] = None):
+        self.base_policy = policy or ResourcePolicy.from_env()
+        self.policy = self.base_policy
+        self.enabled = os.getenv('BLOCK_RESOURCES', 'true').lower() == 'true'
+        self.blocked = 0
+        self.blocked_by_type: Dict[str, int] = {}
+        self.bytes_saved_estimate = 0
+
+    def use(self, flow_class) -> 'ResourceInterceptor':
+        """Ativa a política do fluxo informado"""
+        self.policy = self.base_policy.for_flow(flow_class)
+        return self
+
+    def record(self, resource_type: str, url: str) -> bool:
+        """Decide sobre a requisição e contabiliza se for bloqueada"""
+        if not self.policy.should_block(resource_type, url):
+            return False
+
+        self.blocked += 1
+        self.blocked_by_type[resource_type] = self.blocked_by_type.get(resource_type, 0) + 1
+        self.bytes_saved_estimate += ESTIMATED_BYTES.get(resource_type, DEFAULT_ESTIMATED_BYTES)
+        logger.debug(f"Recurso bloqueado ({resource_type}): {url}")
+        return True
+
+    def install(self, target):
+        """Registra o handler num BrowserContext ou Page síncrono"""
+        if not self.enabled:
+            return
+
+        def handle(route):
+            request = route.request
+            if self.record(request.resource_type, request.url):
+                route.abort()
+            else:
+                route.continue_()
+
+        target.route('**/*', handle)
+
+    async def install_async(self, target):
+        """Registra o handler num BrowserContext ou Page da API assíncrona"""
+        if not self.enabled:
+            return
+
+        async def handle(route):
+            request = route.request
+            if self.record(request.resource_type, request.url):
+                await route.abort()
+            else:
+                await route.continue_()
+
+        await target.route('**/*', handle)
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores para as estatísticas do worker"""
+        return {
+            'blocked_requests': self.blocked,
+            'blocked_by_type': dict(self.blocked_by_type),
+            'bytes_saved_estimate': self.bytes_saved_estimate
+        }
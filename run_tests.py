@@ -16,6 +16,7 @@ load_dotenv()
 from db import get_db_manager
 from utils import ConfigValidator, FileUtils, PerformanceMonitor
 from flows.base_flow import BaseFlow
+from flows.flow_logic import parse_save_response, ConfirmationRace
 
 
 def setup_test_logging():
@@ -80,7 +81,8 @@ def test_database_connection():
         print(f"✅ Estatísticas OK: {stats}")
 
         # Limpa teste
-        db_manager.connection.cursor().execute("DELETE FROM uploads WHERE id = %s", (test_file_id,))
+        with db_manager.cursor() as cursor:
+            cursor.execute("DELETE FROM uploads WHERE id = %s", (test_file_id,))
         print("✅ Registro de teste removido")
 
         db_manager.disconnect()
@@ -186,7 +188,7 @@ def test_imports():
     modules_to_test = [
         ('playwright.sync_api', 'Playwright'),
         ('mysql.connector', 'MySQL Connector'),
-        ('pandas', 'Pandas'),
+        ('openpyxl', 'OpenPyXL'),
         ('dotenv', 'Python Dotenv'),
     ]
 
@@ -257,6 +259,214 @@ def test_performance_monitor():
         return False
 
 
+def test_save_response_parsing():
+    """Testa a interpretação da resposta de salvamento (parse_save_response)"""
+    print("\n📨 Testando interpretação da resposta de salvamento...")
+
+    json_headers = {'content-type': 'application/json'}
+    # (descrição, status, headers, corpo, outcome esperado, id esperado)
+    cases = [
+        ("200 HTML", 200, {'content-type': 'text/html'}, '<html>ok</html>', None, None),
+        ("JSON só com mensagem", 200, json_headers, '{"message": "Solicitação recebida"}', None, None),
+        ("302 de volta para /ged", 302, {'location': 'https://example.com/ged'}, None, None, None),
+        ("302 para o documento", 302, {'location': '/ged/123'}, None, 'success', '123'),
+        ("302 para o login", 302, {'location': '/login'}, None, 'error', None),
+        ("JSON de sucesso com id", 200, json_headers, '{"success": true, "id": 42}', 'success', '42'),
+        ("JSON com erros de validação", 422, json_headers, '{"errors": {"titulo": ["obrigatório"]}}', 'error', None),
+        ("201 Created", 201, {'location': '/ged/7'}, None, 'success', '7'),
+    ]
+
+    all_ok = True
+    for description, status, headers, body, outcome, document_id in cases:
+        result = parse_save_response(status, headers, body)
+        if result['outcome'] == outcome and result['document_id'] == document_id:
+            print(f"✅ {description}: {result['outcome']}")
+        else:
+            print(f"❌ {description}: esperado {outcome}/{document_id}, obtido {result}")
+            all_ok = False
+
+    # Resposta inconclusiva não confirma; sem sinal até o prazo o envio falha sem exceção
+    race = ConfirmationRace(timeout_ms=0, grace_ms=0)
+    race.add_response(200, 'https://example.com/ged', parse_save_response(200, {}, None))
+    if race.response_confirmed() or race.expire() or race.signal != 'timeout':
+        print(f"❌ Resposta inconclusiva confirmou o envio (sinal {race.signal})")
+        all_ok = False
+    else:
+        print("✅ Resposta inconclusiva não confirma o envio")
+
+    return all_ok
+
+
+def test_status_batch_guard():
+    """Testa a gravação de status em lote (CASE por id) e a guarda de claimed_by"""
+    print("\n🧾 Testando gravação de status em lote...")
+
+    from datetime import datetime
+    from db_sqlite import SQLiteDatabaseManager
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_manager = SQLiteDatabaseManager()
+        db_manager.path = os.path.join(tmp_dir, 'fila.sqlite3')
+
+        try:
+            if not db_manager.connect() or not db_manager.migrate():
+                print("❌ Falha ao preparar banco SQLite temporário")
+                return False
+
+            for name in ('a.pdf', 'b.pdf', 'c.pdf'):
+                db_manager.insert_file_record(os.path.join(tmp_dir, name), 'ged')
+
+            own_ids = [job['id'] for job in db_manager.claim_jobs(worker_id=1, n=2)]
+            other_ids = [job['id'] for job in db_manager.claim_jobs(worker_id=2, n=1)]
+            if len(own_ids) != 2 or len(other_ids) != 1:
+                print(f"❌ Reserva inesperada: worker 1 {own_ids}, worker 2 {other_ids}")
+                return False
+
+            now = datetime.now()
+            updates = {
+                own_ids[0]: ('enviado', now, None, '10'),
+                own_ids[1]: ('erro', now, 'Falha no upload', None),
+                # Reservado por outro worker: não pode ser alterado
+                other_ids[0]: ('enviado', now, None, '11'),
+            }
+            written = db_manager.write_status_batch(1, updates)
+
+            with db_manager.cursor(dictionary=True) as cursor:
+                cursor.execute("SELECT id, status, claimed_by, mensagem_erro, documento_id FROM uploads")
+                rows = {row['id']: row for row in cursor.fetchall()}
+
+            expected = {
+                own_ids[0]: ('enviado', None, None, '10'),
+                own_ids[1]: ('erro', None, 'Falha no upload', None),
+                other_ids[0]: ('processando', '2', None, None),
+            }
+            all_ok = written == 2
+            print(f"{'✅' if written == 2 else '❌'} Lote gravou {written}/3 (esperado 2)")
+            for file_id, values in expected.items():
+                row = rows[file_id]
+                found = (row['status'], row['claimed_by'], row['mensagem_erro'], row['documento_id'])
+                if found != values:
+                    print(f"❌ Arquivo {file_id}: esperado {values}, obtido {found}")
+                    all_ok = False
+
+            # Gravação direta (sem buffer) com a mesma guarda
+            if db_manager.update_file_status(other_ids[0], 'erro', 'x', worker_id=1):
+                print("❌ Atualização direta alterou arquivo de outro worker")
+                all_ok = False
+            if not db_manager.update_file_status(other_ids[0], 'enviado', worker_id=2):
+                print("❌ Atualização direta do próprio worker falhou")
+                all_ok = False
+
+            if all_ok:
+                print("✅ Guarda de claimed_by respeitada no lote e na atualização direta")
+            return all_ok
+
+        except Exception as e:
+            print(f"❌ Erro no teste de status em lote: {e}")
+            return False
+        finally:
+            db_manager.disconnect()
+
+
+def test_sqlite_migrations_twice():
+    """Testa que aplicar as migrações de novo no SQLite não altera o esquema"""
+    print("\n🧱 Testando migrações repetidas no SQLite...")
+
+    from db_sqlite import SQLiteDatabaseManager
+    from migrations import SQLITE_MIGRATIONS
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'fila.sqlite3')
+        latest = max(version for version, _, _ in SQLITE_MIGRATIONS)
+
+        # Segunda execução em outro gerenciador, como num novo processo; a
+        # terceira reaplica os comandos da última versão sobre o esquema já
+        # migrado (como após uma falha entre o DDL e o registro da versão)
+        for run in (1, 2, 3):
+            db_manager = SQLiteDatabaseManager()
+            db_manager.path = path
+            try:
+                if not db_manager.connect():
+                    print(f"❌ Falha ao abrir banco na execução {run}")
+                    return False
+                if run == 3:
+                    with db_manager.cursor() as cursor:
+                        cursor.execute("DELETE FROM schema_version WHERE version = %s", (latest,))
+                if not db_manager.migrate():
+                    print(f"❌ Falha ao migrar na execução {run}")
+                    return False
+
+                with db_manager.cursor() as cursor:
+                    cursor.execute("SELECT COUNT(*), COUNT(DISTINCT version) FROM schema_version")
+                    registered, distinct = cursor.fetchone()
+                version = db_manager.get_schema_version()
+            finally:
+                db_manager.disconnect()
+
+            if version != latest or registered != distinct:
+                print(f"❌ Execução {run}: versão {version} (esperada {latest}), "
+                      f"{registered} registros para {distinct} versões")
+                return False
+            print(f"✅ Execução {run}: esquema na versão {version}")
+
+    return True
+
+
+def test_multipart_stream():
+    """Testa o corpo multipart do engine http (lido em blocos, com tamanho conhecido)"""
+    print("\n📤 Testando corpo multipart do envio HTTP...")
+
+    from email.parser import BytesParser
+    from email.policy import HTTP
+    from http_worker import MultipartStream
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, 'relatório "final".pdf')
+        content = os.urandom(10000)
+        with open(file_path, 'wb') as f:
+            f.write(content)
+
+        fields = {'titulo': 'Relatório final', '_token': 'abc123'}
+        stream = MultipartStream(fields, 'arquivo', file_path)
+        try:
+            chunks = []
+            while True:
+                chunk = stream.read(777)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        finally:
+            stream.close()
+
+    body = b''.join(chunks)
+    if len(body) != len(stream):
+        print(f"❌ Corpo com {len(body)} bytes, Content-Length {len(stream)}")
+        return False
+    print(f"✅ Content-Length igual ao corpo lido ({len(body)} bytes)")
+
+    message = BytesParser(policy=HTTP).parsebytes(
+        f"Content-Type: {stream.content_type}\r\n\r\n".encode('utf-8') + body
+    )
+    parts = {part.get_param('name', header='content-disposition'): part for part in message.iter_parts()}
+
+    all_ok = True
+    for name, value in fields.items():
+        # Campos de texto vão em UTF-8, sem charset na parte
+        if name not in parts or parts[name].get_payload(decode=True).decode('utf-8') != value:
+            print(f"❌ Campo {name} ausente ou alterado")
+            all_ok = False
+    if 'arquivo' not in parts or parts['arquivo'].get_payload(decode=True) != content:
+        print("❌ Conteúdo do arquivo alterado no corpo")
+        all_ok = False
+    elif parts['arquivo'].get_content_type() != 'application/pdf':
+        print(f"❌ Tipo do arquivo: {parts['arquivo'].get_content_type()}")
+        all_ok = False
+
+    if all_ok:
+        print("✅ Campos e arquivo íntegros no corpo multipart")
+    return all_ok
+
+
 def run_all_tests():
     """Executa todos os testes"""
     print("""
@@ -274,6 +484,10 @@ def run_all_tests():
         ("Configurações", test_configuration_validation),
         ("Utilitários de Arquivo", test_file_utilities),
         ("Monitor de Performance", test_performance_monitor),
+        ("Resposta de Salvamento", test_save_response_parsing),
+        ("Status em Lote", test_status_batch_guard),
+        ("Migrações SQLite", test_sqlite_migrations_twice),
+        ("Corpo Multipart HTTP", test_multipart_stream),
         ("Banco de Dados", test_database_connection),  # Por último pois pode falhar se DB não configurado
     ]
 
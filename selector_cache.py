@@ -0,0 +1,126 @@
+"""
+Cache de resolução de seletores por (site, fluxo, papel)
+
+Login, input de arquivo e botão de envio são encontrados percorrendo listas
+de seletores candidatos, com uma ida e volta ao navegador (`is_visible`)
+por candidato. O SelectorCache guarda o seletor vencedor de cada papel e o
+coloca na frente da lista: no caso comum a resolução custa uma única
+verificação. Se o vencedor guardado falha, ele é rebaixado (removido) e o
+próximo vencedor da lista toma o lugar.
+
+A persistência usa o mesmo esquema do cache de navegação (JSON
+compartilhado, gravação atômica) e só grava quando o vencedor muda. A
+latência de resolução por papel é acumulada para as estatísticas do worker.
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import Dict, Any, List, Optional
+
+from navigation_cache import load_json, save_json_atomic
+
+logger = logging.getLogger(__name__)
+
+
+class SelectorCache:
+    """Seletores vencedores aprendidos, com latência de resolução por papel"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.getenv('SELECTOR_CACHE_PATH', './selector_cache.json')
+        self.enabled = os.getenv('SELECTOR_CACHE', 'true').lower() == 'true'
+        self.winners: Dict[str, str] = load_json(self.path) if self.enabled else {}
+        self.lock = threading.Lock()
+        self.latency: Dict[str, Dict[str, Any]] = {}
+
+    @staticmethod
+    def key(site: str, flow_name: str, role: str) -> str:
+        return f"{site.rstrip('/')}|{flow_name}|{role}"
+
+    def candidates(self, site: str, flow_name: str, role: str, selectors: List[str]) -> List[str]:
+        """Candidatos com o vencedor guardado na frente"""
+        winner = self.winners.get(self.key(site, flow_name, role))
+        if winner in selectors:
+            return [winner] + [selector for selector in selectors if selector != winner]
+        return list(selectors)
+
+    def cached(self, site: str, flow_name: str, role: str) -> Optional[str]:
+        return self.winners.get(self.key(site, flow_name, role))
+
+    def resolved(self, site: str, flow_name: str, role: str, selector: Optional[str],
+                 elapsed: float, checks: int):
+        """Registra o resultado de uma resolução (selector None = nenhum candidato serviu)"""
+        key = self.key(site, flow_name, role)
+        cached = self.winners.get(key)
+
+        with self.lock:
+            metrics = self.latency.setdefault(role, {
+                'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'checks': 0, 'cache_hits': 0, 'demotions': 0
+            })
+            metrics['count'] += 1
+            metrics['total_ms'] += elapsed * 1000
+            metrics['max_ms'] = max(metrics['max_ms'], elapsed * 1000)
+            metrics['checks'] += checks
+            if cached and selector == cached:
+                metrics['cache_hits'] += 1
+            elif cached:
+                metrics['demotions'] += 1
+
+            if not self.enabled or selector == cached:
+                return
+
+            # Vencedor novo (ou nenhum): rebaixa o anterior e persiste
+            winners = load_json(self.path)
+            if selector:
+                winners[key] = selector
+            else:
+                winners.pop(key, None)
+            if save_json_atomic(self.path, winners):
+                self.winners = winners
+
+        if cached:
+            logger.info(f"Seletor '{cached}' ({role}) falhou e foi rebaixado; novo: {selector}")
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Latência média/máxima e acertos por papel"""
+        with self.lock:
+            return {
+                role: {
+                    'count': metrics['count'],
+                    'avg_ms': round(metrics['total_ms'] / metrics['count'], 1),
+                    'max_ms': round(metrics['max_ms'], 1),
+                    'checks_per_resolution': round(metrics['checks'] / metrics['count'], 2),
+                    'cache_hits': metrics['cache_hits'],
+                    'demotions': metrics['demotions']
+                }
+                for role, metrics in self.latency.items()
+            }
+
+
+_selector_cache: Optional[SelectorCache] = None
+
+
+def get_selector_cache() -> SelectorCache:
+    """Cache de seletores do processo (carregado do disco na primeira chamada)"""
+    global _selector_cache
+    if _selector_cache is None:
+        _selector_cache = SelectorCache()
+    return _selector_cache
+
+
+class SelectorTimer:
+    """Mede uma resolução: conta verificações e registra no cache ao final"""
+
+    def __init__(self, cache: SelectorCache, site: str, flow_name: str, role: str):
+        self.cache = cache
+        self.site = site
+        self.flow_name = flow_name
+        self.role = role
+        self.started = time.perf_counter()
+        self.checks = 0
+
+    def done(self, selector: Optional[str]) -> Optional[str]:
+        self.cache.resolved(self.site, self.flow_name, self.role, selector,
+                            time.perf_counter() - self.started, self.checks)
+        return selector
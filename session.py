@@ -0,0 +1,153 @@
+"""
+Sessão autenticada compartilhada entre o controller e os workers
+
+O controller faz o login uma única vez, exporta o storage_state do
+Playwright (cookies + localStorage) e o publica num dicionário do
+multiprocessing.Manager. Cada worker cria seu contexto com
+`new_context(storage_state=...)`, então N workers não disparam N logins
+simultâneos no site. Quando um worker percebe que a sessão expirou, pede
+uma renovação pela fila do Manager; o controller atende no seu loop de
+espera, faz um novo login e publica a nova versão para todos.
+"""
+
+import time
+import queue
+import logging
+from typing import Dict, Any, Optional, Tuple
+
+from playwright.sync_api import sync_playwright
+
+from flows.base_flow import BaseFlow
+
+logger = logging.getLogger(__name__)
+
+
+# Configuração do Chromium comum ao controller e aos workers
+BROWSER_LAUNCH_ARGS = [
+    '--no-sandbox',
+    '--disable-dev-shm-usage',
+    '--disable-blink-features=AutomationControlled',
+    '--disable-features=VizDisplayCompositor'
+]
+
+CONTEXT_OPTIONS = {
+    'viewport': {'width': 1920, 'height': 1080},
+    'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+}
+
+
+class _LoginFlow(BaseFlow):
+    """Fluxo usado apenas para autenticar (reaproveita BaseFlow.login)"""
+
+    def navigate_to_upload_page(self) -> bool:
+        return False
+
+    def upload_file(self, file_path: str) -> bool:
+        return False
+
+
+def login_storage_state() -> Optional[Dict[str, Any]]:
+    """Faz login num navegador temporário e retorna o storage_state da sessão"""
+    playwright = sync_playwright().start()
+    browser = None
+
+    try:
+        browser = playwright.chromium.launch(headless=True, args=BROWSER_LAUNCH_ARGS)
+        context = browser.new_context(**CONTEXT_OPTIONS)
+        flow = _LoginFlow(browser, context.new_page())
+
+        if not flow.login():
+            return None
+
+        return context.storage_state()
+
+    except Exception as e:
+        logger.error(f"Erro ao exportar sessão autenticada: {e}")
+        return None
+    finally:
+        if browser:
+            browser.close()
+        playwright.stop()
+
+
+class SharedSession:
+    """storage_state publicado pelo controller e lido pelos workers
+
+    Contém apenas proxies do Manager, então pode ser enviado aos processos
+    workers como argumento. `version` cresce a cada novo login; um pedido de
+    renovação informa a versão que o worker estava usando, e pedidos de
+    vários workers para a mesma versão resultam num único login.
+    """
+
+    def __init__(self, manager):
+        self.state = manager.dict(storage_state=None, version=0, failed_version=-1)
+        self.requests = manager.Queue()
+
+    def current(self) -> Tuple[int, Optional[Dict[str, Any]]]:
+        """Versão e storage_state atuais"""
+        return self.state['version'], self.state['storage_state']
+
+    def publish(self, storage_state: Optional[Dict[str, Any]]):
+        """Publica uma nova sessão (controller)"""
+        version = self.state['version']
+        if storage_state is None:
+            self.state['failed_version'] = version
+        else:
+            self.state.update(storage_state=storage_state, version=version + 1)
+
+    def refresh(self) -> bool:
+        """Faz um novo login e publica o resultado (controller)"""
+        logger.info("Sessão: realizando login centralizado")
+        storage_state = login_storage_state()
+        self.publish(storage_state)
+
+        if storage_state is None:
+            logger.error("Sessão: falha no login centralizado, workers farão login próprio")
+            return False
+
+        logger.info(f"Sessão: versão {self.state['version']} publicada para os workers")
+        return True
+
+    def service_requests(self) -> int:
+        """Atende os pedidos de renovação pendentes (chamado no loop do controller)
+
+        Retorna quantos pedidos foram atendidos.
+        """
+        stale = False
+        served = 0
+
+        while True:
+            try:
+                worker_id, version = self.requests.get_nowait()
+            except queue.Empty:
+                break
+            served += 1
+            logger.info(f"Sessão: worker {worker_id} informou sessão expirada (versão {version})")
+            if version >= self.state['version']:
+                stale = True
+
+        if stale:
+            self.refresh()
+        return served
+
+    def request_refresh(self, worker_id: int, version: int,
+                        timeout: float = 60.0) -> Optional[Tuple[int, Dict[str, Any]]]:
+        """Pede ao controller uma sessão mais nova que `version` e aguarda (worker)
+
+        Retorna (versão, storage_state) ou None se o login centralizado falhou
+        ou não respondeu a tempo.
+        """
+        self.requests.put((worker_id, version))
+        deadline = time.monotonic() + timeout
+
+        while time.monotonic() < deadline:
+            current_version, storage_state = self.current()
+            if current_version > version:
+                return current_version, storage_state
+            if self.state['failed_version'] >= version:
+                return None
+            time.sleep(0.5)
+
+        logger.warning(f"Worker {worker_id}: controller não renovou a sessão em {timeout:.0f}s")
+        return None
+
@@ -80,7 +80,7 @@ def test_setup():
     try:
         import playwright
         import mysql.connector
-        import pandas
+        import openpyxl
         from dotenv import load_dotenv
         print("✅ Módulos Python OK")
     except ImportError as e:
@@ -4,15 +4,21 @@ Teste de preenchimento automático do formulário de solicitação
 """
 
 import os
-import time
 from dotenv import load_dotenv
 from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeoutError
 from datetime import datetime
 from pathlib import Path
+from fnmatch import fnmatch
+
+from flows.flow_logic import parse_save_response
+from flows.ged import GedFlow
 
 # Carrega configurações
 load_dotenv()
 
+# Resultado do salvamento na tela: mensagens ou o botão OK do alerta
+RESULT_INDICATORS = 'button.confirm, .alert-success, .alert-danger, .success, .error'
+
 def get_document_type_value_from_folder(folder_name: str) -> str:
     """Mapeia nome da pasta para valor numérico no sistema"""
     mapping = {
@@ -141,7 +147,8 @@ def teste_preenchimento_formulario(headless=False, slow_mo=1000):
                     # PASSO 3: Abrir modal Nova Solicitação
                     print(f"\n➕ PASSO 3: Abrindo modal Nova Solicitação para documento {idx}...")
                     page.locator('#btnNovaSolicitacao').click()
-                    time.sleep(2)  # Aguarda modal abrir
+                    # Aguarda o modal abrir (campo título visível)
+                    page.locator('input[name="titulo"], #titulo').first.wait_for(state="visible", timeout=10000)
                     print("✅ Modal aberto!")
 
                     # PASSO 4: Preencher formulário
@@ -266,50 +273,48 @@ def teste_preenchimento_formulario(headless=False, slow_mo=1000):
 
                         # Aguarda possível navegação ou mudança na página
                         try:
-                            # Clica e aguarda resposta
-                            with page.expect_response(lambda response: response.status in [200, 302], timeout=30000):
+                            # Clica e aguarda a resposta do POST de salvamento do GED
+                            with page.expect_response(
+                                lambda response: response.request.method == "POST" and any(
+                                    fnmatch(response.url, pattern) for pattern in GedFlow.SAVE_URL_PATTERNS
+                                ),
+                                timeout=30000
+                            ) as response_info:
                                 salvar_btn.click()
 
                             print("   ✅ Botão Salvar clicado!")
 
-                            # Aguarda um pouco para ver o resultado
-                            time.sleep(3)
-
-                            # Verifica se há mensagens de sucesso ou erro
-                            success_indicators = [
-                                '.alert-success',
-                                '.success',
-                                'text="Sucesso"',
-                                'text="Salvo"',
-                                'text="Criado"'
-                            ]
-
-                            error_indicators = [
-                                '.alert-danger',
-                                '.error',
-                                'text="Erro"',
-                                'text="Falha"'
-                            ]
-
-                            # Verifica sucesso
-                            documento_salvo = False
-                            for indicator in success_indicators:
-                                if page.locator(indicator).count() > 0:
-                                    success_msg = page.locator(indicator).text_content()
-                                    print(f"   🎉 Sucesso detectado: {success_msg}")
-                                    documento_salvo = True
-                                    break
-
-                            # Verifica erro
+                            # O resultado vem da própria resposta (status, JSON ou redirect)
+                            response = response_info.value
+                            body = None
+                            if 'json' in response.headers.get('content-type', '') and not 300 <= response.status < 400:
+                                body = response.text()
+                            resultado = parse_save_response(response.status, response.headers, body)
+                            print(f"   📨 Resposta do servidor: {resultado['detail']} ({response.url})")
+
+                            if resultado['outcome'] == 'error':
+                                raise Exception(f"Erro ao salvar: {resultado['detail']}")
+
+                            documento_salvo = resultado['outcome'] == 'success'
+                            if resultado['document_id']:
+                                print(f"   🆔 ID do documento no GED: {resultado['document_id']}")
+
+                            # Resposta inconclusiva: resultado pela mensagem na tela
                             if not documento_salvo:
-                                for indicator in error_indicators:
+                                try:
+                                    page.locator(RESULT_INDICATORS).first.wait_for(state="visible", timeout=5000)
+                                except PlaywrightTimeoutError:
+                                    pass
+
+                                error_msg = None
+                                for indicator in ['.alert-danger', '.error', 'text="Erro"', 'text="Falha"']:
                                     if page.locator(indicator).count() > 0:
-                                        error_msg = page.locator(indicator).text_content()
-                                        print(f"   ❌ Erro detectado: {error_msg}")
-                                        raise Exception(f"Erro ao salvar: {error_msg}")
+                                        error_msg = page.locator(indicator).first.text_content()
+                                        break
+                                if error_msg:
+                                    print(f"   ❌ Erro detectado: {error_msg}")
+                                    raise Exception(f"Erro ao salvar: {error_msg}")
 
-                            # Se não detectou nem sucesso nem erro, considera sucesso
-                            if not documento_salvo:
                                 print("   ✅ Formulário enviado (sem indicador específico)")
                                 documento_salvo = True
 
@@ -323,7 +328,10 @@ def teste_preenchimento_formulario(headless=False, slow_mo=1000):
                                             ok_button.highlight()
                                         ok_button.click()
                                         print("   ✅ Botão OK clicado!")
-                                        time.sleep(1)
+                                        try:
+                                            ok_button.first.wait_for(state="hidden", timeout=5000)
+                                        except PlaywrightTimeoutError:
+                                            pass
                                     else:
                                         # Tenta outras variações do botão OK
                                         ok_alternatives = [
@@ -346,14 +354,20 @@ def teste_preenchimento_formulario(headless=False, slow_mo=1000):
                                 documentos_processados += 1
                                 print(f"   🎉 Documento {idx} processado com sucesso!")
 
-                                # Aguarda um pouco antes do próximo
-                                time.sleep(2)
+                                # Aguarda o modal fechar antes do próximo
+                                try:
+                                    salvar_btn.wait_for(state="hidden", timeout=5000)
+                                except PlaywrightTimeoutError:
+                                    pass
 
                         except PlaywrightTimeoutError:
                             print("   ⚠️  Timeout ao aguardar resposta do servidor")
                             # Tenta clicar mesmo assim
                             salvar_btn.click()
-                            time.sleep(3)
+                            try:
+                                page.locator(RESULT_INDICATORS).first.wait_for(state="visible", timeout=5000)
+                            except PlaywrightTimeoutError:
+                                pass
                             print("   ✅ Clique executado (sem aguardar resposta)")
 
                             # Tenta clicar no botão OK mesmo com timeout
@@ -362,7 +376,7 @@ def teste_preenchimento_formulario(headless=False, slow_mo=1000):
                                 if ok_button.count() > 0:
                                     ok_button.click()
                                     print("   ✅ Botão OK clicado (timeout)!")
-                                    time.sleep(1)
+                                    ok_button.first.wait_for(state="hidden", timeout=5000)
                             except:
                                 pass
 
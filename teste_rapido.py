@@ -29,10 +29,10 @@ def teste_imports():
         return False
 
     try:
-        import pandas
-        print("✅ Pandas")
+        import openpyxl
+        print("✅ OpenPyXL")
     except ImportError:
-        print("❌ Pandas não encontrado")
+        print("❌ OpenPyXL não encontrado")
         return False
 
     print("✅ Todos os imports OK\n")
@@ -43,6 +43,28 @@ class RetryHandler:
         raise last_exception
 
 
+class RateLimiter:
+    """Intervalo mínimo entre operações (ritmo configurável no lugar de pausas fixas)
+
+    `wait()` dorme só o que falta para completar o intervalo desde a última
+    chamada; com intervalo 0 não pausa nunca.
+    """
+
+    def __init__(self, min_interval: float = 0.0):
+        self.min_interval = max(0.0, min_interval)
+        self.last_call: Optional[float] = None
+
+    def wait(self):
+        """Aguarda o intervalo restante e registra a operação"""
+        now = time.monotonic()
+        if self.last_call is not None and self.min_interval > 0:
+            remaining = self.min_interval - (now - self.last_call)
+            if remaining > 0:
+                time.sleep(remaining)
+                now = time.monotonic()
+        self.last_call = now
+
+
 class FileUtils:
     """Utilitários para manipulação de arquivos"""
 
@@ -52,13 +74,18 @@ class FileUtils:
         try:
             hash_md5 = hashlib.md5()
             with open(file_path, "rb") as f:
-                for chunk in iter(lambda: f.read(4096), b""):
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
                     hash_md5.update(chunk)
             return hash_md5.hexdigest()
         except Exception as e:
             logger.warning(f"Erro ao calcular hash do arquivo {file_path}: {e}")
             return None
 
+    @staticmethod
+    def get_path_hash(file_path: str) -> str:
+        """Calcula SHA-256 do caminho absoluto (mesmo valor de SHA2(caminho, 256) no banco)"""
+        return hashlib.sha256(file_path.encode('utf-8')).hexdigest()
+
     @staticmethod
     def get_file_size(file_path: str) -> int:
         """Retorna tamanho do arquivo em bytes"""
@@ -70,7 +97,7 @@ class FileUtils:
     @staticmethod
     def is_valid_document_file(file_path: str) -> bool:
         """Verifica se é um arquivo de documento válido"""
-        valid_extensions = {'.pdf', '.jpg', '.jpeg', '.png', '.tiff', '.tif', '.dcm'}
+        valid_extensions = {'.pdf', '.jpg', '.jpeg', '.png', '.tiff', '.tif', '.dcm', '.doc', '.docx'}
         file_extension = Path(file_path).suffix.lower()
 
         if file_extension not in valid_extensions:
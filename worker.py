@@ -3,38 +3,189 @@ Worker para processamento individual de arquivos
 """
 
 import os
+import signal
 import logging
 import time
-from typing import Dict, Any, Optional
+import threading
+from typing import Dict, Any, Optional, List, Set
 from pathlib import Path
-from playwright.sync_api import sync_playwright, Browser, BrowserContext
-from db import DatabaseManager
-from flows import AtestadosFlow, ProntuariosFlow, ExamesFlow
+from playwright.sync_api import sync_playwright, Playwright, Browser, BrowserContext, Page
+from db import get_db_manager, StatusBuffer
+from flows import AtestadosFlow, ProntuariosFlow, ExamesFlow, GedFlow, GED_DOCUMENT_TYPES
+from session import SharedSession, BROWSER_LAUNCH_ARGS, CONTEXT_OPTIONS
+from resource_policy import ResourceInterceptor
+from utils import RateLimiter
+from navigation_cache import get_navigation_cache
+from selector_cache import get_selector_cache
 
 logger = logging.getLogger(__name__)
 
 
+def descendant_rss_bytes(pid: Optional[int] = None) -> int:
+    """RSS somado dos processos descendentes de `pid` (padrão: o próprio processo)
+
+    No worker isso é o driver do Playwright mais o Chromium e seus
+    renderers. Lê /proc; fora do Linux retorna 0.
+    """
+    pid = pid or os.getpid()
+    children: Dict[int, List[int]] = {}
+
+    try:
+        entries = os.listdir('/proc')
+    except OSError:
+        return 0
+
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                stat = f.read()
+            # O nome do processo (campo 2) pode conter espaços: o ppid vem depois do ')'
+            ppid = int(stat.rsplit(')', 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    total = 0
+    pending = list(children.get(pid, []))
+    while pending:
+        child = pending.pop()
+        pending.extend(children.get(child, []))
+        try:
+            with open(f'/proc/{child}/statm') as f:
+                total += int(f.read().split()[1]) * page_size
+        except (OSError, ValueError, IndexError):
+            continue
+
+    return total
+
+
+class LeaseHeartbeat(threading.Thread):
+    """Thread que renova o lease dos arquivos reservados enquanto o fluxo roda
+
+    Retira conexões do mesmo pool do processo usado pelo worker (uma por
+    renovação, devolvida logo em seguida); o pool é dimensionado em setup()
+    para comportar esta thread (ver db_connections_needed). Com gravação de
+    status em lote, também renova os arquivos já finalizados cujo status
+    ainda não foi gravado.
+    """
+
+    def __init__(self, worker_id: int, lease_seconds: int, status_buffer: Optional[StatusBuffer] = None):
+        super().__init__(name=f"lease-heartbeat-{worker_id}", daemon=True)
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.interval = max(1, lease_seconds // 3)
+        self.db_manager = get_db_manager()
+        self.status_buffer = status_buffer
+        self.file_ids: Set[int] = set()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+
+    def track(self, file_ids: List[int]):
+        """Passa a renovar o lease dos arquivos informados"""
+        with self.lock:
+            self.file_ids.update(file_ids)
+
+    def release(self, file_id: int):
+        """Para de renovar o lease de um arquivo já finalizado"""
+        with self.lock:
+            self.file_ids.discard(file_id)
+
+    def stop(self):
+        """Encerra a thread de heartbeat"""
+        self.stop_event.set()
+
+    def run(self):
+        if not self.db_manager.connect():
+            logger.error(f"Worker {self.worker_id}: Heartbeat sem conexão com banco, leases não serão renovados")
+            return
+
+        try:
+            while not self.stop_event.wait(self.interval):
+                with self.lock:
+                    file_ids = set(self.file_ids)
+                if self.status_buffer:
+                    file_ids.update(self.status_buffer.pending_ids())
+
+                if file_ids:
+                    self.db_manager.extend_lease(self.worker_id, list(file_ids), self.lease_seconds)
+        finally:
+            self.db_manager.disconnect()
+
+
 class DocumentWorker:
     """Worker responsável por processar arquivos individuais"""
 
-    def __init__(self, worker_id: int):
+    def __init__(self, worker_id: int, shared_session: Optional[SharedSession] = None,
+                 browser_endpoint: Optional[str] = None):
         self.worker_id = worker_id
-        self.db_manager = DatabaseManager()
+        self.shared_session = shared_session
+        self.browser_endpoint = browser_endpoint
+        self.session_version = 0
+        self.session_preloaded = False
+        self.session_refresh_timeout = float(os.getenv('SESSION_REFRESH_TIMEOUT', '60'))
+        self.base_url = os.getenv('SITE_BASE_URL', 'https://example.com')
+        self.db_manager = get_db_manager()
+        self.playwright: Optional[Playwright] = None
         self.browser: Optional[Browser] = None
         self.context: Optional[BrowserContext] = None
+        self.page: Optional[Page] = None
+        self.resource_interceptor = ResourceInterceptor()
         self.retry_count = 3
         self.retry_delay_base = 2  # segundos
+        self.claim_batch_size = int(os.getenv('CLAIM_BATCH_SIZE', '1'))
+        self.lease_seconds = int(os.getenv('LEASE_SECONDS', '300'))
+        self.status_buffer_rows = int(os.getenv('STATUS_BUFFER_ROWS', '0'))
+        self.status_flush_ms = int(os.getenv('STATUS_FLUSH_MS', '500'))
+        self.heartbeat: Optional[LeaseHeartbeat] = None
+
+        # Intervalo mínimo entre o início de dois arquivos (0 = sem pausa)
+        self.rate_limiter = RateLimiter(int(os.getenv('FILE_INTERVAL_MS', '0')) / 1000)
+
+        # Reciclagem do navegador entre arquivos (0 desliga cada critério)
+        self.recycle_after_files = int(os.getenv('BROWSER_RECYCLE_FILES', '0'))
+        self.recycle_after_minutes = float(os.getenv('BROWSER_RECYCLE_MINUTES', '0'))
+        self.recycle_rss_mb = int(os.getenv('BROWSER_RECYCLE_RSS_MB', '0'))
+        # Intervalo mínimo entre duas medições do RSS (cada uma percorre o /proc)
+        self.rss_check_seconds = float(os.getenv('BROWSER_RSS_CHECK_SECONDS', '10'))
+        self.browser_started_at = 0.0
+        self.files_since_launch = 0
+        self.rss_checked_at = 0.0
+        self.browser_rss_bytes = 0
+
+    def db_connections_needed(self) -> int:
+        """Conexões simultâneas que o worker pode usar: loop principal, heartbeat e flush do StatusBuffer"""
+        return 3
 
     def setup(self) -> bool:
         """Inicializa o worker"""
         try:
             logger.info(f"Worker {self.worker_id}: Iniciando setup")
 
-            # Conecta ao banco
+            # Conecta ao banco (o pool do processo nasce aqui, com folga para
+            # todas as threads que o compartilham)
+            needed = self.db_connections_needed()
+            if self.db_manager.pool_size < needed:
+                logger.info(f"Worker {self.worker_id}: DB_POOL_SIZE={self.db_manager.pool_size} insuficiente, "
+                            f"usando {needed} conexões")
+                self.db_manager.pool_size = needed
             if not self.db_manager.connect():
                 logger.error(f"Worker {self.worker_id}: Falha ao conectar com banco")
                 return False
 
+            # Gravação de status em lote (opcional, STATUS_BUFFER_ROWS > 0)
+            status_buffer = None
+            if self.status_buffer_rows > 0:
+                status_buffer = self.db_manager.enable_status_buffer(
+                    self.worker_id, self.status_buffer_rows, self.status_flush_ms
+                )
+
+            # Inicia renovação periódica dos leases
+            self.heartbeat = LeaseHeartbeat(self.worker_id, self.lease_seconds, status_buffer)
+            self.heartbeat.start()
+
             logger.info(f"Worker {self.worker_id}: Setup concluído")
             return True
 
@@ -45,10 +196,14 @@ class DocumentWorker:
     def cleanup(self):
         """Limpa recursos do worker"""
         try:
-            if self.context:
-                self.context.close()
-            if self.browser:
-                self.browser.close()
+            # Grava os status pendentes antes de parar de renovar os leases
+            self.db_manager.disable_status_buffer()
+            if self.heartbeat:
+                self.heartbeat.stop()
+            self.close_browser()
+            if self.playwright:
+                self.playwright.stop()
+                self.playwright = None
             if self.db_manager:
                 self.db_manager.disconnect()
 
@@ -58,24 +213,29 @@ class DocumentWorker:
             logger.warning(f"Worker {self.worker_id}: Erro no cleanup: {e}")
 
     def create_browser(self) -> bool:
-        """Cria instância do navegador"""
+        """Cria instância do navegador (ou conecta ao Chromium compartilhado do controller)"""
         try:
-            playwright = sync_playwright().start()
-
-            self.browser = playwright.chromium.launch(
-                headless=True,
-                args=[
-                    '--no-sandbox',
-                    '--disable-dev-shm-usage',
-                    '--disable-blink-features=AutomationControlled',
-                    '--disable-features=VizDisplayCompositor'
-                ]
-            )
-
-            self.context = self.browser.new_context(
-                viewport={'width': 1920, 'height': 1080},
-                user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-            )
+            # Um driver do Playwright por worker, parado no cleanup
+            if self.playwright is None:
+                self.playwright = sync_playwright().start()
+
+            self.browser = None
+            if self.browser_endpoint:
+                try:
+                    self.browser = self.playwright.chromium.connect_over_cdp(self.browser_endpoint)
+                except Exception as e:
+                    # Chromium compartilhado caiu ou endpoint antigo: segue com um navegador próprio
+                    logger.warning(f"Worker {self.worker_id}: Falha ao conectar ao navegador compartilhado "
+                                   f"({self.browser_endpoint}), iniciando um local: {e}")
+
+            if self.browser is None:
+                self.browser = self.playwright.chromium.launch(
+                    headless=True,
+                    args=BROWSER_LAUNCH_ARGS
+                )
+
+            self.context = self.new_context()
+            self.reset_browser_usage()
 
             return True
 
@@ -83,8 +243,133 @@ class DocumentWorker:
             logger.error(f"Worker {self.worker_id}: Erro ao criar browser: {e}")
             return False
 
-    def get_flow_handler(self, tipo_arquivo: str):
-        """Retorna o handler apropriado para o tipo de arquivo"""
+    def new_context(self) -> BrowserContext:
+        """Cria o contexto do navegador, já autenticado se o controller publicou uma sessão"""
+        storage_state = None
+        if self.shared_session:
+            self.session_version, storage_state = self.shared_session.current()
+
+        self.session_preloaded = storage_state is not None
+        context = self.browser.new_context(storage_state=storage_state, **CONTEXT_OPTIONS)
+        self.resource_interceptor.install(context)
+        return context
+
+    def refresh_session(self) -> Optional[Page]:
+        """Troca a sessão expirada pela renovada no controller
+
+        Retorna a nova página da sessão, ou None se o controller não conseguiu
+        renovar (o fluxo então faz login por conta própria).
+        """
+        logger.info(f"Worker {self.worker_id}: Sessão expirada, pedindo renovação ao controller")
+        renewed = self.shared_session.request_refresh(
+            self.worker_id, self.session_version, self.session_refresh_timeout
+        )
+        if renewed is None:
+            return None
+
+        try:
+            if self.page:
+                self.page.close()
+            self.context.close()
+        except Exception:
+            pass
+        self.page = None
+
+        self.context = self.new_context()
+        return self.get_page()
+
+    def close_browser(self):
+        """Fecha página, contexto e navegador (a sessão precisará de novo login)"""
+        try:
+            if self.page:
+                self.page.close()
+            if self.context:
+                self.context.close()
+            if self.browser:
+                self.browser.close()
+        except Exception:
+            pass
+        self.page = None
+        self.context = None
+        self.browser = None
+
+    def recycle_reason(self, rss_bytes: int) -> Optional[str]:
+        """Motivo para reciclar o navegador agora, ou None se ainda não é preciso"""
+        if self.recycle_after_files > 0 and self.files_since_launch >= self.recycle_after_files:
+            return f"{self.files_since_launch} arquivos processados"
+
+        if self.recycle_after_minutes > 0:
+            minutes = (time.monotonic() - self.browser_started_at) / 60
+            if minutes >= self.recycle_after_minutes:
+                return f"{minutes:.1f} minutos de uso"
+
+        if self.recycle_rss_mb > 0 and rss_bytes >= self.recycle_rss_mb * 1024 * 1024:
+            return f"RSS de {rss_bytes / (1024 * 1024):.0f} MB"
+
+        return None
+
+    def reset_browser_usage(self):
+        """Zera a contagem de uso ao lançar um navegador novo"""
+        self.browser_started_at = time.monotonic()
+        self.files_since_launch = 0
+        self.rss_checked_at = 0.0
+        self.browser_rss_bytes = 0
+
+    def record_browser_usage(self, stats: Dict[str, Any]) -> Optional[str]:
+        """Conta mais um arquivo no navegador atual, atualiza o RSS em `stats`
+        e retorna o motivo para reciclar (recycle_reason) ou None
+
+        O RSS é medido no máximo a cada BROWSER_RSS_CHECK_SECONDS (a leitura
+        percorre o /proc); entre as medições vale a última. Com Chromium
+        compartilhado (CDP) o processo não é descendente do worker, então o
+        critério de RSS não se aplica.
+        """
+        self.files_since_launch += 1
+        now = time.monotonic()
+        if now - self.rss_checked_at >= self.rss_check_seconds:
+            self.rss_checked_at = now
+            self.browser_rss_bytes = descendant_rss_bytes()
+            rss_mb = round(self.browser_rss_bytes / (1024 * 1024), 1)
+            stats['rss_mb'] = rss_mb
+            stats['peak_rss_mb'] = max(stats['peak_rss_mb'], rss_mb)
+        return self.recycle_reason(self.browser_rss_bytes)
+
+    def maybe_recycle_browser(self, stats: Dict[str, Any]):
+        """Fecha o navegador entre arquivos quando a política de reciclagem manda
+
+        O próximo arquivo lança um navegador novo (process_file cria sob
+        demanda).
+        """
+        if not self.browser:
+            return
+
+        reason = self.record_browser_usage(stats)
+        if reason:
+            logger.info(f"Worker {self.worker_id}: Reciclando navegador ({reason})")
+            self.close_browser()
+            stats['recycles'] += 1
+
+    def get_page(self) -> Page:
+        """Página da sessão do worker, reaproveitada entre arquivos
+
+        O login feito nela vale para todos os arquivos seguintes enquanto
+        a sessão do site não expirar.
+        """
+        if self.page is None or self.page.is_closed():
+            self.page = self.context.new_page()
+
+            # Sessão importada: abre o site para o fluxo saber se ela ainda vale
+            if self.session_preloaded:
+                self.page.goto(self.base_url, wait_until="domcontentloaded")
+
+        return self.page
+
+    def get_flow_class(self, tipo_arquivo: str):
+        """Retorna a classe de fluxo apropriada para o tipo de arquivo"""
+        # Pastas do GED (MAPEAMENTO_TIPOS.md)
+        if tipo_arquivo.upper() in GED_DOCUMENT_TYPES:
+            return GedFlow
+
         flow_map = {
             'atestados': AtestadosFlow,
             'prontuarios': ProntuariosFlow,
@@ -108,7 +393,14 @@ class DocumentWorker:
                 # Default para atestados se não conseguir determinar
                 flow_class = AtestadosFlow
 
-        return flow_class(self.browser)
+        return flow_class
+
+    def get_flow_handler(self, tipo_arquivo: str):
+        """Retorna o handler apropriado para o tipo de arquivo"""
+        flow_class = self.get_flow_class(tipo_arquivo)
+        refresh_session = self.refresh_session if self.shared_session else None
+        self.resource_interceptor.use(flow_class)
+        return flow_class(self.browser, self.get_page(), refresh_session)
 
     def process_file(self, file_record: Dict[str, Any]) -> Dict[str, Any]:
         """Processa um arquivo específico"""
@@ -169,28 +461,22 @@ class DocumentWorker:
 
                 if result['success']:
                     # Sucesso - atualiza banco
-                    self.db_manager.update_file_status(file_id, 'enviado')
+                    self.db_manager.update_file_status(file_id, 'enviado', documento_id=result.get('document_id'),
+                                                      worker_id=self.worker_id)
                     return result
                 else:
-                    # Falha - se não é a última tentativa, tenta novamente
-                    if attempt < self.retry_count - 1:
+                    # Falha - se não é a última tentativa e o envio pode ser repetido, tenta novamente
+                    if attempt < self.retry_count - 1 and result.get('retry', True):
                         delay = self.retry_delay_base ** (attempt + 1)  # Backoff exponencial
                         logger.warning(f"Worker {self.worker_id}: Falha na tentativa {attempt + 1}, tentando novamente em {delay}s")
                         time.sleep(delay)
 
                         # Recria browser para próxima tentativa
-                        try:
-                            if self.context:
-                                self.context.close()
-                            if self.browser:
-                                self.browser.close()
-                        except:
-                            pass
-                        self.browser = None
-                        self.context = None
+                        self.close_browser()
                     else:
                         # Última tentativa falhada - atualiza banco com erro
-                        self.db_manager.update_file_status(file_id, 'erro', result.get('error', 'Erro desconhecido'))
+                        self.db_manager.update_file_status(file_id, 'erro', result.get('error', 'Erro desconhecido'),
+                                                          worker_id=self.worker_id)
                         return result
 
             except Exception as e:
@@ -199,7 +485,7 @@ class DocumentWorker:
 
                 if attempt == self.retry_count - 1:
                     # Última tentativa - salva erro no banco
-                    self.db_manager.update_file_status(file_id, 'erro', error_msg)
+                    self.db_manager.update_file_status(file_id, 'erro', error_msg, worker_id=self.worker_id)
                     return {
                         'success': False,
                         'error': error_msg,
@@ -212,12 +498,29 @@ class DocumentWorker:
             'file_id': file_id
         }
 
+    def record_result(self, stats: Dict[str, Any], file_id: int, result: Dict[str, Any]):
+        """Soma o resultado de um arquivo às estatísticas do worker"""
+        stats['processed'] += 1
+        confirmation = result.get('confirmation')
+        if confirmation:
+            stats['confirmations'][confirmation] = stats['confirmations'].get(confirmation, 0) + 1
+        if result['success']:
+            stats['success'] += 1
+            logger.info(f"Worker {self.worker_id}: ✓ Arquivo {file_id} processado com sucesso")
+        else:
+            stats['errors'] += 1
+            logger.error(f"Worker {self.worker_id}: ✗ Falha no arquivo {file_id}: {result.get('error', 'Erro desconhecido')}")
+
     def run(self) -> Dict[str, Any]:
         """Loop principal do worker"""
         stats = {
             'processed': 0,
             'success': 0,
             'errors': 0,
+            'recycles': 0,
+            'rss_mb': 0.0,
+            'peak_rss_mb': 0.0,
+            'confirmations': {},
             'worker_id': self.worker_id
         }
 
@@ -228,32 +531,27 @@ class DocumentWorker:
             logger.info(f"Worker {self.worker_id}: Iniciando processamento")
 
             while True:
-                # Busca próximo arquivo pendente
-                pending_files = self.db_manager.get_pending_files(limit=1)
+                # Reserva o próximo lote de arquivos (lock + marcação em uma transação)
+                claimed_files = self.db_manager.claim_jobs(
+                    self.worker_id, self.claim_batch_size, self.lease_seconds
+                )
 
-                if not pending_files:
+                if not claimed_files:
                     logger.info(f"Worker {self.worker_id}: Nenhum arquivo pendente, finalizando")
                     break
 
-                file_record = pending_files[0]
-                file_id = file_record['id']
+                self.heartbeat.track([f['id'] for f in claimed_files])
 
-                # Marca como em processamento (atualiza para prevenir outros workers)
-                self.db_manager.update_file_status(file_id, 'processando')
+                for file_record in claimed_files:
+                    file_id = file_record['id']
+                    self.rate_limiter.wait()
 
-                # Processa o arquivo
-                result = self.process_with_retry(file_record)
-
-                stats['processed'] += 1
-                if result['success']:
-                    stats['success'] += 1
-                    logger.info(f"Worker {self.worker_id}: ✓ Arquivo {file_id} processado com sucesso")
-                else:
-                    stats['errors'] += 1
-                    logger.error(f"Worker {self.worker_id}: ✗ Falha no arquivo {file_id}: {result.get('error', 'Erro desconhecido')}")
+                    # Processa o arquivo
+                    result = self.process_with_retry(file_record)
+                    self.heartbeat.release(file_id)
 
-                # Pequena pausa entre arquivos
-                time.sleep(1)
+                    self.record_result(stats, file_id, result)
+                    self.maybe_recycle_browser(stats)
 
         except KeyboardInterrupt:
             logger.info(f"Worker {self.worker_id}: Interrompido pelo usuário")
@@ -262,12 +560,33 @@ class DocumentWorker:
         finally:
             self.cleanup()
 
-        logger.info(f"Worker {self.worker_id}: Finalizado - Processados: {stats['processed']}, Sucessos: {stats['success']}, Erros: {stats['errors']}")
+        stats.update(self.resource_interceptor.stats())
+        stats.update(get_navigation_cache().stats())
+        stats['selector_latency'] = get_selector_cache().stats()
+        logger.info(f"Worker {self.worker_id}: Finalizado - Processados: {stats['processed']}, Sucessos: {stats['success']}, Erros: {stats['errors']}, "
+                    f"Reciclagens: {stats['recycles']}, Pico RSS: {stats['peak_rss_mb']} MB, "
+                    f"Recursos bloqueados: {stats['blocked_requests']}")
         return stats
 
 
-def worker_main(worker_id: int) -> Dict[str, Any]:
-    """Função principal para ser chamada em processo separado"""
+def _raise_interrupt(signum, frame):
+    """SIGTERM encerra o worker pelo mesmo caminho do Ctrl+C (cleanup grava os status pendentes)"""
+    raise KeyboardInterrupt(f"Sinal {signum} recebido")
+
+
+def worker_main(worker_id: int, shared_session: Optional[SharedSession] = None,
+                options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Função principal para ser chamada em processo separado
+
+    `options` vem da linha de comando: engine ('sync', 'async' ou 'http') e
+    pages_per_worker (páginas simultâneas do engine async). Se o controller
+    iniciou navegadores compartilhados, browser_endpoints traz seus
+    endpoints CDP e o worker usa o de índice worker_id % N.
+    """
+    options = options or {}
+    endpoints = options.get('browser_endpoints') or []
+    browser_endpoint = endpoints[worker_id % len(endpoints)] if endpoints else None
+
     # Configura logging para o processo worker
     logging.basicConfig(
         level=logging.INFO,
@@ -278,5 +597,15 @@ def worker_main(worker_id: int) -> Dict[str, Any]:
         ]
     )
 
-    worker = DocumentWorker(worker_id)
+    signal.signal(signal.SIGTERM, _raise_interrupt)
+
+    if options.get('engine') == 'async':
+        from async_worker import AsyncDocumentWorker
+        worker = AsyncDocumentWorker(worker_id, shared_session, options.get('pages_per_worker', 4),
+                                     browser_endpoint)
+    elif options.get('engine') == 'http':
+        from http_worker import HttpDocumentWorker
+        worker = HttpDocumentWorker(worker_id, shared_session, browser_endpoint)
+    else:
+        worker = DocumentWorker(worker_id, shared_session, browser_endpoint)
     return worker.run()
\ No newline at end of file